@@ -20,6 +20,13 @@ import oqs
 import hashlib
 import hmac 
 import threading
+import os
+from session_routing import make_session_aware_routing
+from session_table import SessionTable
+from ephemeral_kem import EphemeralKEM, wipe
+from session_cache import SessionCache, cache_key_from_secret
+from multipath_entanglement import distribute_multipath
+from epr_pipeline import first_epr_request
 
 kem_name = "ML-KEM-768" # for kyber 768
 sign_algo = "ML-DSA-44" 
@@ -27,8 +34,8 @@ sign_algo = "ML-DSA-44"
 network = Network.get_instance()
 backend = EQSNBackend()
 results = {} 
-handshake_state = {}  
-# structure: handshake_state["Alice"]["Bob"] = {"kem": ..., "ss_enc": ..., "ss_dec": ...}
+handshake_state = SessionTable()
+# structure: handshake_state.lookup("Alice", "Bob") -> SessionRecord (session ID, derived keys, expiry, counters)
 
 # payload list
 PQC_SYN = "PQC_SYN"
@@ -39,23 +46,47 @@ PQC_SEND_CT = "PQC_SEND_CT"
 PQC_DONE = "PQC_DONE"
 
 NUM_TRIALS = 100
+SESSION_AWARE_ROUTING = False # True: route by expected setup time (EPR + handshakes) instead of hop count
+MULTIPATH_PAIRS = 0 # end-to-end pairs to distribute over node-disjoint paths after the handshake (0 = skip)
+EPR_PIPELINE_MODE = None # "gated" or "pipelined": also distribute the first end-to-end EPR pair and measure time to first EPR
+SESSION_CACHE_FILE = None # e.g. "alice_session_cache.bin" to resume sessions after a restart (key from SESSION_CACHE_SECRET env var, hex)
+RESUME_SESSIONS = bool(SESSION_CACHE_FILE) # pqc_handshake skips nodes with a live session (every trial measures full handshakes otherwise)
+
+# optional persistent session cache, reloaded at startup so the node resumes without new handshakes
+session_cache = None
+if SESSION_CACHE_FILE:
+    session_cache = SessionCache(SESSION_CACHE_FILE, cache_key_from_secret(bytes.fromhex(os.environ["SESSION_CACHE_SECRET"])))
+    print("Sessions restored from cache: ", session_cache.load_into(handshake_state))
+    session_cache.start_compaction()
 
 def run_one_trial():
-    def handshake_with_node(alice, node_id, bucket):
-        bucket[node_id] = {}
-        bucket[node_id]["kem"], bucket[node_id]["pk_hex"] = pqc_keygen(alice, node_id)
-
-        peer = network.get_host(node_id)
-        bucket[node_id]["ss_enc"] = pqc_encaps(peer, alice.host_id)
-
-        bucket[node_id]["ss_dec"] = pqc_decaps(alice, node_id, bucket[node_id]["kem"], bucket[node_id]["pk_hex"])
-
-        send_finished(alice, node_id, bucket[node_id]["ss_dec"])
-        auth_ok = verify_finished(peer, alice.host_id, bucket[node_id]["ss_enc"])
-        bucket[node_id]["auth_ok"] = auth_ok
+    def handshake_with_node(alice, node_id):
+        hs_start = time.perf_counter()
+        # the ephemeral KEM is freed (and its secret key zeroed) right after decapsulation,
+        # or when leaving this block if the handshake fails before that
+        with pqc_keygen(alice, node_id) as kem:
+            peer = network.get_host(node_id)
+            ss_enc = pqc_encaps(peer, alice.host_id)
+
+            ss_dec = pqc_decaps(alice, node_id, kem)
+        if ss_dec is None:
+            wipe(ss_enc)
+            print("-- AUTHENTICATION RESULT --")
+            print(False)
+            return
+
+        send_finished(alice, node_id, ss_dec)
+        auth_ok = verify_finished(peer, alice.host_id, ss_enc)
+        if auth_ok:
+            # only the derived session keys, expiry and measured latency outlive the handshake
+            record = handshake_state.put(alice.host_id, node_id, ss_dec, hs_latency=time.perf_counter() - hs_start)
+            if session_cache is not None:
+                session_cache.append(alice.host_id, node_id, record)
+        wipe(ss_dec)
+        wipe(ss_enc)
 
         print("-- AUTHENTICATION RESULT --")
-        print(bucket[node_id]["auth_ok"])
+        print(auth_ok)
 
     def routing_algorithm(di_graph, source, dest):
         """
@@ -120,13 +151,10 @@ def run_one_trial():
         except Exception as e:
             Logger.get_instance().error(e)
 
-    network.quantum_routing_algo = dijsktra_routing
-
-    # get/create STATE bucket from each node
-    def hs_bucket(host_id: str):
-        if host_id not in handshake_state:
-            handshake_state[host_id] = {}
-        return handshake_state[host_id]
+    if SESSION_AWARE_ROUTING:
+        network.quantum_routing_algo = make_session_aware_routing(network, handshake_state)
+    else:
+        network.quantum_routing_algo = dijsktra_routing
 
     def generate_long_term_sig_keys():
         with oqs.Signature(sign_algo) as sig:
@@ -161,8 +189,8 @@ def run_one_trial():
     # PQC Key generation
     def pqc_keygen(host, receiver_id):
         #start = time.perf_counter()
-        # This kem_receiver will hold the secret key internally, which will be used in decapsulation
-        kem_receiver = oqs.KeyEncapsulation(kem_name)  
+        # This kem_receiver will hold the secret key internally until decapsulation, then it is freed and zeroed
+        kem_receiver = EphemeralKEM(kem_name)
         pk = kem_receiver.generate_keypair()
         # Time taken of key generation process (computational latency)
         #results['keygen_cpu'] = time.perf_counter() - start
@@ -176,7 +204,7 @@ def run_one_trial():
         results_name = 'pk_transmission ' + host.host_id + '<->' + receiver_id
         results[results_name] = time.perf_counter() - bob_received_pk_start
         print("PQC_SEND_PK_ACK received")
-        return kem_receiver, pk.hex()
+        return kem_receiver
 
     # PQC encapsulation
     def pqc_encaps(host, receiver_id):
@@ -232,11 +260,11 @@ def run_one_trial():
             results_name = 'ct_transmission ' + host.host_id + '<->' + receiver_id
             results[results_name] = time.perf_counter() - alice_received_ct_start
             print("PQC_CT_ACK received")
-        return ss_enc # alice gets their shared secret from bob's pk
+        return bytearray(ss_enc) # alice gets their shared secret from bob's pk (bytearray so it can be wiped)
 
     # PQC decapsulation
     # alice has to receive Ct from all nodes
-    def pqc_decaps(host, receiver_id, kem_host, pk_hex):
+    def pqc_decaps(host, receiver_id, kem_host):
         ct_msg = host.get_classical(receiver_id, wait=5)[0].content 
         ct_hex, sig_hex, receiver_pk_hex = ct_msg.split("|")
         ct_bytes = bytes.fromhex(ct_hex)
@@ -247,8 +275,9 @@ def run_one_trial():
         print("Byte count receiver_pk = ",len(receiver_pk_bytes))
 
         # Verify the signature using the receiver's public key to authenticate that the message is indeed from the expected sender and has not been tampered with
-        transcript = bytes.fromhex(pk_hex) + ct_bytes # record of the messages being sent
+        transcript = kem_host.pk + ct_bytes # record of the messages being sent (bytearray, wiped below)
         transcript_hash = hashlib.sha256(transcript).digest()
+        wipe(transcript)
 
         with oqs.Signature(sign_algo) as verifier:
             if verifier.verify(transcript_hash, sig, receiver_pk_bytes):
@@ -258,13 +287,12 @@ def run_one_trial():
                 return None 
 
         start = time.perf_counter()
-        with oqs.KeyEncapsulation(kem_name) as kem:
-            # uses bob's internal private key to decap the received ciphertext
-            ss_dec = kem_host.decap_secret(ct_bytes)
+        # uses alice's internal private key to decap the received ciphertext, the KEM context is freed right after
+        ss_dec = kem_host.decap_secret(ct_bytes)
 
-            # calculates decap computation time
-            results['decap_cpu'] = time.perf_counter() - start
-            print(PQC_DONE)
+        # calculates decap computation time
+        results['decap_cpu'] = time.perf_counter() - start
+        print(PQC_DONE)
         return ss_dec
 
     # after handshake, Alice can send a message to Bob with HMAC 
@@ -288,11 +316,19 @@ def run_one_trial():
 
     # This is different from 2 node version, but first, it checks if the node is adjacent
     def pqc_handshake(host1, host2):
+        # nodes that still share a live session with host1 (e.g. restored from the session cache after a restart)
+        # are resumed, only the others need a new handshake
+        live = handshake_state.peers(host1.host_id) if RESUME_SESSIONS else {}
+        route = None
+        if live:
+            route = network.get_quantum_route(host1.host_id, host2.host_id)
+            if route and all(node_id in live for node_id in route[1:]):
+                print("Resuming sessions with ", route[1:], ", no handshake needed")
+                return True, None
+
         pqc_keyexchange_req(host1, host2.host_id) 
         pqc_keyexchange_rec(host2, host1.host_id)
 
-        bucket = hs_bucket(host1.host_id) # bucket for alice to store the kem objects and shared secrets for each node in the path
-        
         host1.get_connections() 
         connections = host1.get_connections()
         adjacent = False
@@ -301,16 +337,19 @@ def run_one_trial():
                 adjacent = True
                 break
 
+        threads=[]
         if not adjacent:
             print("Hosts are not adjacent. Please establish handshake in middle node first before doing PQC handshake.")
-            route = network.get_quantum_route(host1.host_id, host2.host_id) # get shortest path
+            if route is None:
+                route = network.get_quantum_route(host1.host_id, host2.host_id) # get shortest path
             print("Route for handshake: ", route)
             
             # do handshake between alice and every node PARALLELLY
-            threads=[]
             for node_id in route[1:]:
+                if node_id in live:
+                    continue # resumed session
                 print("Starting handshake thread for node: ", node_id)
-                t = threading.Thread(target=handshake_with_node, args=(host1, node_id, bucket))
+                t = threading.Thread(target=handshake_with_node, args=(host1, node_id))
                 t.start()
                 threads.append(t)
 
@@ -349,7 +388,15 @@ def run_one_trial():
     # for multinode, try doing handshake for every single link since we want to see how long it takes for all nodes to finish the handshake
     print("-- BEGINS PQC HANDSHAKE FOR EVERY NODE--")
     t0 = time.perf_counter()
-    auth_result_ae, session_key_ae = pqc_handshake(alice, eva) # 4 hops, alice - eva. but need to do handshake for the middle nodes as well, by sending alice's pk to everyone
+    if EPR_PIPELINE_MODE:
+        # handshakes and link-level entanglement overlap in "pipelined" mode, swapping waits for the whole path
+        pqc_keyexchange_req(alice, eva.host_id)
+        pqc_keyexchange_rec(eva, alice.host_id)
+        first_epr = first_epr_request(network, alice, eva.host_id, handshake_with_node, handshake_state, EPR_PIPELINE_MODE)
+        auth_result_ae = first_epr["authenticated"]
+        results["time_to_first_epr"] = first_epr["first_epr"]
+    else:
+        auth_result_ae, session_key_ae = pqc_handshake(alice, eva) # 4 hops, alice - eva. but need to do handshake for the middle nodes as well, by sending alice's pk to everyone
     t1 = time.perf_counter()
 
     print("-- PQC LATENCY --")
@@ -361,12 +408,14 @@ def run_one_trial():
         print("--- READY FOR QUANTUM OPERATIONS ---")
         # Example: Using the key for a secure entanglement request
         # send_secure_entanglement_request(alice, "Bob", session_key)
+        if MULTIPATH_PAIRS > 0:
+            distribute_multipath(network, alice, eva.host_id, MULTIPATH_PAIRS, handshake_with_node, handshake_state)
     else:
         print("Handshake failed. Aborting.")
 
-    sum_pk = results['pk_transmission Alice<->Bob'] + results['pk_transmission Alice<->Cathy'] + results['pk_transmission Alice<->Dave'] + results['pk_transmission Alice<->Eva']
+    sum_pk = results.get('pk_transmission Alice<->Bob', 0.0) + results.get('pk_transmission Alice<->Cathy', 0.0) + results.get('pk_transmission Alice<->Dave', 0.0) + results.get('pk_transmission Alice<->Eva', 0.0)
 
-    sum_ct = results['ct_transmission Bob<->Alice'] + results['ct_transmission Cathy<->Alice'] + results['ct_transmission Dave<->Alice'] + results['ct_transmission Eva<->Alice']
+    sum_ct = results.get('ct_transmission Bob<->Alice', 0.0) + results.get('ct_transmission Cathy<->Alice', 0.0) + results.get('ct_transmission Dave<->Alice', 0.0) + results.get('ct_transmission Eva<->Alice', 0.0)
 
     print("total pk transmission time: ", sum_pk)
     print("total ct transmission time: ", sum_ct)
@@ -386,4 +435,8 @@ if __name__ == '__main__':
         with open("pqc_multiuni_overall_latency.txt", "a") as f:
             f.write(f"{trial},{overall_latency}\n")
 
+        if EPR_PIPELINE_MODE and results.get("time_to_first_epr") is not None:
+            with open(f"pqc_multiuni_first_epr_{EPR_PIPELINE_MODE}.txt", "a") as f:
+                f.write(f"{trial},{results['time_to_first_epr']}\n")
+
         print(f"Trial {trial} done")
\ No newline at end of file
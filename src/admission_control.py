@@ -0,0 +1,294 @@
+# Admission and fair scheduling of entanglement requests (distributed control layer)
+# (Instruction List.md: GET_EPR_PAIR() / SEND_EPR_PAIR() are called by many applications at once)
+# Every tenant (an application on one end-node pair) has its own request queue. AdmissionQueue
+# - rejects a request right away when the memory of its path is exhausted: the registers promised to admitted
+#   requests (1 per end node, 2 per repeater) may not exceed `overcommit` times the registers of a node,
+#   so an admitted request always gets its memory eventually instead of queueing forever
+# - serves the tenant queues with deficit round-robin (DRR): every round a backlogged tenant earns
+#   quantum * weight pairs of credit and starts requests while its credit covers their pairs, so a tenant with long
+#   requests or a high arrival rate cannot starve the others ("fifo" serves all tenants in arrival order instead)
+# - caps the path setups running concurrently through one repeater (max_setups), a request whose path is at the
+#   cap waits in its queue without losing its credit
+# - policy "edf" serves the requests with the earliest deadline first instead and drops the ones that cannot make
+#   their deadline any more (deadline_scheduler.py); max_queue bounds the queued requests of a tenant there as well
+# A started request reserves its path (MemoryPool.reserve_path) and generates its pairs one after the other with
+# swap_scheduler.swap_on_orchestrator; the end nodes consume every end-to-end pair right away. A pair whose path
+# fails (a link ran out of attempts) is started again up to max_retries times, then the request fails and gives
+# back its committed memory, its path reservation and its setup slots.
+import itertools
+import time
+from collections import deque
+import numpy as np
+from node_orchestration import NodeOrchestrator, SLOT_DURATION
+from swap_scheduler import swap_on_orchestrator
+from deadline_scheduler import COHERENCE_BUDGET, EDFQueue, WorkEstimator
+
+POLICIES = ("drr", "fifo", "edf")
+RETRY_DELAY = 10 * SLOT_DURATION # path memory still held by another request: reserve again after this
+
+class EntanglementRequest:
+    __slots__ = ("request_id", "tenant", "route", "num_pairs", "arrival", "started", "finished", "pairs_done",
+                 "deadline", "status", "failures")
+
+    def __init__(self, request_id, tenant, route, num_pairs, arrival, deadline=None):
+        self.request_id = request_id
+        self.tenant = tenant
+        self.route = route
+        self.num_pairs = num_pairs
+        self.arrival = arrival
+        self.started = None
+        self.finished = None
+        self.pairs_done = 0
+        self.deadline = deadline # time the pairs have to be delivered by, None = no deadline
+        self.status = "queued" # queued, running, done, failed, rejected_memory, rejected_queue, dropped_infeasible
+        self.failures = 0 # failed path setups, retried while at most max_retries
+
+def path_demand(route):
+    # registers a path needs on every node: one on the end nodes, two on every repeater
+    return [(node_id, 1 if i == 0 or i == len(route) - 1 else 2) for i, node_id in enumerate(route)]
+
+class AdmissionQueue:
+    def __init__(self, orchestrator, policy="drr", quantum=4, weights=None, max_setups=2, overcommit=2.0,
+                 max_queue=64, swap_policy="nested", estimator=None, max_retries=2):
+        """
+        Args:
+            orchestrator (NodeOrchestrator): hosts every node of the routes
+            policy (str): "drr" (deficit round-robin over the tenants), "fifo" or "edf" (earliest deadline first)
+            quantum (int): pairs of credit a tenant earns per DRR round, times its weight
+            weights (dict): tenant -> weight, 1 if missing
+            max_setups (int): path setups running concurrently through one repeater
+            overcommit (float): registers that may be promised to admitted requests, per register of a node
+            max_queue (int): queued requests per tenant, more are rejected
+            estimator (WorkEstimator): remaining work of a request, for the "edf" feasibility checks
+            max_retries (int): failed path setups of one request that are started again before the request fails
+        """
+        if policy not in POLICIES:
+            raise ValueError("unknown scheduling policy: " + str(policy))
+        self.orchestrator = orchestrator
+        self.loop = orchestrator.loop
+        self.memory = orchestrator.memory
+        self.policy = policy
+        self.quantum = quantum
+        self.weights = weights if weights is not None else {}
+        self.max_setups = max_setups
+        self.overcommit = overcommit
+        self.max_queue = max_queue
+        self.swap_policy = swap_policy
+        self.max_retries = max_retries
+        self.queues = {} # tenant -> deque of EntanglementRequest
+        self.active = deque() # tenants with queued requests, in DRR order
+        self.deficit = {} # tenant -> pairs of credit
+        self.committed = {} # node_id -> registers promised to admitted requests
+        self.setups = {} # repeater -> running path setups
+        self.edf = EDFQueue(self.loop, estimator or WorkEstimator(), on_drop=self._edf_dropped) if policy == "edf" else None
+        self.edf_queued = {} # tenant -> requests in the EDF queue
+        self._ids = itertools.count()
+        self.requests = []
+        self.stats = {"submitted": 0, "admitted": 0, "rejected_memory": 0, "rejected_queue": 0, "completed": 0,
+                      "pairs": 0, "retries": 0, "link_retries": 0, "failed": 0, "deadline_missed": 0}
+
+    def submit(self, tenant, route, num_pairs=1, deadline=None):
+        """
+        GET_EPR_PAIR / SEND_EPR_PAIR of an application: num_pairs end-to-end pairs between route[0] and route[-1].
+        With the "edf" policy a request without deadline gets arrival + deadline_scheduler.COHERENCE_BUDGET.
+
+        Returns:
+            (EntanglementRequest): the request, its status tells whether it was admitted
+        """
+        now = self.loop.now()
+        if deadline is None and self.edf is not None:
+            deadline = now + COHERENCE_BUDGET
+        request = EntanglementRequest(next(self._ids), tenant, route, num_pairs, now, deadline)
+        self.requests.append(request)
+        self.stats["submitted"] += 1
+        queue = self.queues.setdefault(tenant, deque())
+        queued = self.edf_queued.get(tenant, 0) if self.edf is not None else len(queue)
+        if queued >= self.max_queue:
+            request.status = "rejected_queue"
+            self.stats["rejected_queue"] += 1
+            return request
+        if not self._commit(route):
+            request.status = "rejected_memory"
+            self.stats["rejected_memory"] += 1
+            return request
+        self.stats["admitted"] += 1
+        if self.edf is not None:
+            self.edf_queued[tenant] = queued + 1
+            if self.edf.push(request):
+                self.dispatch()
+            return request
+        if not queue:
+            self.active.append(tenant)
+            self.deficit.setdefault(tenant, 0)
+        queue.append(request)
+        self.dispatch()
+        return request
+
+    def _commit(self, route):
+        demand = path_demand(route)
+        for node_id, count in demand:
+            if self.committed.get(node_id, 0) + count > self.overcommit * self.memory[node_id].num_registers:
+                return False
+        for node_id, count in demand:
+            self.committed[node_id] = self.committed.get(node_id, 0) + count
+        return True
+
+    def _uncommit(self, request):
+        for node_id, count in path_demand(request.route):
+            self.committed[node_id] -= count
+
+    def _edf_dropped(self, request):
+        # infeasible request, dropped by the EDF queue when pushed or while queued
+        self.edf_queued[request.tenant] -= 1
+        self._uncommit(request)
+
+    def _can_start(self, route):
+        return all(self.setups.get(node_id, 0) < self.max_setups for node_id in route[1:-1])
+
+    def dispatch(self):
+        # starts every request the policy, the repeater caps and the credit allow right now
+        if self.policy == "fifo":
+            self._dispatch_fifo()
+            return
+        if self.policy == "edf":
+            request = self.edf.pop(self._can_start)
+            while request is not None:
+                self.edf_queued[request.tenant] -= 1
+                self._start(request)
+                request = self.edf.pop(self._can_start)
+            return
+        progress = True
+        while progress and self.active:
+            progress = False
+            for _ in range(len(self.active)):
+                tenant = self.active[0]
+                self.active.rotate(-1)
+                queue = self.queues[tenant]
+                if not self._can_start(queue[0].route):
+                    continue # blocked by a repeater cap, keeps its credit for later
+                if self.deficit[tenant] < queue[0].num_pairs:
+                    self.deficit[tenant] += self.quantum * self.weights.get(tenant, 1)
+                    progress = True
+                while queue and queue[0].num_pairs <= self.deficit[tenant] and self._can_start(queue[0].route):
+                    request = queue.popleft()
+                    self.deficit[tenant] -= request.num_pairs
+                    self._start(request)
+                    progress = True
+                if not queue:
+                    self.deficit[tenant] = 0
+                    self.active.remove(tenant)
+
+    def _dispatch_fifo(self):
+        # oldest head first, the oldest request blocks everybody behind it (head of line)
+        while self.active:
+            tenant = min(self.active, key=lambda t: self.queues[t][0].arrival)
+            queue = self.queues[tenant]
+            if not self._can_start(queue[0].route):
+                return
+            self._start(queue.popleft())
+            if not queue:
+                self.active.remove(tenant)
+
+    def _start(self, request):
+        request.status = "running"
+        request.started = self.loop.now()
+        for node_id in request.route[1:-1]:
+            self.setups[node_id] = self.setups.get(node_id, 0) + 1
+        self._next_pair(request)
+
+    def _next_pair(self, request):
+        reservation = (request.request_id, request.pairs_done)
+        if not self.memory.reserve_path(request.route, reservation):
+            self.stats["retries"] += 1
+            self.loop.call_later(RETRY_DELAY, self._next_pair, request)
+            return
+        swap_on_orchestrator(self.orchestrator, request.route, self.swap_policy, reservation=reservation,
+                             on_done=lambda coordinator, end: self._pair_done(request, coordinator, end))
+
+    def _pair_done(self, request, coordinator, end):
+        if end is None:
+            self._pair_failed(request)
+            return
+        last = len(request.route) - 1
+        self.orchestrator.consume(request.route[0], coordinator.registers[(0, 0)])
+        self.orchestrator.consume(request.route[last], coordinator.registers[(last - 1, last)])
+        request.pairs_done += 1
+        self.stats["pairs"] += 1
+        if request.pairs_done < request.num_pairs:
+            self._next_pair(request)
+            return
+        self._finish(request, "done")
+
+    def _pair_failed(self, request):
+        # a link of the path failed, its stored links are dropped: free what is left of the pair's reservation
+        self.memory.release_path(request.route, (request.request_id, request.pairs_done))
+        request.failures += 1
+        if request.failures <= self.max_retries:
+            self.stats["link_retries"] += 1
+            self._next_pair(request)
+            return
+        self._finish(request, "failed")
+
+    def _finish(self, request, status):
+        # the request leaves the running set: setup slots and committed memory go back to the others
+        request.status = status
+        request.finished = self.loop.now()
+        self.stats["completed" if status == "done" else status] += 1
+        if status == "done" and request.deadline is not None and request.finished > request.deadline:
+            self.stats["deadline_missed"] += 1
+        for node_id in request.route[1:-1]:
+            self.setups[node_id] -= 1
+        self._uncommit(request)
+        self.dispatch()
+
+def tenant_report(queue, horizon):
+    """
+    Per tenant: pairs/sec over the horizon, queueing delay (arrival -> start) mean and p95, rejected requests.
+
+    Returns:
+        (dict): tenant -> {"pairs_per_sec", "delay_mean", "delay_p95", "completed", "rejected"}
+    """
+    report = {}
+    for tenant in queue.queues:
+        requests = [r for r in queue.requests if r.tenant == tenant]
+        delays = [r.started - r.arrival for r in requests if r.started is not None]
+        done = [r for r in requests if r.status == "done"]
+        report[tenant] = {
+            "pairs_per_sec": sum(r.num_pairs for r in done if r.finished <= horizon) / horizon,
+            "delay_mean": float(np.mean(delays)) if delays else 0.0,
+            "delay_p95": float(np.percentile(delays, 95)) if delays else 0.0,
+            "completed": len(done),
+            "rejected": sum(1 for r in requests if r.status.startswith("rejected")),
+        }
+    return report
+
+if __name__ == '__main__':
+    import random
+    from des_kernel import Simulator
+    HORIZON = 0.2 # seconds of arrivals
+    OVERCOMMIT = 8.0
+    route = ["node" + str(i) for i in range(7)]
+    # tenant -> (path, pairs per request, requests/sec); "bulk" floods the long path
+    TENANTS = {"bulk": (route, 8, 400.0), "app1": (route[1:4], 2, 100.0), "app2": (route[3:7], 2, 100.0),
+               "app3": (route[0:3], 2, 100.0)}
+    for policy in POLICIES:
+        sim = Simulator(seed=1)
+        orchestrator = NodeOrchestrator(sim, seed=1)
+        for node_id in route:
+            orchestrator.add_node(node_id)
+        queue = AdmissionQueue(orchestrator, policy, weights={"app3": 2}, overcommit=OVERCOMMIT)
+        rng = random.Random(1)
+        for tenant, (path, num_pairs, rate) in TENANTS.items():
+            t = rng.expovariate(rate)
+            while t < HORIZON:
+                sim.call_at(t, queue.submit, tenant, path, num_pairs)
+                t += rng.expovariate(rate)
+        t0 = time.perf_counter()
+        sim.run(until=HORIZON)
+        wall = time.perf_counter() - t0
+        print("-- ADMISSION QUEUE (" + policy + ", " + str(len(TENANTS)) + " tenants, " + str(HORIZON) + " s) --")
+        for tenant, r in tenant_report(queue, HORIZON).items():
+            print(tenant, ": pairs/sec ", round(r["pairs_per_sec"], 1), " queueing delay mean/p95 (ms) ",
+                  round(r["delay_mean"] * 1e3, 3), round(r["delay_p95"] * 1e3, 3), " completed ", r["completed"],
+                  " rejected ", r["rejected"])
+        print("total pairs/sec ", queue.stats["pairs"] / HORIZON, " ", queue.stats, " wall: ", wall, " s")
@@ -0,0 +1,150 @@
+# Vectorized probabilistic entanglement-attempt model (link layer)
+# NV abstraction from the README: entanglement attempts are probabilistic (ENT_ATTEMPT / herald loop in
+# Control Plane Design/Entanglement Services.md). Drawing one attempt at a time in Python does not scale,
+# so everything here samples whole batches of links and time slots with NumPy:
+# - photon loss versus distance -> success probability of one attempt on every link
+# - geometric number of attempts until success, per link, for many successes at once
+# - heralded Bell state of every success
+# - per-link success-time distributions
+# NodeOrchestrator takes an AttemptModel (attempt_model=...) and draws its herald outcomes from these batches.
+import numpy as np
+from node_orchestration import SLOT_DURATION, HERALD_DELAY
+
+# physical parameters of one NV link with a heralding station in the middle
+ATTENUATION_DB_PER_KM = 0.2 # telecom fiber after frequency conversion
+P_EMISSION = 0.03 # zero-phonon-line photon emitted and collected per attempt
+DETECTOR_EFFICIENCY = 0.8
+BRIGHT_STATE = 0.1 # bright state population of the single-click protocol
+DEFAULT_DISTANCE_KM = 10.0
+BATCH_SIZE = 4096 # successes sampled per link and refill
+
+# heralded Bell states as (x, z) bit pairs: 0 = PHI_PLUS, 1 = PSI_PLUS, 2 = PHI_MINUS, 3 = PSI_MINUS
+PSI_STATES = np.array([1, 3], dtype=np.uint8)
+
+def photon_transmission(distance_km, attenuation=ATTENUATION_DB_PER_KM):
+    # each photon travels half of the link to the heralding station in the middle
+    return 10.0 ** (-attenuation * (np.asarray(distance_km, dtype=float) / 2.0) / 10.0)
+
+def success_probability(distance_km, scheme="single_click", p_emission=P_EMISSION,
+                        detector_efficiency=DETECTOR_EFFICIENCY, bright_state=BRIGHT_STATE):
+    """
+    Success probability of one attempt, vectorized over links.
+
+    Args:
+        distance_km (array): link lengths
+        scheme (str): "single_click" (one photon detected, p ~ 2 * alpha * eta) or
+                      "barrett_kok" (two rounds, both photons detected, p ~ eta^2 / 2)
+    Returns:
+        (np.ndarray): probability per link
+    """
+    eta = p_emission * detector_efficiency * photon_transmission(distance_km)
+    if scheme == "single_click":
+        return 2.0 * bright_state * eta
+    if scheme == "barrett_kok":
+        return 0.5 * eta * eta
+    raise ValueError("unknown heralding scheme: " + str(scheme))
+
+def sample_attempts(p, num_successes, rng):
+    # attempts until success (>= 1) for every link, shape (links, num_successes)
+    p = np.asarray(p, dtype=float)
+    return rng.geometric(p[:, None], size=(p.shape[0], num_successes))
+
+def sample_bell_states(shape, rng):
+    # both heralding schemes project onto PSI_PLUS or PSI_MINUS with equal probability
+    return PSI_STATES[rng.integers(0, 2, size=shape)]
+
+def sample_slot_outcomes(p, num_slots, rng):
+    # success of every link in every time slot at once, boolean matrix (links, num_slots)
+    p = np.asarray(p, dtype=float)
+    return rng.random((p.shape[0], num_slots)) < p[:, None]
+
+def success_time_distribution(p, num_samples, rng, period=1, slot_duration=SLOT_DURATION, herald_delay=HERALD_DELAY):
+    """
+    Time from the first attempt until the herald of the first success, per link.
+
+    Returns:
+        (np.ndarray): seconds, shape (links, num_samples)
+    """
+    attempts = sample_attempts(p, num_samples, rng)
+    return (attempts - 1) * period * slot_duration + herald_delay
+
+def summarize(times, percentiles=(50, 95, 99)):
+    # per-link mean and percentiles of a (links, samples) matrix
+    return times.mean(axis=1), np.percentile(times, percentiles, axis=1)
+
+class AttemptModel:
+    """
+    Outcome source for the entanglement generation service.
+    Links are registered with their length; outcomes are drawn per link from batches sampled with NumPy,
+    so the orchestrator does not call the RNG once per attempt.
+    """
+    def __init__(self, scheme="single_click", seed=None, batch_size=BATCH_SIZE, default_distance=DEFAULT_DISTANCE_KM):
+        self.scheme = scheme
+        self.rng = np.random.default_rng(seed)
+        self.batch_size = batch_size
+        self.default_distance = default_distance
+        self.index = {} # link -> row
+        self.p = np.zeros(0)
+        self._failures = [] # per link: failures before each success (batch)
+        self._bell = [] # per link: heralded Bell state of each success (batch)
+        self._pos = [] # per link: next unused entry of the batch
+
+    def add_link(self, link, distance_km=None):
+        if link in self.index:
+            return self.index[link]
+        row = len(self.index)
+        self.index[link] = row
+        distance = self.default_distance if distance_km is None else distance_km
+        self.p = np.append(self.p, success_probability(distance, self.scheme))
+        self._failures.append(None)
+        self._bell.append(None)
+        self._pos.append(0)
+        return row
+
+    def refill(self, rows=None):
+        # samples a new batch for the given links (all links if None) in one vectorized call
+        rows = np.arange(len(self.index)) if rows is None else np.asarray(rows)
+        failures = sample_attempts(self.p[rows], self.batch_size, self.rng) - 1
+        bell = sample_bell_states(failures.shape, self.rng)
+        for i, row in enumerate(rows):
+            self._failures[row] = failures[i].tolist()
+            self._bell[row] = bell[i].tolist()
+            self._pos[row] = 0
+
+    def next_run(self, link):
+        """
+        Next success on a link.
+
+        Returns:
+            (tuple): (failed attempts before the success, heralded Bell state of the success)
+        """
+        row = self.index.get(link)
+        if row is None:
+            row = self.add_link(link)
+        if self._failures[row] is None or self._pos[row] == self.batch_size:
+            self.refill([row])
+        pos = self._pos[row]
+        self._pos[row] = pos + 1
+        return self._failures[row][pos], self._bell[row][pos]
+
+if __name__ == '__main__':
+    import time
+    rng = np.random.default_rng(1)
+    distances = np.array([1.0, 5.0, 10.0, 25.0, 50.0])
+    print("-- SUCCESS PROBABILITY PER ATTEMPT --")
+    for scheme in ["single_click", "barrett_kok"]:
+        print(scheme, dict(zip(distances.tolist(), success_probability(distances, scheme).tolist())))
+
+    print("-- SUCCESS TIME PER LINK (single click, 100000 samples per link) --")
+    t0 = time.perf_counter()
+    times = success_time_distribution(success_probability(distances), 100000, rng)
+    elapsed = time.perf_counter() - t0
+    mean, (p50, p95, p99) = summarize(times)
+    for i, d in enumerate(distances):
+        print(str(d) + " km : mean/p50/p95/p99 (ms) ", [float(x[i]) * 1e3 for x in (mean, p50, p95, p99)])
+    attempts = int(((times - HERALD_DELAY) / SLOT_DURATION + 1).sum())
+    print("sampled ", attempts, " attempts in ", elapsed, " s (", attempts / elapsed, " attempts/sec )")
+
+    t0 = time.perf_counter()
+    outcomes = sample_slot_outcomes(success_probability(np.full(1000, 10.0)), 10000, rng)
+    print("1000 links x 10000 slots: ", outcomes.sum(), " successes in ", time.perf_counter() - t0, " s")
@@ -0,0 +1,309 @@
+# Bulk EPR generation: SEND_EPR_PAIR(n) / GET_EPR_PAIR(n) with one control exchange per batch
+# (QuNetSim Basics/send_epr_pairs.py: send_epr(receiver, await_ack=True) per pair, get_epr(wait=5) per pair)
+# The per-pair loop waits one ACK round trip after every pair before the next pair can start.
+# A batch instead negotiates all n pairs with ONE authenticated request and ONE authenticated report:
+# - BULK_REQUEST: batch id, n, MAC with the session's mac_key; the batch id is the session's send_seq, the receiver
+#   only accepts batch ids above its recv_seq (no replay of an old request)
+# - the n pairs are generated back to back without any per-pair message, pair i has q_id "<batch id>-<i>"
+# - BULK_REPORT: which of the n pairs the receiver got, as a bitmap (n bits) or as a list of runs (start, stop),
+#   whichever is shorter, MAC with the same key
+# - the pairs are handed to the application as an iterator over the successful indices (EPRBatch)
+# send_epr_pairs / receive_epr_pairs run this on QuNetSim hosts, simulate_batch / simulate_per_pair on the DES kernel.
+import hashlib
+import hmac
+import struct
+import time
+from des_kernel import CLASSICAL_DELAY
+from swap_aggregation import MESSAGE_OVERHEAD, HMAC_TIME
+
+BULK_REQUEST = "BULK_REQUEST"
+BULK_REPORT = "BULK_REPORT"
+REQUEST = struct.Struct(">QI") # batch id, number of pairs
+REPORT = struct.Struct(">QIB") # batch id, number of pairs, format of the success list
+RUN = struct.Struct(">II") # start, stop of a run of successful pairs
+FORMAT_BITMAP = 0
+FORMAT_RANGES = 1
+TAG_SIZE = 32
+
+def runs(bitmap):
+    """
+    Runs of set bits of a success bitmap (bit i = pair i), O(number of runs).
+
+    Returns:
+        (list): [(start, stop)], pairs start .. stop - 1 succeeded
+    """
+    out = []
+    while bitmap:
+        start = (bitmap & -bitmap).bit_length() - 1
+        shifted = bitmap >> start
+        length = (shifted ^ (shifted + 1)).bit_length() - 1 # trailing ones
+        out.append((start, start + length))
+        bitmap &= ~(((1 << length) - 1) << start)
+    return out
+
+def bitmap_from_runs(ranges):
+    bitmap = 0
+    for start, stop in ranges:
+        bitmap |= ((1 << (stop - start)) - 1) << start
+    return bitmap
+
+def _tag(mac_key, kind, body):
+    return hmac.new(mac_key, kind.encode() + body, hashlib.sha256).digest()
+
+def encode_request(batch_id, count, mac_key):
+    body = REQUEST.pack(batch_id, count)
+    return body + _tag(mac_key, BULK_REQUEST, body)
+
+def decode_request(blob, mac_key):
+    """
+    Returns:
+        (tuple): (batch id, number of pairs), None if the request does not verify
+    """
+    body, tag = blob[:REQUEST.size], blob[REQUEST.size:]
+    if not hmac.compare_digest(tag, _tag(mac_key, BULK_REQUEST, body)):
+        print("Bulk EPR request authentication failed!")
+        return None
+    return REQUEST.unpack(body)
+
+def encode_report(batch_id, count, successes, mac_key):
+    """
+    Args:
+        successes (int): bitmap, bit i set = pair i was received
+    Returns:
+        (bytes): header | bitmap or runs, whichever is shorter | tag
+    """
+    bitmap = successes.to_bytes(-(-count // 8), "big")
+    ranges = runs(successes)
+    if len(ranges) * RUN.size < len(bitmap):
+        body = REPORT.pack(batch_id, count, FORMAT_RANGES) + b"".join(RUN.pack(*r) for r in ranges)
+    else:
+        body = REPORT.pack(batch_id, count, FORMAT_BITMAP) + bitmap
+    return body + _tag(mac_key, BULK_REPORT, body)
+
+def decode_report(blob, mac_key):
+    """
+    Returns:
+        (tuple): (batch id, number of pairs, success bitmap), None if the report does not verify
+    """
+    body, tag = blob[:-TAG_SIZE], blob[-TAG_SIZE:]
+    if not hmac.compare_digest(tag, _tag(mac_key, BULK_REPORT, body)):
+        print("Bulk EPR report authentication failed!")
+        return None
+    batch_id, count, fmt = REPORT.unpack_from(body, 0)
+    payload = body[REPORT.size:]
+    if fmt == FORMAT_RANGES:
+        successes = bitmap_from_runs(RUN.unpack_from(payload, i) for i in range(0, len(payload), RUN.size))
+    else:
+        successes = int.from_bytes(payload, "big")
+    return batch_id, count, successes
+
+class EPRBatch:
+    """
+    Result of SEND_EPR_PAIR(n) / GET_EPR_PAIR(n). Iterating yields (index, pair) for every successful pair in order,
+    fetch(index) is only called when the application gets to that pair.
+    """
+    def __init__(self, batch_id, count, successes=0, fetch=None):
+        self.batch_id = batch_id
+        self.count = count
+        self.successes = successes # bitmap
+        self.fetch = fetch
+
+    def __len__(self):
+        return bin(self.successes).count("1")
+
+    def ranges(self):
+        return runs(self.successes)
+
+    def __iter__(self):
+        for start, stop in self.ranges():
+            for index in range(start, stop):
+                yield index, (self.fetch(index) if self.fetch is not None else None)
+
+def epr_id(batch_id, index):
+    return str(batch_id) + "-" + str(index)
+
+def _get_message(host, sender_id, kind, wait):
+    # the next classical message of this kind from sender_id, as bytes
+    deadline = time.time() + wait
+    while time.time() < deadline:
+        for msg in host.get_classical(sender_id, wait=max(0.0, deadline - time.time())) or []:
+            content = str(msg.content)
+            if content.startswith(kind + "|"):
+                return bytes.fromhex(content[len(kind) + 1:])
+    return None
+
+def send_epr_pairs(host, receiver_id, count, session, wait=5):
+    """
+    SEND_EPR_PAIR(n) on a QuNetSim host: one request, n pairs without ACKs, one report.
+
+    Args:
+        host (Host): sender
+        receiver_id (str): ID of the receiver, running receive_epr_pairs
+        count (int): number of pairs
+        session (SessionRecord): session of the two hosts (handshake_state), its mac_key authenticates the batch
+    Returns:
+        (EPRBatch): the pairs the receiver confirmed, None if the report did not arrive or does not verify
+    """
+    batch_id = session.next_send()
+    host.send_classical(receiver_id, BULK_REQUEST + "|" + encode_request(batch_id, count, session.mac_key).hex())
+    for index in range(count):
+        host.send_epr(receiver_id, q_id=epr_id(batch_id, index), await_ack=False)
+    blob = _get_message(host, receiver_id, BULK_REPORT, wait)
+    report = decode_report(blob, session.mac_key) if blob is not None else None
+    if report is None or report[0] != batch_id:
+        print("No valid bulk EPR report for batch ", batch_id)
+        return None
+    return EPRBatch(batch_id, count, report[2], lambda index: host.get_epr(receiver_id, q_id=epr_id(batch_id, index)))
+
+def receive_epr_pairs(host, sender_id, session, wait=5):
+    """
+    GET_EPR_PAIR(n) on a QuNetSim host (not Host.get_epr_pairs, which lists the stored pairs): waits for the sender's request, collects the n pairs, sends one report.
+
+    Returns:
+        (EPRBatch): the received pairs, None if no valid request arrived
+    """
+    blob = _get_message(host, sender_id, BULK_REQUEST, wait)
+    request = decode_request(blob, session.mac_key) if blob is not None else None
+    if request is None:
+        return None
+    batch_id, count = request
+    if not session.accept(batch_id):
+        print("Replayed bulk EPR request ", batch_id, " rejected")
+        return None
+    qubits = {}
+    successes = 0
+    for index in range(count):
+        q = host.get_epr(sender_id, q_id=epr_id(batch_id, index), wait=wait)
+        if q is not None:
+            qubits[index] = q
+            successes |= 1 << index
+    host.send_classical(sender_id, BULK_REPORT + "|" + encode_report(batch_id, count, successes, session.mac_key).hex())
+    return EPRBatch(batch_id, count, successes, qubits.get)
+
+def _generate(orchestrator, a, b, on_done):
+    # one link-level pair between a and b on the orchestrator, on_done(registers or None)
+    ends = {}
+
+    def done(request, success):
+        if not success:
+            on_done(None)
+            return
+        ends[request.node_id] = request.register
+        if len(ends) == 2:
+            on_done(ends)
+
+    slot = orchestrator.next_slot() + 1
+    orchestrator.handle_message(a, ("START_ENTANGLEMENT", b, None, slot), on_done=done)
+    orchestrator.handle_message(b, ("START_ENTANGLEMENT", a, None, slot), on_done=done)
+
+def simulate_per_pair(orchestrator, a, b, count, on_done=None):
+    """
+    The per-pair loop of send_epr_pairs.py on the DES kernel: the next pair starts when the ACK of the last arrived.
+
+    Returns:
+        (dict): report {"pairs", "messages", "end"}, filled in while the loop runs
+    """
+    loop = orchestrator.loop
+    report = {"pairs": 0, "messages": 0, "end": None}
+
+    def next_pair(index):
+        if index == count:
+            report["end"] = loop.now()
+            if on_done is not None:
+                on_done(report)
+            return
+        _generate(orchestrator, a, b, lambda ends: stored(index, ends))
+
+    def stored(index, ends):
+        if ends is not None:
+            report["pairs"] += 1
+            for node_id, register in ends.items():
+                orchestrator.consume(node_id, register) # the application measures right away
+        report["messages"] += 1 # ACK of the receiver
+        loop.call_later(CLASSICAL_DELAY + MESSAGE_OVERHEAD, next_pair, index + 1)
+
+    next_pair(0)
+    return report
+
+def simulate_batch(orchestrator, a, b, count, mac_key, batch_id=1, on_done=None):
+    """
+    SEND_EPR_PAIR(n) on the DES kernel: request, n pairs back to back, report. The receiving application consumes
+    every pair from the batch iterator as it arrives, so the pairs do not need n registers. Every batch, also a
+    single pair, is authenticated with the request / report exchange, like send_epr_pairs.
+
+    Returns:
+        (dict): report {"pairs", "messages", "end", "report_bytes", "confirmed"}, filled in while the batch runs
+    """
+    loop = orchestrator.loop
+    report = {"pairs": 0, "messages": 2, "end": None, "report_bytes": 0}
+    successes = [0]
+    request = encode_request(batch_id, count, mac_key)
+
+    def start():
+        if decode_request(request, mac_key) is not None:
+            next_pair(0)
+
+    def next_pair(index):
+        if index == count:
+            blob = encode_report(batch_id, count, successes[0], mac_key)
+            report["report_bytes"] = len(blob)
+            loop.call_later(CLASSICAL_DELAY + MESSAGE_OVERHEAD + HMAC_TIME, finish, blob)
+            return
+        _generate(orchestrator, a, b, lambda ends: stored(index, ends))
+
+    def stored(index, ends):
+        if ends is not None:
+            successes[0] |= 1 << index
+            report["pairs"] += 1
+            for node_id, register in ends.items():
+                orchestrator.consume(node_id, register)
+        next_pair(index + 1)
+
+    def finish(blob):
+        decoded = decode_report(blob, mac_key)
+        report["end"] = loop.now()
+        report["confirmed"] = decoded is not None and decoded[2] == successes[0]
+        if on_done is not None:
+            on_done(report)
+
+    loop.call_later(CLASSICAL_DELAY + MESSAGE_OVERHEAD + HMAC_TIME, start)
+    return report
+
+if __name__ == '__main__':
+    import os
+    import random
+    from des_kernel import Simulator
+    from node_orchestration import NodeOrchestrator
+    mac_key = os.urandom(32)
+    for count in [1, 10, 100, 1000]:
+        print("-- BULK EPR (" + str(count) + " pairs, Alice - Bob) --")
+        results = {}
+        for variant in ["per-pair", "batch"]:
+            sim = Simulator(seed=1)
+            orchestrator = NodeOrchestrator(sim, seed=1)
+            orchestrator.add_node("Alice")
+            orchestrator.add_node("Bob")
+            t0 = time.perf_counter()
+            if variant == "batch":
+                report = simulate_batch(orchestrator, "Alice", "Bob", count, mac_key)
+            else:
+                report = simulate_per_pair(orchestrator, "Alice", "Bob", count)
+            sim.run()
+            results[variant] = report
+            print(variant, ": ", count, " pairs in ", report["end"] * 1e3, " ms, pairs/sec ", report["pairs"] / report["end"],
+                  " control messages ", report["messages"], " wall: ", time.perf_counter() - t0, " s")
+        print("speedup: ", results["per-pair"]["end"] / results["batch"]["end"], " report bytes ",
+              results["batch"]["report_bytes"])
+
+    # success list: a run list for few long runs, a bitmap for scattered losses
+    print("-- BULK EPR REPORT SIZE (10000 pairs) --")
+    rng = random.Random(1)
+    for loss in [0.0, 0.01, 0.3]:
+        successes = 0
+        for index in range(10000):
+            if rng.random() >= loss:
+                successes |= 1 << index
+        blob = encode_report(1, 10000, successes, mac_key)
+        assert decode_report(blob, mac_key)[2] == successes
+        print(loss * 100, "% lost: ", len(blob), " bytes (",
+              "ranges" if blob[REPORT.size - 1] == FORMAT_RANGES else "bitmap", ", ", len(runs(successes)), " runs)")
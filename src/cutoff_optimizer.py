@@ -0,0 +1,214 @@
+# Cutoff-policy optimizer (when to discard a stored link instead of waiting for the rest of the path)
+# The links of a path are generated in parallel, attempt after attempt. A stored link waits in memory for the other
+# links and decoheres while it waits; with a cutoff of c seconds it is discarded once it has waited longer than c
+# and the link starts again. The end-to-end pair is made (swapped) as soon as all links are stored at the same time.
+# - no / long cutoff: fast, but the pair is built from old, decohered links
+# - short cutoff: fresh links only, but links are thrown away often and the pair takes longer
+# simulate_cutoff runs many trials of one configuration at once, as NumPy arrays of link ages (trials x links),
+# one vectorized step per attempt; the cutoff is given in seconds everywhere and only converted to whole attempts
+# inside simulate_cutoff. sweep() spreads the configurations over a process pool and pareto_front() keeps
+# the rate-vs-fidelity trade-offs that are not dominated; the policy table is written as
+# num_links,p_success,t2,cutoff,rate,fidelity,pareto lines (cutoff in seconds, "inf" = none) and choose_cutoff()
+# picks the fastest cutoff of a table that meets a fidelity target, e.g. for NodeOrchestrator(cutoff=...).
+import math
+import os
+import time
+from concurrent.futures import ProcessPoolExecutor
+import numpy as np
+from node_orchestration import SLOT_DURATION
+from epr_index import LINK_FIDELITY
+from quantum_memory import T2
+
+ATTEMPT_TIME = 2 * SLOT_DURATION # one attempt per link every other slot (alternating TDMA slots)
+NUM_TRIALS = 10000
+MAX_ATTEMPTS = 100000 # trials that have not finished by then are counted as failed
+POLICY_FILE = "cutoff_policy.txt"
+
+def werner_fidelity(ages, attempt_time, t2, link_fidelity=LINK_FIDELITY):
+    """
+    Fidelity of the end-to-end pair swapped from links of the given ages (attempts), for every trial.
+
+    Args:
+        ages (np.ndarray): trials x links
+    Returns:
+        (np.ndarray): fidelity per trial; Werner parameters p = (4F - 1) / 3 multiply under swapping and every
+                      link's decays as exp(-age / T2) while it waits
+    """
+    p_link = (4 * link_fidelity - 1) / 3
+    p = p_link ** ages.shape[1] * np.exp(-ages.sum(axis=1) * attempt_time / t2)
+    return (1 + 3 * p) / 4
+
+def simulate_cutoff(num_links, p_success, cutoff, t2=T2, trials=NUM_TRIALS, seed=0, attempt_time=ATTEMPT_TIME,
+                    max_attempts=MAX_ATTEMPTS):
+    """
+    Vectorized Monte Carlo of one cutoff policy.
+
+    Args:
+        num_links (int): links of the path
+        p_success (float): success probability of one attempt
+        cutoff (float): seconds a stored link may wait, None or math.inf = no cutoff
+        t2 (float): memory coherence time (seconds)
+    Returns:
+        (dict): {"rate": end-to-end pairs/sec, "fidelity": mean fidelity, "time_p95": seconds, "failed": trials};
+                the rate counts the max_attempts attempts every failed trial ran as well
+    """
+    # attempts a stored link may wait (rounded first so that e.g. 1 ms / 20 us is 50, not 49)
+    max_age = None if cutoff is None or math.isinf(cutoff) else math.floor(round(cutoff / attempt_time, 6))
+    rng = np.random.default_rng(seed)
+    age = np.full((trials, num_links), -1, dtype=np.int64) # -1 = link not stored
+    active = np.arange(trials)
+    attempts = np.full(trials, np.nan)
+    final_age = np.zeros((trials, num_links), dtype=np.int64)
+    step = 0
+    while active.size and step < max_attempts:
+        step += 1
+        stored = age >= 0
+        age[stored] += 1
+        if max_age is not None:
+            age[age > max_age] = -1
+        age[(age < 0) & (rng.random(age.shape) < p_success)] = 0
+        done = (age >= 0).all(axis=1)
+        if done.any():
+            attempts[active[done]] = step
+            final_age[active[done]] = age[done]
+            age = age[~done]
+            active = active[~done]
+    finished = ~np.isnan(attempts)
+    times = attempts[finished] * attempt_time
+    fidelity = werner_fidelity(final_age[finished], attempt_time, t2)
+    failed = int(trials - finished.sum())
+    total_time = times.sum() + failed * max_attempts * attempt_time
+    return {"rate": float(finished.sum() / total_time) if finished.any() else 0.0,
+            "fidelity": float(fidelity.mean()) if finished.any() else 0.25,
+            "time_p95": float(np.percentile(times, 95)) if finished.any() else math.inf,
+            "failed": failed}
+
+def _run_job(job):
+    num_links, p_success, t2, cutoff, trials, seed = job
+    result = simulate_cutoff(num_links, p_success, cutoff, t2, trials, seed)
+    return {"num_links": num_links, "p_success": p_success, "t2": t2,
+            "cutoff": math.inf if cutoff is None else cutoff, **result}
+
+def sweep(path_lengths, p_values, t2_values, cutoffs, trials=NUM_TRIALS, workers=None):
+    """
+    Every combination of path length, success probability, coherence time and cutoff, in a process pool.
+
+    Args:
+        cutoffs (list): cutoffs in seconds, None or math.inf = no cutoff
+        workers (int): processes, os.cpu_count() if None, 1 = in this process
+    Returns:
+        (list): one result dict per combination (cutoff in seconds, math.inf = none)
+    """
+    jobs = [(n, p, t2, c, trials, seed) for seed, (n, p, t2, c) in
+            enumerate((n, p, t2, c) for n in path_lengths for p in p_values for t2 in t2_values for c in cutoffs)]
+    if workers == 1:
+        return [_run_job(job) for job in jobs]
+    with ProcessPoolExecutor(workers) as pool:
+        return list(pool.map(_run_job, jobs))
+
+def pareto_front(results):
+    """
+    Results no other result beats in both rate and fidelity, fastest first.
+    """
+    front = []
+    best_fidelity = -1.0
+    for r in sorted(results, key=lambda r: (-r["rate"], -r["fidelity"])):
+        if r["fidelity"] > best_fidelity:
+            front.append(r)
+            best_fidelity = r["fidelity"]
+    return front
+
+def policy_table(results):
+    # results grouped by configuration, every entry marked if it is on its configuration's Pareto front
+    groups = {}
+    for r in results:
+        groups.setdefault((r["num_links"], r["p_success"], r["t2"]), []).append(r)
+    table = []
+    for key in sorted(groups):
+        front = {id(r) for r in pareto_front(groups[key])}
+        for r in sorted(groups[key], key=lambda r: r["cutoff"]):
+            table.append(dict(r, pareto=id(r) in front))
+    return table
+
+def write_policy_table(table, filename=POLICY_FILE):
+    with open(filename, "w") as f:
+        for r in table:
+            f.write(f"{r['num_links']},{r['p_success']},{r['t2']},{r['cutoff']},{r['rate']},{r['fidelity']},{int(r['pareto'])}\n")
+
+def load_policy_table(filename=POLICY_FILE):
+    table = []
+    with open(filename, "r") as f:
+        for line in f:
+            if not line.strip():
+                continue
+            n, p, t2, cutoff, rate, fidelity, pareto = line.strip().split(",")
+            table.append({"num_links": int(n), "p_success": float(p), "t2": float(t2), "cutoff": float(cutoff),
+                          "rate": float(rate), "fidelity": float(fidelity), "pareto": pareto == "1"})
+    return table
+
+def choose_cutoff(table, num_links, p_success, t2, min_fidelity):
+    """
+    Fastest Pareto-optimal cutoff of the closest configuration in the table that meets min_fidelity.
+
+    Returns:
+        (float): cutoff in seconds, None if the fastest entry meeting the target has no cutoff
+    Raises:
+        ValueError: the table is empty or no cutoff of the configuration reaches min_fidelity
+    """
+    configs = {(r["num_links"], r["p_success"], r["t2"]) for r in table}
+    if not configs:
+        raise ValueError("empty cutoff policy table")
+    # closest configuration: same path length if possible, then probability and coherence time on a log scale
+    key = min(configs, key=lambda c: (abs(c[0] - num_links), abs(math.log(c[1] / p_success)) + abs(math.log(c[2] / t2))))
+    candidates = [r for r in table if (r["num_links"], r["p_success"], r["t2"]) == key and r["pareto"]
+                  and r["fidelity"] >= min_fidelity]
+    if not candidates:
+        raise ValueError("no cutoff in the policy table reaches fidelity " + str(min_fidelity) + " for " + str(key))
+    best = max(candidates, key=lambda r: r["rate"])
+    return None if math.isinf(best["cutoff"]) else best["cutoff"]
+
+if __name__ == '__main__':
+    # one configuration: vectorized trials against a per-trial Python loop
+    import random
+    print("-- CUTOFF MONTE CARLO (4 links, p 0.05, cutoff 0.8 ms, " + str(NUM_TRIALS) + " trials) --")
+    t0 = time.perf_counter()
+    result = simulate_cutoff(4, 0.05, 0.8e-3, trials=NUM_TRIALS)
+    vectorized = time.perf_counter() - t0
+    rng = random.Random(0)
+    t0 = time.perf_counter()
+    for _ in range(1000):
+        ages = [-1] * 4
+        while min(ages) < 0:
+            ages = [a + 1 if a >= 0 else a for a in ages]
+            ages = [-1 if a * ATTEMPT_TIME > 0.8e-3 else a for a in ages]
+            ages = [0 if a < 0 and rng.random() < 0.05 else a for a in ages]
+    loop = (time.perf_counter() - t0) * NUM_TRIALS / 1000
+    print("rate ", result["rate"], " pairs/sec, fidelity ", result["fidelity"], " vectorized: ", vectorized,
+          " s, per-trial loop (est.): ", loop, " s")
+
+    PATH_LENGTHS = [2, 4, 8]
+    P_VALUES = [0.05, 0.2]
+    T2_VALUES = [0.01, T2]
+    CUTOFFS = [0.1e-3, 0.2e-3, 0.4e-3, 1e-3, 2e-3, 4e-3, 10e-3, None] # seconds
+    workers = os.cpu_count()
+    t0 = time.perf_counter()
+    results = sweep(PATH_LENGTHS, P_VALUES, T2_VALUES, CUTOFFS, workers=workers)
+    print("-- CUTOFF SWEEP (" + str(len(results)) + " configurations, " + str(workers) + " processes) --")
+    print("wall: ", time.perf_counter() - t0, " s")
+    table = policy_table(results)
+    write_policy_table(table)
+    for n in PATH_LENGTHS:
+        for p in P_VALUES:
+            for t2 in T2_VALUES:
+                front = [r for r in table if (r["num_links"], r["p_success"], r["t2"]) == (n, p, t2) and r["pareto"]]
+                print("-- PARETO FRONT (" + str(n) + " links, p " + str(p) + ", T2 " + str(t2) + " s) --")
+                for r in front:
+                    print("cutoff (ms) ", r["cutoff"] * 1e3, " rate ", round(r["rate"], 1), " pairs/sec, fidelity ",
+                          round(r["fidelity"], 4))
+    loaded = load_policy_table()
+    for target in [0.67, 0.99]:
+        try:
+            print("cutoff for 4 links, p 0.05, T2 0.1 s, fidelity >= ", target, ": ",
+                  choose_cutoff(loaded, 4, 0.05, 0.1, target), " s")
+        except ValueError as e:
+            print("fidelity >= ", target, ": ", e)
@@ -0,0 +1,187 @@
+# Earliest-deadline-first (EDF) scheduling of entanglement requests
+# (README.md: "deterministic scheduling policies")
+# An end-to-end pair is only useful while the nuclear registers holding it are still coherent, so requests carry a
+# deadline: by default arrival + COHERENCE_BUDGET, tighter if the application needs the pairs earlier.
+# EDFQueue keeps the pending requests in a binary heap ordered by deadline:
+# - push / pop are O(log n), also with thousands of pending requests
+# - every decision checks the request against its estimated remaining work (WorkEstimator): a request that can no
+#   longer finish before its deadline is dropped right away instead of occupying links and memory it would waste
+# - a request whose path is busy is skipped (at most max_skips per decision) and pushed back, so one blocked
+#   path does not stall the requests behind it
+# AdmissionQueue(policy="edf") (admission_control.py) runs the requests on the node orchestrator.
+import heapq
+import itertools
+import math
+import time
+from des_kernel import CLASSICAL_DELAY
+from node_orchestration import P_SUCCESS, SLOT_DURATION, PREPARE_TIME, HERALD_DELAY, CNOT_TIME
+from swap_scheduler import SWAP_TIME
+
+COHERENCE_BUDGET = 50e-3 # usable storage time of a nuclear register during network activity
+MAX_SKIPS = 8 # blocked requests skipped per decision before the scheduler gives up
+
+class WorkEstimator:
+    """
+    Expected time to deliver the remaining pairs of a request, for TDMA link generation (one attempt every
+    `period` slots) and nested swapping.
+    """
+    def __init__(self, p_success=P_SUCCESS, period=2, classical_delay=CLASSICAL_DELAY):
+        self.link_time = period * SLOT_DURATION / p_success + PREPARE_TIME + HERALD_DELAY + CNOT_TIME
+        self.classical_delay = classical_delay
+        self._path_time = {} # number of links -> expected time of one end-to-end pair
+
+    def path_time(self, num_links):
+        estimate = self._path_time.get(num_links)
+        if estimate is None:
+            # the last of num_links (roughly exponential) link times: harmonic number times the mean,
+            # then one swap per level of the nested tree and the announcements along the path
+            harmonic = sum(1.0 / k for k in range(1, num_links + 1))
+            levels = math.ceil(math.log2(num_links)) if num_links > 1 else 0
+            estimate = harmonic * self.link_time + levels * SWAP_TIME + num_links * self.classical_delay
+            self._path_time[num_links] = estimate
+        return estimate
+
+    def remaining(self, request):
+        return (request.num_pairs - request.pairs_done) * self.path_time(len(request.route) - 1)
+
+class EDFQueue:
+    def __init__(self, loop, estimator=None, on_drop=None, max_skips=MAX_SKIPS):
+        """
+        Args:
+            loop (EventLoop): clock of the feasibility checks
+            estimator (WorkEstimator): remaining work of a request
+            on_drop (function): on_drop(request) for every request dropped as infeasible
+        """
+        self.loop = loop
+        self.estimator = estimator if estimator is not None else WorkEstimator()
+        self.on_drop = on_drop
+        self.max_skips = max_skips
+        self._heap = [] # (deadline, sequence number, request)
+        self._seq = itertools.count()
+        self.stats = {"pushed": 0, "started": 0, "dropped": 0, "skipped": 0}
+
+    def __len__(self):
+        return len(self._heap)
+
+    def feasible(self, request, now=None):
+        now = self.loop.now() if now is None else now
+        return now + self.estimator.remaining(request) <= request.deadline
+
+    def push(self, request):
+        """
+        Returns:
+            (bool): False if the request cannot meet its deadline any more, it is not queued then
+        """
+        if not self.feasible(request):
+            self._drop(request)
+            return False
+        heapq.heappush(self._heap, (request.deadline, next(self._seq), request))
+        self.stats["pushed"] += 1
+        return True
+
+    def _drop(self, request):
+        request.status = "dropped_infeasible"
+        self.stats["dropped"] += 1
+        if self.on_drop is not None:
+            self.on_drop(request)
+
+    def pop(self, can_start=None):
+        """
+        Next request to start: the earliest deadline that is still feasible and whose path can start.
+
+        Args:
+            can_start (function): can_start(route), False while the path is at capacity
+        Returns:
+            (EntanglementRequest): the request, None if no pending request can start now
+        """
+        now = self.loop.now()
+        skipped = []
+        chosen = None
+        heap = self._heap
+        while heap:
+            entry = heapq.heappop(heap)
+            request = entry[2]
+            if not self.feasible(request, now):
+                self._drop(request)
+                continue
+            if can_start is not None and not can_start(request.route):
+                skipped.append(entry)
+                if len(skipped) >= self.max_skips:
+                    break
+                continue
+            chosen = request
+            break
+        self.stats["skipped"] += len(skipped)
+        for entry in skipped:
+            heapq.heappush(heap, entry)
+        if chosen is not None:
+            self.stats["started"] += 1
+        return chosen
+
+def deadline_report(requests):
+    """
+    Returns:
+        (dict): requests with a deadline, dropped as infeasible, failed, finished late, and the deadline-miss ratio
+                (dropped + rejected + failed + late + unfinished) / requests
+    """
+    with_deadline = [r for r in requests if r.deadline is not None]
+    dropped = sum(1 for r in with_deadline if r.status == "dropped_infeasible")
+    rejected = sum(1 for r in with_deadline if r.status.startswith("rejected"))
+    failed = sum(1 for r in with_deadline if r.status == "failed")
+    late = sum(1 for r in with_deadline if r.status == "done" and r.finished > r.deadline)
+    unfinished = sum(1 for r in with_deadline if r.status in ("queued", "running"))
+    missed = dropped + rejected + failed + late + unfinished
+    return {"requests": len(with_deadline), "dropped": dropped, "rejected": rejected, "failed": failed, "late": late,
+            "unfinished": unfinished, "miss_ratio": missed / len(with_deadline) if with_deadline else 0.0}
+
+if __name__ == '__main__':
+    import random
+    from admission_control import EntanglementRequest
+    from des_kernel import Simulator
+    # O(log n) decisions with many pending requests
+    rng = random.Random(1)
+    route = ["node" + str(i) for i in range(5)]
+    for pending in [1000, 10000, 100000]:
+        sim = Simulator(seed=1)
+        queue = EDFQueue(sim)
+        requests = [EntanglementRequest(i, "t", route, 1, 0.0, deadline=rng.uniform(0.01, 10.0))
+                    for i in range(pending)]
+        t0 = time.perf_counter()
+        for request in requests:
+            queue.push(request)
+        push_time = time.perf_counter() - t0
+        t0 = time.perf_counter()
+        while queue.pop() is not None:
+            pass
+        pop_time = time.perf_counter() - t0
+        print("-- EDF QUEUE (" + str(pending) + " pending requests) --")
+        print("push (us/request) ", push_time / pending * 1e6, " pop (us/decision) ", pop_time / pending * 1e6)
+
+    # deadline-miss ratio of the scheduling policies on the same workload (deadlines 5 .. 50 ms after arrival)
+    from admission_control import AdmissionQueue, POLICIES
+    from node_orchestration import NodeOrchestrator
+    HORIZON = 0.2
+    route = ["node" + str(i) for i in range(7)]
+    TENANTS = {"bulk": (route, 8, 300.0), "app1": (route[1:4], 2, 150.0), "app2": (route[3:7], 2, 150.0),
+               "app3": (route[0:3], 2, 150.0)}
+    for policy in POLICIES:
+        sim = Simulator(seed=1)
+        orchestrator = NodeOrchestrator(sim, seed=1)
+        for node_id in route:
+            orchestrator.add_node(node_id)
+        queue = AdmissionQueue(orchestrator, policy, overcommit=8.0)
+        rng = random.Random(1)
+        for tenant, (path, num_pairs, rate) in TENANTS.items():
+            t = rng.expovariate(rate)
+            while t < HORIZON:
+                sim.call_at(t, lambda tenant, path, num_pairs, slack: queue.submit(tenant, path, num_pairs,
+                                                                                   sim.now() + slack),
+                            tenant, path, num_pairs, rng.uniform(5e-3, COHERENCE_BUDGET))
+                t += rng.expovariate(rate)
+        t0 = time.perf_counter()
+        sim.run(until=HORIZON + COHERENCE_BUDGET)
+        report = deadline_report(queue.requests)
+        print("-- DEADLINES (" + policy + ", " + str(report["requests"]) + " requests) --")
+        print("deadline-miss ratio ", round(report["miss_ratio"], 3), " dropped early ", report["dropped"],
+              " late ", report["late"], " rejected ", report["rejected"], " unfinished ", report["unfinished"],
+              " pairs delivered ", queue.stats["pairs"], " wall: ", time.perf_counter() - t0, " s")
@@ -0,0 +1,199 @@
+# Virtual-time discrete-event kernel for the control plane
+# All latency measured so far is wall-clock time through QuNetSim threads, so a run is bounded by real time and
+# by OS scheduling noise (each handshake trial takes 2-7 s in *_overall_latency.txt).
+# In discrete-event mode:
+# - time is a virtual clock that jumps from one event to the next (Simulator = EventLoop that never sleeps)
+# - handshake steps, classical message delivery, entanglement attempts and heralds are scheduled events
+#   with modeled durations
+# - crypto and transmission costs are drawn from calibration tables built from the measured trial files
+# - every random choice comes from a seeded generator, so a campaign is reproducible
+import random
+import time
+from node_orchestration import EventLoop, NodeOrchestrator, SLOT_DURATION
+
+# measured "trial,seconds" files of every scheme (paths relative to src/, where the handshake scripts write them)
+SCHEME_FILES = {
+    "pqc": {"pk_transmission": "pqc_pk_latency.txt", "ct_transmission": "pqc_ct_latency.txt"},
+    "rsa": {"pk_transmission": "latency_test_cases/rsa/rsa_pk_latency.txt",
+            "ct_transmission": "latency_test_cases/rsa/rsa_ct_latency.txt"},
+    "send1byte": {"pk_transmission": "latency_test_cases/send1byte/1byte_pk_latency.txt",
+                  "ct_transmission": "latency_test_cases/send1byte/1byte_ct_latency.txt"},
+}
+
+# CPU cost of every handshake step in seconds (liboqs ML-KEM-768 / ML-DSA-44 on x86-64, see PQC Tests/PQC_avg_time.py)
+CRYPTO_COSTS = {
+    "pqc": {"keygen": 30e-6, "encaps": 35e-6, "sign": 110e-6, "verify": 40e-6, "decaps": 30e-6, "hmac": 2e-6},
+    "rsa": {"keygen": 60e-3, "encaps": 40e-6, "sign": 1.2e-3, "verify": 40e-6, "decaps": 1.2e-3, "hmac": 2e-6},
+    "ecdh": {"keygen": 0.6e-3, "encaps": 0.0, "sign": 0.0, "verify": 0.0, "decaps": 0.6e-3, "hmac": 2e-6},
+    "send1byte": {"keygen": 0.0, "encaps": 0.0, "sign": 0.0, "verify": 0.0, "decaps": 0.0, "hmac": 0.0},
+}
+
+CLASSICAL_DELAY = 50e-6 # one classical control message between neighbours (10 km of fiber)
+DEFAULT_TRANSMISSION = 50e-6 # used for a transmission step without measured samples
+
+def load_samples(filename):
+    # values of a "trial,seconds" file, [] if it does not exist
+    try:
+        with open(filename, "r") as f:
+            return [float(line.strip().split(",")[1]) for line in f if line.strip()]
+    except FileNotFoundError:
+        return []
+
+class VirtualClock:
+    def __init__(self, start=0.0):
+        self.now = start
+
+    def __call__(self):
+        return self.now
+
+    def advance(self, when):
+        if when > self.now:
+            self.now = when
+
+class Simulator(EventLoop):
+    """
+    EventLoop on a virtual clock: instead of sleeping until the next event, the clock jumps to it.
+    Everything written for EventLoop (e.g. NodeOrchestrator) runs unchanged in virtual time.
+    """
+    def __init__(self, seed=0, record_dispatch=False):
+        self.virtual_clock = VirtualClock()
+        super().__init__(clock=self.virtual_clock, record_dispatch=record_dispatch)
+        self.rng = random.Random(seed)
+
+    def _wait_until(self, when):
+        self.virtual_clock.advance(when)
+
+class CalibrationTable:
+    """
+    Modeled durations of handshake steps for one scheme: crypto costs are constants,
+    transmissions are drawn (bootstrap) from the measured samples with the simulator's RNG.
+    """
+    def __init__(self, scheme="pqc", samples=None, crypto=None):
+        self.scheme = scheme
+        self.crypto = dict(CRYPTO_COSTS.get(scheme, CRYPTO_COSTS["send1byte"]) if crypto is None else crypto)
+        self.samples = samples if samples is not None else {}
+
+    @classmethod
+    def from_files(cls, scheme):
+        samples = {name: load_samples(path) for name, path in SCHEME_FILES.get(scheme, {}).items()}
+        return cls(scheme, {name: values for name, values in samples.items() if values})
+
+    def crypto_cost(self, step):
+        return self.crypto.get(step, 0.0)
+
+    def transmission(self, name, rng):
+        values = self.samples.get(name)
+        if not values:
+            return DEFAULT_TRANSMISSION
+        return values[rng.randrange(len(values))]
+
+def simulate_handshake(sim, calibration, initiator, peer, on_done):
+    """
+    Schedules the steps of one handshake (same order as handshake_with_node) as events:
+    SYN -> keygen -> PK -> encaps + sign -> CT -> verify + decaps -> FIN -> done.
+    on_done(initiator, peer, start_time, end_time) is called at the virtual time the FIN is verified.
+    """
+    start = sim.now()
+    rng = sim.rng
+    c = calibration
+    steps = [
+        CLASSICAL_DELAY, # PQC_SYN
+        c.crypto_cost("keygen"),
+        CLASSICAL_DELAY + c.transmission("pk_transmission", rng), # PQC_SEND_PK
+        c.crypto_cost("encaps") + c.crypto_cost("sign"),
+        CLASSICAL_DELAY + c.transmission("ct_transmission", rng), # PQC_SEND_CT
+        c.crypto_cost("verify") + c.crypto_cost("decaps"),
+        CLASSICAL_DELAY + 2 * c.crypto_cost("hmac"), # FIN + verify_finished
+    ]
+
+    def next_step(i):
+        if i == len(steps):
+            on_done(initiator, peer, start, sim.now())
+            return
+        sim.call_later(steps[i], next_step, i + 1)
+
+    next_step(0)
+
+def simulate_path_handshake(sim, calibration, route, on_done):
+    # parallel handshakes of the initiator (route[0]) with every node on the route, like pqc_handshake
+    pending = set(route[1:])
+    start = sim.now()
+
+    def node_done(initiator, peer, _start, end):
+        pending.discard(peer)
+        if not pending:
+            on_done(route, start, end)
+
+    for node_id in route[1:]:
+        simulate_handshake(sim, calibration, route[0], node_id, node_done)
+
+def run_attempt_campaign(sim, num_nodes, target_attempts, seed=0, attempt_model=None, fast_forward=False):
+    """
+    Chain of num_nodes NV nodes whose links keep generating entanglement until target_attempts attempts were made.
+    Every stored link is consumed right away and the link starts again in its next TDMA slot.
+
+    Returns:
+        (NodeOrchestrator): orchestrator with per-node attempt/stored counters
+    """
+    orchestrator = NodeOrchestrator(sim, seed=seed, attempt_model=attempt_model, fast_forward=fast_forward)
+    node_ids = ["node" + str(i) for i in range(num_nodes)]
+    for node_id in node_ids:
+        orchestrator.add_node(node_id)
+    totals = {"attempts": 0}
+
+    def restart(request, success):
+        if request.node_id < request.peer:
+            totals["attempts"] += request.attempts # count every link attempt once
+        if success:
+            # consume the stored link so the register is free again
+            orchestrator.consume(request.node_id, request.register)
+        if totals["attempts"] < target_attempts:
+            message = ("START_ENTANGLEMENT", request.peer, request.register, request.slot + request.period, request.period)
+            orchestrator.handle_message(request.node_id, message, on_done=restart)
+
+    for i, (a, b) in enumerate(zip(node_ids, node_ids[1:])):
+        register = (i % 2) * 2
+        message = ("START_ENTANGLEMENT", b, register, 1 + (i % 2), 2)
+        orchestrator.handle_message(a, message, on_done=restart)
+        orchestrator.handle_message(b, ("START_ENTANGLEMENT", a) + message[2:], on_done=restart)
+    sim.run()
+    return orchestrator
+
+if __name__ == '__main__':
+    NUM_TRIALS = 1000
+    route = ["Alice", "Bob", "Cathy", "Dave", "Eva"]
+    for scheme in ["pqc", "rsa", "send1byte"]:
+        sim = Simulator(seed=1)
+        calibration = CalibrationTable.from_files(scheme)
+        latencies = []
+
+        def trial_done(route, start, end):
+            latencies.append(end - start)
+
+        t0 = time.perf_counter()
+        for trial in range(NUM_TRIALS):
+            simulate_path_handshake(sim, calibration, route, trial_done)
+            sim.run()
+        wall = time.perf_counter() - t0
+        latencies.sort()
+        print("-- " + scheme.upper() + " PATH HANDSHAKE (virtual time, " + str(NUM_TRIALS) + " trials) --")
+        print("mean/median/p95 (ms): ", (sum(latencies) / len(latencies) * 1e3, latencies[len(latencies) // 2] * 1e3,
+                                         latencies[int(len(latencies) * 0.95) - 1] * 1e3))
+        print("wall time: ", wall, " s")
+
+    from attempt_model import AttemptModel
+    campaigns = [(100000, "per-attempt", None, False), (1000000, "per-attempt", None, False),
+                 (1000000, "vectorized", AttemptModel(seed=1), False), (10000000, "vectorized fast-forward", AttemptModel(seed=1), True)]
+    for target, name, attempt_model, fast_forward in campaigns:
+        sim = Simulator(seed=1)
+        t0 = time.perf_counter()
+        orchestrator = run_attempt_campaign(sim, 10, target, attempt_model=attempt_model, fast_forward=fast_forward)
+        wall = time.perf_counter() - t0
+        attempts = sum(n.stats["attempts"] for n in orchestrator.nodes.values()) // 2
+        stored = sum(n.stats["stored"] for n in orchestrator.nodes.values()) // 2
+        print("-- ENTANGLEMENT CAMPAIGN (" + str(target) + " attempts, " + name + ") --")
+        print("link attempts: ", attempts, " links stored: ", stored)
+        print("virtual time: ", sim.now(), " s (", sim.now() / SLOT_DURATION, " slots ), wall time: ", wall, " s")
+        print("events: ", sim.events_dispatched, " events/sec: ", sim.events_dispatched / wall)
+        # QuNetSim needs one send_epr(await_ack=True) round trip of wall-clock time per attempt instead
+        print("wall time per attempt: ", wall / max(1, attempts) * 1e6, " us")
@@ -0,0 +1,463 @@
+# Entanglement distillation (DEJMPS purification) of low-fidelity links before swapping
+# Links that waited in memory close to their cutoff may be too noisy for the swap: the end-to-end pair then misses
+# the application's target fidelity and the links were generated for nothing. A purification round trades two
+# stored pairs of the SAME link for one better pair:
+# - both ends apply CNOT from the kept pair onto the sacrificed pair and measure the sacrificed one
+# - the ends compare their parities: equal = the kept pair is better (fidelity from dejmps()), else both are lost
+# DistillationScheduler runs the rounds of every link, keyed on the fidelity estimates of the node memory
+# (MemoryPool, quantum_memory.py): stored pairs below the link threshold are paired by fidelity and distilled, also
+# repeatedly, pairs at or above it are handed out with take(). Both ends derive the same pairing from state they
+# share (the heralded store times and fidelities), so only the parities travel: all rounds a link runs in one
+# scheduling pass (or within batch_window) are compared with ONE authenticated message per end,
+#   header (link id, batch sequence number, first round, rounds) | parity bitmap | HMAC tag
+# instead of one message per round and end. The receiver rejects sequence numbers it has already seen (replay).
+# Fidelities are kept in Werner form (the output of a round is twirled), like everywhere else in the memory model.
+import hashlib
+import hmac
+import struct
+import time
+from des_kernel import CLASSICAL_DELAY
+from node_orchestration import CNOT_TIME, GATE_TIME
+from swap_aggregation import MESSAGE_OVERHEAD, HMAC_TIME, Inbox
+
+PARITY_BATCH = "PARITY_BATCH"
+PARITY_HEADER = struct.Struct(">QIIH") # link id, batch sequence number, first round, number of rounds
+TAG_SIZE = 32
+DISTILL_TIME = CNOT_TIME + GATE_TIME # local CNOT and measurement of one round
+MAX_BATCH = 64 # rounds per parity message, a full batch is sent right away
+
+def werner(fidelity):
+    # Bell-diagonal coefficients (PHI_PLUS, PSI_MINUS, PSI_PLUS, PHI_MINUS) of a Werner state
+    rest = (1 - fidelity) / 3
+    return (fidelity, rest, rest, rest)
+
+def dejmps(first, second):
+    """
+    One DEJMPS round on two Bell-diagonal pairs.
+
+    Args:
+        first, second (tuple): coefficients (PHI_PLUS, PSI_MINUS, PSI_PLUS, PHI_MINUS)
+    Returns:
+        (tuple): (coefficients of the kept pair if the parities agree, probability that they agree)
+    """
+    a1, b1, c1, d1 = first
+    a2, b2, c2, d2 = second
+    n = (a1 + b1) * (a2 + b2) + (c1 + d1) * (c2 + d2)
+    return ((a1 * a2 + b1 * b2) / n, (c1 * d2 + d1 * c2) / n, (c1 * c2 + d1 * d2) / n, (a1 * b2 + b1 * a2) / n), n
+
+def distilled_fidelity(f1, f2):
+    """
+    Returns:
+        (tuple): (fidelity of the kept pair on success, success probability) for two Werner pairs
+    """
+    coefficients, p_success = dejmps(werner(f1), werner(f2))
+    return coefficients[0], p_success
+
+def link_threshold(target, num_links):
+    # link fidelity every link of a path needs for an end-to-end pair at `target` (Werner parameters multiply)
+    p = max(0.0, (4 * target - 1) / 3) ** (1.0 / num_links)
+    return (1 + 3 * p) / 4
+
+def _tag(mac_key, body):
+    return hmac.new(mac_key, PARITY_BATCH.encode() + body, hashlib.sha256).digest()
+
+def encode_parities(link_id, seq, first_round, parities, mac_key):
+    """
+    Args:
+        parities (list): parity bit of rounds first_round, first_round + 1, ...
+    Returns:
+        (bytes): header | parity bitmap (bit i = round first_round + i) | tag
+    """
+    bitmap = 0
+    for i, bit in enumerate(parities):
+        bitmap |= bit << i
+    body = PARITY_HEADER.pack(link_id, seq, first_round, len(parities)) + bitmap.to_bytes(-(-len(parities) // 8), "big")
+    return body + _tag(mac_key, body)
+
+def decode_parities(blob, mac_key):
+    """
+    Returns:
+        (tuple): (link id, batch sequence number, first round, parity bits), None if the message does not verify
+    """
+    body, tag = blob[:-TAG_SIZE], blob[-TAG_SIZE:]
+    if not hmac.compare_digest(tag, _tag(mac_key, body)):
+        print("Parity batch authentication failed!")
+        return None
+    link_id, seq, first_round, count = PARITY_HEADER.unpack_from(body, 0)
+    bitmap = int.from_bytes(body[PARITY_HEADER.size:], "big")
+    return link_id, seq, first_round, [(bitmap >> i) & 1 for i in range(count)]
+
+class StoredPair:
+    __slots__ = ("registers", "stored_at", "busy")
+
+    def __init__(self, registers, stored_at):
+        self.registers = registers # (register at the first end, register at the second end)
+        self.stored_at = stored_at # store time at each end, tells a live pair from a reused register
+        self.busy = False # in a purification round
+
+class DistillRound:
+    __slots__ = ("keep", "sacrifice", "started", "fidelity", "expected", "parities", "pending", "lost")
+
+    def __init__(self, keep, sacrifice, started, fidelity, expected):
+        self.keep = keep
+        self.sacrifice = sacrifice
+        self.started = started
+        self.fidelity = fidelity # of the kept pair if the parities agree, at `started`
+        self.expected = expected # parity difference of agreeing ends (x bits of the Pauli frames)
+        self.parities = {} # end node -> measured parity bit
+        self.pending = 2 # ends that have not received the other end's parity yet
+        self.lost = False # a half of the kept pair expired while the parities were on their way
+
+class DistilledLink:
+    __slots__ = ("ends", "link_id", "mac_key", "pairs", "rounds", "next_round", "batch", "flush", "send_seq",
+                 "recv_seq")
+
+    def __init__(self, ends, link_id, mac_key):
+        self.ends = ends
+        self.link_id = link_id
+        self.mac_key = mac_key
+        self.pairs = [] # StoredPair
+        self.rounds = {} # round number -> DistillRound waiting for its parities
+        self.next_round = 0
+        self.batch = [] # round numbers measured and not sent yet
+        self.flush = None # event sending the batch
+        self.send_seq = {end: 0 for end in ends}
+        self.recv_seq = {end: 0 for end in ends}
+
+class DistillationScheduler:
+    def __init__(self, orchestrator, threshold, batch=True, batch_window=0.0, max_batch=MAX_BATCH, on_ready=None,
+                 on_release=None):
+        """
+        Args:
+            orchestrator (NodeOrchestrator): holds the pairs; with pauli_frame=True the swaps carry the fidelities on
+            threshold (float): pairs below it are distilled, at or above it they can be taken (0 = no distillation)
+            batch (bool): compare the parities of a scheduling pass in one message per end, else one per round
+            batch_window (float): seconds a batch waits for more rounds of its link
+            on_ready (function): on_ready(a, b) when a pair of the link reached the threshold
+            on_release (function): on_release(a, b) when registers of the link were freed (rounds, take, expiry)
+        """
+        self.orchestrator = orchestrator
+        self.loop = orchestrator.loop
+        self.threshold = threshold
+        self.batch = batch
+        self.batch_window = batch_window
+        self.max_batch = max_batch if batch else 1
+        self.on_ready = on_ready
+        self.on_release = on_release
+        self.links = {} # (a, b) -> DistilledLink, both orientations
+        self.inboxes = {} # node_id -> Inbox, parity messages are processed one at a time
+        self.stats = {"rounds": 0, "succeeded": 0, "failed": 0, "lost": 0, "messages": 0, "bytes": 0, "rejected": 0}
+
+    def add_link(self, a, b, mac_key):
+        link = DistilledLink((a, b), len(self.links) // 2, mac_key)
+        self.links[(a, b)] = link
+        self.links[(b, a)] = link
+        for node_id in (a, b):
+            if node_id not in self.inboxes:
+                self.inboxes[node_id] = Inbox(self.loop)
+        return link
+
+    def _fidelity(self, link, pair):
+        return self.orchestrator.fidelity(link.ends[0], pair.registers[0])
+
+    def _live(self, link, pair, end=0):
+        # the register at link.ends[end] still holds the pair (not expired by a cutoff or a fidelity floor)
+        content = self.orchestrator.memory[link.ends[end]].content[pair.registers[end]]
+        return content is not None and content["stored_at"] == pair.stored_at[end]
+
+    def stored(self, a, b, register_a, register_b):
+        # a link-level pair between a and b was stored
+        link = self.links[(a, b)]
+        registers = (register_a, register_b) if link.ends[0] == a else (register_b, register_a)
+        memory = self.orchestrator.memory
+        stored_at = tuple(memory[end].content[register]["stored_at"] for end, register in zip(link.ends, registers))
+        link.pairs.append(StoredPair(registers, stored_at))
+        self._schedule(link)
+
+    def count(self, a, b):
+        return len(self.links[(a, b)].pairs)
+
+    def _best(self, link):
+        # free pair of the link with the highest fidelity at or above the threshold
+        self._prune(link)
+        best, best_fidelity = None, self.threshold
+        for pair in link.pairs:
+            if not pair.busy:
+                fidelity = self._fidelity(link, pair)
+                if fidelity >= best_fidelity:
+                    best, best_fidelity = pair, fidelity
+        if best is None:
+            self._schedule(link) # pairs may have decayed below the threshold since the last pass
+        return best
+
+    def ready(self, a, b):
+        return self._best(self.links[(a, b)]) is not None
+
+    def take(self, a, b):
+        """
+        Best pair of the link at or above the threshold, it leaves the scheduler (the registers stay stored).
+
+        Returns:
+            (dict): node_id -> register, None if no pair of the link is good enough
+        """
+        link = self.links[(a, b)]
+        best = self._best(link)
+        if best is None:
+            return None
+        link.pairs.remove(best)
+        return dict(zip(link.ends, best.registers))
+
+    def _prune(self, link):
+        live = [pair for pair in link.pairs if pair.busy or self._live(link, pair)]
+        if len(live) < len(link.pairs):
+            link.pairs = live
+            if self.on_release is not None:
+                self.on_release(*link.ends)
+
+    def _schedule(self, link):
+        # one pass: pair up the free pairs below the threshold, closest fidelities together, and start their rounds
+        self._prune(link)
+        candidates = []
+        for pair in link.pairs:
+            if not pair.busy:
+                fidelity = self._fidelity(link, pair)
+                if fidelity < self.threshold:
+                    candidates.append((fidelity, pair))
+        candidates.sort(key=lambda c: -c[0])
+        for i in range(0, len(candidates) - 1, 2):
+            (f1, keep), (f2, sacrifice) = candidates[i], candidates[i + 1]
+            fidelity, p_success = distilled_fidelity(f1, f2)
+            if fidelity <= f1:
+                continue # both too noisy, a round would make the better pair worse
+            self._start_round(link, keep, sacrifice, fidelity, p_success)
+        if link.batch and link.flush is None:
+            link.flush = self.loop.call_later(DISTILL_TIME + self.batch_window, self._send, link)
+
+    def _start_round(self, link, keep, sacrifice, fidelity, p_success):
+        orchestrator = self.orchestrator
+        frames = orchestrator.frames
+        expected = 0
+        if frames is not None:
+            end = (link.ends[0], keep.registers[0]), (link.ends[0], sacrifice.registers[0])
+            expected = ((frames.frame(end[0]) or 0) ^ (frames.frame(end[1]) or 0)) & 1
+        number = link.next_round
+        link.next_round += 1
+        round_ = DistillRound(keep, sacrifice, self.loop.now(), fidelity, expected)
+        # the measured parities: the first end's bit is random, the second agrees (up to the frames) with p_success
+        first = orchestrator.rng.getrandbits(1)
+        agree = orchestrator.rng.random() < p_success
+        round_.parities = {link.ends[0]: first, link.ends[1]: first ^ expected ^ (0 if agree else 1)}
+        for end, keep_register, sacrifice_register in zip(link.ends, keep.registers, sacrifice.registers):
+            orchestrator.distill(end, keep_register, sacrifice_register)
+        keep.busy = True
+        link.pairs.remove(sacrifice)
+        link.rounds[number] = round_
+        link.batch.append(number)
+        self.stats["rounds"] += 1
+        if len(link.batch) >= self.max_batch:
+            if link.flush is not None:
+                self.loop.cancel(link.flush)
+            link.flush = self.loop.call_later(DISTILL_TIME, self._send, link)
+
+    def _send(self, link):
+        # the parities of the measured rounds, one authenticated message per end (or per round and end)
+        link.flush = None
+        numbers, link.batch = link.batch, []
+        for start in range(0, len(numbers), self.max_batch):
+            chunk = numbers[start:start + self.max_batch]
+            for sender, receiver in (link.ends, link.ends[::-1]):
+                link.send_seq[sender] += 1
+                blob = encode_parities(link.link_id, link.send_seq[sender], chunk[0],
+                                       [link.rounds[n].parities[sender] for n in chunk], link.mac_key)
+                self.stats["messages"] += 1
+                self.stats["bytes"] += len(blob)
+                self.loop.call_later(HMAC_TIME + CLASSICAL_DELAY, self._arrive, link, sender, receiver, blob)
+
+    def _arrive(self, link, sender, receiver, blob):
+        self.inboxes[receiver].receive(len(blob), MESSAGE_OVERHEAD + HMAC_TIME,
+                                       lambda: self._receive(link, sender, receiver, blob))
+
+    def _receive(self, link, sender, receiver, blob):
+        decoded = decode_parities(blob, link.mac_key)
+        if decoded is None or decoded[1] <= link.recv_seq[receiver]:
+            self.stats["rejected"] += 1
+            return
+        link_id, seq, first_round, parities = decoded
+        link.recv_seq[receiver] = seq
+        released = ready = False
+        for number, parity in zip(range(first_round, first_round + len(parities)), parities):
+            round_ = link.rounds.get(number)
+            if round_ is None or not self._resolve(link, round_, receiver, parity):
+                continue
+            del link.rounds[number]
+            # both ends know the outcome now
+            if round_.lost:
+                # a half expired (and its register may be reused): the kept pair is gone at both ends
+                self.stats["lost"] += 1
+                for end, (node_id, register) in enumerate(zip(link.ends, round_.keep.registers)):
+                    if self._live(link, round_.keep, end):
+                        self.orchestrator.drop(node_id, register)
+                link.pairs.remove(round_.keep)
+                released = True
+            elif (round_.parities[receiver] ^ parity) == round_.expected:
+                self.stats["succeeded"] += 1
+                round_.keep.busy = False
+                ready |= self._fidelity(link, round_.keep) >= self.threshold
+            else:
+                self.stats["failed"] += 1
+                link.pairs.remove(round_.keep)
+                released = True
+        self._schedule(link)
+        if released and self.on_release is not None:
+            self.on_release(*link.ends)
+        if ready and self.on_ready is not None:
+            self.on_ready(*link.ends)
+
+    def _resolve(self, link, round_, receiver, parity):
+        """
+        The receiver compares the other end's parity with its own and updates or drops its half of the kept pair.
+        A half that expired while the parities were on their way is left alone, the round is lost.
+
+        Returns:
+            (bool): True once both ends resolved the round
+        """
+        end = link.ends.index(receiver)
+        register = round_.keep.registers[end]
+        if not self._live(link, round_.keep, end):
+            round_.lost = True # the register is free or holds another pair by now
+        elif (round_.parities[receiver] ^ parity) == round_.expected:
+            memory = self.orchestrator.memory[receiver]
+            memory.set_pair(register, int(memory.record["frame"][register]), round_.fidelity, round_.started)
+        else:
+            self.orchestrator.drop(receiver, register)
+        round_.pending -= 1
+        return round_.pending == 0
+
+if __name__ == '__main__':
+    import os
+    from des_kernel import Simulator
+    from node_orchestration import NodeOrchestrator
+    # A - R - B: links generated back to back, distilled on their own link, swapped at R as soon as both links have
+    # a pair at the link threshold; a delivery counts if the end-to-end pair reaches the target fidelity
+    HORIZON = 0.5
+    PAIRS_PER_LINK = 8 # registers of one link end
+    TARGETS = [0.75, 0.8, 0.85, 0.88]
+    VARIANTS = ["none", "per-round", "batched"]
+    # rounds of one link start one generated pair apart (~0.1 ms here), so with no window a batch rarely holds more
+    # than one round; waiting 0.5 ms groups a few rounds per message at the cost of that much delivery latency
+    BATCH_WINDOW = 500e-6
+
+    def run(target, variant, seed=1):
+        sim = Simulator(seed=seed)
+        orchestrator = NodeOrchestrator(sim, seed=seed, pauli_frame=True)
+        route = ["A", "R", "B"]
+        orchestrator.add_node("A", PAIRS_PER_LINK)
+        orchestrator.add_node("R", 2 * PAIRS_PER_LINK)
+        orchestrator.add_node("B", PAIRS_PER_LINK)
+        links = [("A", "R"), ("R", "B")]
+        generating = set()
+        report = {"delivered": 0, "swapped": 0, "fidelity": 0.0}
+
+        def generate(a, b):
+            if (a, b) in generating or scheduler.count(a, b) >= PAIRS_PER_LINK:
+                return
+            generating.add((a, b))
+            ends = {} # node_id -> register of an end that stored its half
+            outstanding = {} # node_id -> LinkRequest that has not finished yet
+            attempt = {"failed": False}
+
+            def done(request, success):
+                # whichever end fails, the attempt ends once both ends reported (or were cancelled)
+                del outstanding[request.node_id]
+                if success:
+                    ends[request.node_id] = request.register
+                elif not attempt["failed"]:
+                    attempt["failed"] = True
+                    for other in list(outstanding.values()):
+                        orchestrator.cancel(other)
+                        del outstanding[other.node_id]
+                if outstanding:
+                    return
+                generating.discard((a, b))
+                if attempt["failed"]:
+                    for end, register in ends.items():
+                        orchestrator.drop(end, register)
+                else:
+                    scheduler.stored(a, b, ends[a], ends[b])
+                    deliver()
+                generate(a, b)
+
+            slot = orchestrator.next_slot() + 1
+            slot += (links.index((a, b)) - slot) % 2 # the links of R attempt in alternating slots
+            outstanding[a] = orchestrator.handle_message(a, ("START_ENTANGLEMENT", b, None, slot, 2), on_done=done)
+            outstanding[b] = orchestrator.handle_message(b, ("START_ENTANGLEMENT", a, None, slot, 2), on_done=done)
+
+        def deliver(*_):
+            while scheduler.ready("A", "R") and scheduler.ready("R", "B"):
+                left = scheduler.take("A", "R")
+                right = scheduler.take("R", "B")
+                orchestrator.swap("R", left["R"], right["R"], orchestrator.rng.getrandbits(1),
+                                  orchestrator.rng.getrandbits(1))
+                fidelity = orchestrator.fidelity("A", left["A"])
+                orchestrator.consume("A", left["A"])
+                orchestrator.consume("B", right["B"])
+                report["swapped"] += 1
+                report["fidelity"] += fidelity
+                if fidelity >= target:
+                    report["delivered"] += 1
+                for a, b in links:
+                    generate(a, b)
+
+        threshold = 0.0 if variant == "none" else link_threshold(target, len(links))
+        scheduler = DistillationScheduler(orchestrator, threshold, batch=variant == "batched",
+                                          batch_window=BATCH_WINDOW if variant == "batched" else 0.0,
+                                          on_ready=deliver, on_release=generate)
+        for a, b in links:
+            scheduler.add_link(a, b, os.urandom(32))
+            generate(a, b)
+        t0 = time.perf_counter()
+        sim.run(until=HORIZON)
+        report["wall"] = time.perf_counter() - t0
+        report["stats"] = scheduler.stats
+        return report
+
+    for target in TARGETS:
+        print("-- DISTILLATION (A - R - B, target fidelity " + str(target) + ", link threshold " +
+              str(round(link_threshold(target, 2), 4)) + ", " + str(HORIZON) + " s, batch window " +
+              str(BATCH_WINDOW * 1e3) + " ms) --")
+        for variant in VARIANTS:
+            report = run(target, variant)
+            stats = report["stats"]
+            print(variant, ": deliveries/sec at target ", report["delivered"] / HORIZON, " mean fidelity ",
+                  round(report["fidelity"] / max(1, report["swapped"]), 4), " rounds ", stats["rounds"],
+                  " succeeded ", stats["succeeded"], " parity messages ", stats["messages"], " (",
+                  stats["bytes"], " bytes, ", round(stats["messages"] / max(1, stats["rounds"]), 2),
+                  " per round) wall: ", report["wall"], " s")
+
+    # a backlog: pairs that waited close to the cutoff and decayed, all distilled at once, level by level
+    BACKLOG = 64
+    print("-- DISTILLATION BACKLOG (" + str(BACKLOG) + " stored pairs at fidelity 0.8, threshold 0.9) --")
+    for variant in ["per-round", "batched"]:
+        sim = Simulator(seed=1)
+        orchestrator = NodeOrchestrator(sim, seed=1, pauli_frame=True)
+        orchestrator.add_node("A", BACKLOG)
+        orchestrator.add_node("B", BACKLOG)
+        scheduler = DistillationScheduler(orchestrator, 0.9, batch=variant == "batched")
+        scheduler.add_link("A", "B", os.urandom(32))
+        for _ in range(BACKLOG):
+            ends = {}
+            for node_id, peer in (("A", "B"), ("B", "A")):
+                memory = orchestrator.memory[node_id]
+                ends[node_id] = memory.allocate((peer, None))
+                memory.store(ends[node_id], peer, 0, 0.0, fidelity=0.8)
+            orchestrator.frames.herald(("A", ends["A"]), ("B", ends["B"]), 0)
+            scheduler.stored("A", "B", ends["A"], ends["B"])
+        t0 = time.perf_counter()
+        sim.run()
+        stats = dict(scheduler.stats)
+        ready = 0
+        while scheduler.take("A", "B") is not None:
+            ready += 1
+        print(variant, ": ", ready, " pairs at threshold after ", sim.now() * 1e3, " ms, rounds ", stats["rounds"],
+              " parity messages ", stats["messages"], " (", stats["bytes"], " bytes) wall: ", time.perf_counter() - t0,
+              " s")
@@ -0,0 +1,101 @@
+# Ephemeral KEM state for the handshake state machine
+# pqc_keygen used to return a bare oqs.KeyEncapsulation that was kept in handshake_state for the whole
+# process, so the native secret key buffer of EVERY handshake ever run stayed allocated.
+# EphemeralKEM owns the KeyEncapsulation only until decapsulation:
+# - decap_secret() frees the native context right after the shared secret is recovered
+#   (KeyEncapsulation.free() cleanses the secret key with OQS_MEM_cleanse before OQS_KEM_free)
+# - the public key kept for the transcript is a bytearray, so it is zeroed as well
+# - used as a context manager, the context is also freed when the handshake fails half way
+# Python bytes objects (e.g. the shared secret returned by liboqs) are immutable and cannot be wiped in place,
+# so secrets the control plane holds are copied into bytearrays and wiped with wipe() once the session keys are derived.
+import resource
+import oqs
+
+def wipe(buf):
+    # zero a bytearray in place
+    if buf is not None:
+        buf[:] = bytes(len(buf))
+
+class EphemeralKEM:
+    def __init__(self, kem_name):
+        self.kem = oqs.KeyEncapsulation(kem_name)
+        self.pk = None
+
+    def generate_keypair(self):
+        pk = self.kem.generate_keypair()
+        self.pk = bytearray(pk) # kept for the transcript until decapsulation
+        return pk
+
+    def decap_secret(self, ct):
+        try:
+            return bytearray(self.kem.decap_secret(ct))
+        finally:
+            self.close()
+
+    def close(self):
+        if self.kem is not None:
+            self.kem.free()
+            self.kem = None
+        wipe(self.pk)
+        self.pk = None
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
+
+def rss_bytes():
+    # resident set size of this process (includes native liboqs allocations, unlike tracemalloc)
+    with open("/proc/self/statm", "r") as f:
+        pages = int(f.read().split()[1])
+    return pages * resource.getpagesize()
+
+def soak(num_handshakes, keep_kem_objects, kem_name="ML-KEM-768", sample_every=1000):
+    """
+    Runs num_handshakes keygen/encaps/decaps rounds and samples RSS.
+
+    Args:
+        num_handshakes (int): number of handshakes
+        keep_kem_objects (bool): True reproduces the old behaviour (KEM object and pk kept in a global dict)
+        kem_name (str): KEM algorithm
+        sample_every (int): handshakes between two RSS samples
+    Returns:
+        (list): [(handshake number, rss bytes)]
+    """
+    from session_table import SessionTable
+    table = SessionTable()
+    old_state = {}
+    samples = []
+    for i in range(1, num_handshakes + 1):
+        peer = "peer" + str(i % 100)
+        if keep_kem_objects:
+            kem_receiver = oqs.KeyEncapsulation(kem_name)
+            pk = kem_receiver.generate_keypair()
+            with oqs.KeyEncapsulation(kem_name) as kem:
+                ct, ss_enc = kem.encap_secret(pk)
+            ss_dec = kem_receiver.decap_secret(ct)
+            old_state[i] = {"kem": kem_receiver, "pk_hex": pk.hex(), "ss_enc": ss_enc, "ss_dec": ss_dec, "auth_ok": True}
+        else:
+            with EphemeralKEM(kem_name) as kem_receiver:
+                pk = kem_receiver.generate_keypair()
+                with oqs.KeyEncapsulation(kem_name) as kem:
+                    ct, ss_enc = kem.encap_secret(pk)
+                ss_dec = kem_receiver.decap_secret(ct)
+            table.put("Alice", peer, ss_dec)
+            wipe(ss_dec)
+        if i % sample_every == 0:
+            samples.append((i, rss_bytes()))
+    return samples
+
+if __name__ == '__main__':
+    NUM_HANDSHAKES = 20000
+    for keep, name in [(True, "kept"), (False, "ephemeral")]:
+        samples = soak(NUM_HANDSHAKES, keep)
+        with open("kem_soak_rss_" + name + ".txt", "a") as f:
+            for i, rss in samples:
+                f.write(f"{i},{rss}\n")
+        print("-- KEM SOAK (" + name + ") --")
+        print("RSS after ", samples[0][0], " handshakes: ", samples[0][1])
+        print("RSS after ", samples[-1][0], " handshakes: ", samples[-1][1])
+        print("growth per 1000 handshakes: ", (samples[-1][1] - samples[0][1]) / max(1, len(samples) - 1), " bytes")
@@ -0,0 +1,226 @@
+# Per-node index of stored entanglement: counts, age order and fidelity order per peer
+# Routing asks len(host.get_epr_pairs(peer)) for every edge of every route computation: the whole pair list is
+# built just to be counted, and picking the oldest or the best pair is a scan on top of that.
+# EntanglementIndex is updated on every add (a pair is stored), update (the pair changed: swap, distillation; a swap
+# also moves it to the peer holding its new far end) and remove (consumed, swapped, expired):
+# - count(peer): pairs held with the peer, O(1)
+# - oldest(peer) / freshest(peer): ends of an age-ordered deque, amortized O(1)
+# - best(peer): highest current fidelity, O(log n) heap. Stored fidelity decays towards 1/4 with the node's T2
+#   (coherence_time) for every pair, F(t) = 1/4 + (F1 - 1/4) exp(-(t - t1) / T2) from its last update (F1 at t1),
+#   so decay never changes the order of the pairs and the heap key log(F1 - 1/4) + t1 / T2 only changes on update,
+#   which pushes the pair again under its new key
+# - older_than(t): pairs stored before t over all peers (cutoffs), oldest first
+# Removed pairs are dropped from the deques and heaps lazily (sequence numbers tell stale entries apart when a pair
+# id, e.g. a register, is reused), both are compacted when stale entries outnumber live ones.
+# NuclearMemory keeps one index per node (quantum_memory.py).
+import heapq
+import itertools
+import math
+import time
+from collections import deque
+
+LINK_FIDELITY = 0.9 # fidelity of a freshly heralded link-level pair
+COHERENCE_TIME = 0.1 # default decay time constant of a stored pair (seconds), MemoryPool passes each node's T2
+COMPACT_SLACK = 32 # stale entries tolerated per peer before its deque and heap are rebuilt
+
+def fidelity_at(fidelity, stored_at, now, coherence_time=COHERENCE_TIME):
+    return 0.25 + (fidelity - 0.25) * math.exp(-(now - stored_at) / coherence_time)
+
+class EntanglementIndex:
+    def __init__(self, coherence_time=COHERENCE_TIME):
+        self.coherence_time = coherence_time
+        self.counts = {} # peer -> pairs
+        self.pairs = {} # pair id -> (seq, peer, stored_at, fidelity, updated_at, heap key)
+        self._by_age = {} # peer -> deque of (seq, pair id), oldest left
+        self._by_quality = {} # peer -> heap of (-key, seq, pair id)
+        self._all = deque() # (stored_at, seq, pair id) over all peers, oldest left
+        self._seq = itertools.count()
+
+    def __len__(self):
+        return len(self.pairs)
+
+    def _key(self, fidelity, now):
+        return math.log(fidelity - 0.25) + now / self.coherence_time if fidelity > 0.25 else -math.inf
+
+    def add(self, peer, pair_id, now, fidelity=LINK_FIDELITY):
+        seq = next(self._seq)
+        key = self._key(fidelity, now)
+        self.pairs[pair_id] = (seq, peer, now, fidelity, now, key)
+        self.counts[peer] = self.counts.get(peer, 0) + 1
+        self._by_age.setdefault(peer, deque()).append((seq, pair_id))
+        self._all.append((now, seq, pair_id))
+        heapq.heappush(self._by_quality.setdefault(peer, []), (-key, seq, pair_id))
+
+    def update(self, pair_id, fidelity, now, peer=None):
+        """
+        The pair changed (swap, distillation): its fidelity is `fidelity` at `now`, its age stays.
+
+        Args:
+            peer: node holding the other end now (a swap joins the pair to a new far end), None = unchanged
+        """
+        entry = self.pairs.get(pair_id)
+        if entry is None:
+            return
+        seq, old_peer, stored_at = entry[:3]
+        key = self._key(fidelity, now)
+        if peer is None or peer == old_peer:
+            peer = old_peer
+        else:
+            # new sequence number: the entries under the old peer turn stale, the pair is filed under its age
+            seq = next(self._seq)
+            self.counts[old_peer] -= 1
+            self.counts[peer] = self.counts.get(peer, 0) + 1
+            self._insert_by_age(self._by_age.setdefault(peer, deque()), stored_at, (seq, pair_id),
+                                lambda e: self.pairs[e[1]][2] if self._live(*e) else None)
+            self._insert_by_age(self._all, stored_at, (stored_at, seq, pair_id), lambda e: e[0])
+        self.pairs[pair_id] = (seq, peer, stored_at, fidelity, now, key)
+        heap = self._by_quality.setdefault(peer, [])
+        heapq.heappush(heap, (-key, seq, pair_id))
+        if len(heap) > 2 * self.counts[peer] + COMPACT_SLACK:
+            self._compact(peer)
+        if old_peer != peer:
+            if len(self._by_age[old_peer]) > 2 * self.counts[old_peer] + COMPACT_SLACK:
+                self._compact(old_peer)
+            if len(self._all) > 2 * len(self.pairs) + COMPACT_SLACK:
+                self._all = deque(e for e in self._all if self._live(e[1], e[2]))
+
+    def _insert_by_age(self, ages, stored_at, item, stored_at_of):
+        # keeps a deque ordered by store time, walking back from the newest entry (a moved pair is rarely old);
+        # stored_at_of(entry) is None for stale entries, the readers skip them wherever they are
+        i = len(ages)
+        while i:
+            when = stored_at_of(ages[i - 1])
+            if when is not None and when <= stored_at:
+                break
+            i -= 1
+        ages.insert(i, item)
+
+    def remove(self, pair_id):
+        """
+        Returns:
+            (tuple): (seq, peer, stored_at, fidelity, updated_at, key) of the removed pair, None if it was not indexed
+        """
+        entry = self.pairs.pop(pair_id, None)
+        if entry is None:
+            return None
+        peer = entry[1]
+        self.counts[peer] -= 1
+        if len(self._by_age[peer]) > 2 * self.counts[peer] + COMPACT_SLACK:
+            self._compact(peer)
+        if len(self._all) > 2 * len(self.pairs) + COMPACT_SLACK:
+            self._all = deque(e for e in self._all if self._live(e[1], e[2]))
+        return entry
+
+    def _live(self, seq, pair_id):
+        entry = self.pairs.get(pair_id)
+        return entry is not None and entry[0] == seq
+
+    def _current(self, heap_entry):
+        # live heap entry under the pair's current key (update() leaves the old key behind)
+        entry = self.pairs.get(heap_entry[2])
+        return entry is not None and entry[0] == heap_entry[1] and entry[5] == -heap_entry[0]
+
+    def _compact(self, peer):
+        self._by_age[peer] = deque(e for e in self._by_age[peer] if self._live(*e))
+        heap = [e for e in self._by_quality[peer] if self._current(e)]
+        heapq.heapify(heap)
+        self._by_quality[peer] = heap
+
+    def count(self, peer):
+        return self.counts.get(peer, 0)
+
+    def oldest(self, peer):
+        ages = self._by_age.get(peer)
+        while ages and not self._live(*ages[0]):
+            ages.popleft()
+        return ages[0][1] if ages else None
+
+    def freshest(self, peer):
+        ages = self._by_age.get(peer)
+        while ages and not self._live(*ages[-1]):
+            ages.pop()
+        return ages[-1][1] if ages else None
+
+    def best(self, peer):
+        heap = self._by_quality.get(peer)
+        while heap and not self._current(heap[0]):
+            heapq.heappop(heap)
+        return heap[0][2] if heap else None
+
+    def fidelity(self, pair_id, now):
+        entry = self.pairs.get(pair_id)
+        return None if entry is None else fidelity_at(entry[3], entry[4], now, self.coherence_time)
+
+    def older_than(self, when):
+        """
+        Returns:
+            (list): ids of the pairs stored before `when`, oldest first (still indexed, the caller removes them)
+        """
+        out = []
+        stale = 0
+        for stored_at, seq, pair_id in self._all:
+            if stored_at >= when:
+                break
+            if self._live(seq, pair_id):
+                out.append(pair_id)
+            elif not out:
+                stale += 1
+        for _ in range(stale):
+            self._all.popleft() # stale entries in front of the first live one
+        return out
+
+def orchestrator_epr_count(orchestrator):
+    # epr_count(u, v) for session_routing, from the memory indexes of a NodeOrchestrator
+    memory = orchestrator.memory
+    return lambda u, v: memory[u].index.count(v)
+
+if __name__ == '__main__':
+    import random
+    NUM_PAIRS = 100000
+    NUM_PEERS = 10
+    NUM_QUERIES = 10000
+    rng = random.Random(1)
+    index = EntanglementIndex()
+    store = {} # pair id -> (peer, stored_at, fidelity), the flat store get_epr_pairs filters
+    for pair_id in range(NUM_PAIRS):
+        peer = "node" + str(rng.randrange(NUM_PEERS))
+        fidelity = rng.uniform(0.7, 0.95)
+        now = pair_id * 1e-6
+        index.add(peer, pair_id, now, fidelity)
+        store[pair_id] = (peer, now, fidelity)
+    for pair_id in rng.sample(range(NUM_PAIRS), NUM_PAIRS // 2): # half of them consumed in random order
+        index.remove(pair_id)
+        del store[pair_id]
+    now = NUM_PAIRS * 1e-6
+    peers = ["node" + str(rng.randrange(NUM_PEERS)) for _ in range(NUM_QUERIES)]
+    print("-- EPR INDEX (" + str(len(store)) + " stored pairs, " + str(NUM_PEERS) + " peers) --")
+
+    t0 = time.perf_counter()
+    for peer in peers[:100]:
+        len([p for p in store.values() if p[0] == peer])
+    scan_count = (time.perf_counter() - t0) / 100
+    t0 = time.perf_counter()
+    for peer in peers:
+        index.count(peer)
+    index_count = (time.perf_counter() - t0) / NUM_QUERIES
+    print("count (us/query): pair list ", scan_count * 1e6, " index ", index_count * 1e6)
+
+    t0 = time.perf_counter()
+    for peer in peers[:100]:
+        max((fidelity_at(p[2], p[1], now), i) for i, p in store.items() if p[0] == peer)
+    scan_best = (time.perf_counter() - t0) / 100
+    t0 = time.perf_counter()
+    for peer in peers:
+        index.best(peer)
+        index.oldest(peer)
+    index_best = (time.perf_counter() - t0) / NUM_QUERIES
+    print("best + oldest pair (us/query): scan ", scan_best * 1e6, " index ", index_best * 1e6)
+    peer = peers[0]
+    best = max((fidelity_at(p[2], p[1], now), i) for i, p in store.items() if p[0] == peer)[1]
+    assert index.best(peer) == best and index.count(peer) == sum(1 for p in store.values() if p[0] == peer)
+
+    t0 = time.perf_counter()
+    for pair_id in list(store):
+        index.remove(pair_id)
+        index.add("node0", pair_id, now, LINK_FIDELITY)
+    print("remove + add (us/pair): ", (time.perf_counter() - t0) / len(store) * 1e6)
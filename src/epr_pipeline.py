@@ -0,0 +1,270 @@
+# Pipelined entanglement generation with path authentication (time to first EPR)
+# (PQC Tests/list.txt: "Impact on time to first EPR (baseline vs PQC-gated)")
+# pqc_handshake joins every handshake_with_node thread before any quantum operation starts ("gated").
+# In "pipelined" mode a link starts its entanglement attempts as soon as BOTH of its endpoints are authenticated
+# (the initiator counts as authenticated), while the handshakes with the rest of the path are still running.
+# Swaps and end-to-end delivery stay gated: link pairs stored before the whole path is authenticated wait in memory.
+# A link that fails in the simulation fails the round: its stored links are dropped and the round starts again.
+# first_epr_request runs this on the QuNetSim network, simulate_first_epr on the discrete-event kernel.
+import threading
+import time
+from des_kernel import simulate_handshake
+from node_orchestration import NodeOrchestrator, P_SUCCESS
+from swap_scheduler import SwapCoordinator
+
+MODES = ("gated", "pipelined")
+MAX_RETRIES = 2 # failed rounds (a link ran out of attempts) of a simulated request that are started again
+
+class AuthGate:
+    """
+    Authentication state of one route. Thread-safe, handshake threads report to it concurrently.
+    on_link_unlocked(i) is called once for every link route[i] - route[i+1] whose endpoints are both authenticated,
+    on_path_authenticated() once every node of the route is.
+    """
+    def __init__(self, route, on_link_unlocked=None, on_path_authenticated=None):
+        self.route = route
+        self.on_link_unlocked = on_link_unlocked
+        self.on_path_authenticated = on_path_authenticated
+        self.lock = threading.Lock()
+        self.authenticated = {route[0]}
+        self.unlocked = set()
+        self.path_authenticated = threading.Event()
+        if len(route) == 1:
+            self.path_authenticated.set()
+
+    def authenticate(self, node_id):
+        with self.lock:
+            self.authenticated.add(node_id)
+            links = [i for i in range(len(self.route) - 1) if i not in self.unlocked
+                     and self.route[i] in self.authenticated and self.route[i + 1] in self.authenticated]
+            self.unlocked.update(links)
+            complete = not self.path_authenticated.is_set() and self.authenticated.issuperset(self.route)
+            if complete:
+                self.path_authenticated.set()
+        if self.on_link_unlocked is not None:
+            for i in links:
+                self.on_link_unlocked(i)
+        if complete and self.on_path_authenticated is not None:
+            self.on_path_authenticated()
+
+def first_epr_request(network, initiator, dest_id, handshake_fn, sessions, mode="pipelined", policy="nested"):
+    """
+    One end-to-end EPR request on the QuNetSim network, from the start of the handshakes to the first end-to-end pair.
+
+    Args:
+        network (Network): QuNetSim network instance
+        initiator (Host): source end node
+        dest_id (str): ID of the destination end node
+        handshake_fn (function): handshake_fn(initiator, node_id), e.g. handshake_with_node
+        sessions (SessionTable): handshake_state
+        mode (str): "gated" or "pipelined"
+        policy (str): swap order, see swap_scheduler.swap_tree
+    Returns:
+        (dict): {"authenticated", "path_authenticated", "first_link", "first_epr", "pair"}, times in seconds from the start
+    """
+    from multipath_entanglement import generate_link, swap_links
+    route = network.get_quantum_route(initiator.host_id, dest_id)
+    t0 = time.perf_counter()
+    report = {"authenticated": False, "path_authenticated": None, "first_link": None, "first_epr": None, "pair": None}
+    links = [None] * (len(route) - 1)
+    link_threads = []
+    lock = threading.Lock()
+
+    def make_link(i):
+        links[i] = generate_link(network, route[i], route[i + 1])
+        with lock:
+            if links[i] is not None and report["first_link"] is None:
+                report["first_link"] = time.perf_counter() - t0
+
+    def start_link(i):
+        t = threading.Thread(target=make_link, args=(i,))
+        t.start()
+        with lock:
+            link_threads.append(t)
+
+    gate = AuthGate(route, on_link_unlocked=start_link if mode == "pipelined" else None)
+
+    def authenticate(node_id):
+        if sessions.lookup(initiator.host_id, node_id) is None:
+            handshake_fn(initiator, node_id)
+        if sessions.lookup(initiator.host_id, node_id) is not None:
+            gate.authenticate(node_id)
+
+    threads = []
+    for node_id in route[1:]:
+        t = threading.Thread(target=authenticate, args=(node_id,))
+        t.start()
+        threads.append(t)
+    for t in threads: t.join()
+    if not gate.path_authenticated.is_set():
+        print("Authentication failed on the path. No entanglement is distributed.")
+        return report
+    report["authenticated"] = True
+    report["path_authenticated"] = time.perf_counter() - t0
+
+    if mode == "gated":
+        for i in range(len(links)):
+            start_link(i)
+    for t in link_threads: t.join()
+    if any(pair is None for pair in links):
+        print("Link-level entanglement failed on the path.")
+        return report
+    report["pair"] = swap_links(links, policy)
+    report["first_epr"] = time.perf_counter() - t0
+    return report
+
+def simulate_first_epr(sim, calibration, route, mode="pipelined", policy="nested", p_success=P_SUCCESS,
+                       attempt_model=None, num_pairs=1, on_done=None, max_retries=MAX_RETRIES):
+    """
+    The same request on the discrete-event kernel: handshakes from the calibration table, link generation on a
+    NodeOrchestrator, swapping with a SwapCoordinator. After the first end-to-end pair the request goes on
+    (links regenerated, swapped again) until num_pairs pairs were delivered.
+    A failed link fails the round (SwapCoordinator.fail): the other links of the round are cancelled, every link
+    register it still holds is dropped and the round starts again, at most max_retries times per request.
+
+    Args:
+        sim (Simulator): virtual-time event loop
+        calibration (CalibrationTable): handshake step durations of one scheme, None = no authentication
+        num_pairs (int): end-to-end pairs of the request
+        on_done (function): on_done(report) once the end nodes know about the last end-to-end pair, or once the
+                            request gave up (report["failed"])
+        max_retries (int): failed rounds started again before the request fails
+    Returns:
+        (dict): report, filled in while sim runs, times in seconds from the start
+    """
+    orchestrator = NodeOrchestrator(sim, p_success=p_success, seed=sim.rng.getrandbits(32),
+                                    attempt_model=attempt_model, fast_forward=attempt_model is not None)
+    for node_id in route:
+        orchestrator.add_node(node_id)
+    start = sim.now()
+    last = len(route) - 1
+    report = {"authenticated": False, "path_authenticated": None, "first_link": None, "first_epr": None,
+              "pair_times": [], "link_failures": 0, "failed": False}
+    waiting = [] # links of this round stored before the path is authenticated
+    registers = {} # (link, index of the node on the route) -> register holding the link
+    unlocked = set() # links whose endpoints are authenticated, generated in every round
+    current = {} # the round: its coordinator, outstanding LinkRequests and link registers not swapped yet
+
+    def on_swap(k, m_x, m_z):
+        current["held"].difference_update(((k - 1, k), (k, k)))
+        orchestrator.swap(route[k], registers[(k - 1, k)], registers[(k, k)], m_x, m_z)
+
+    def e2e_done(coordinator, end):
+        if end is None:
+            round_failed()
+            return
+        report["pair_times"].append(end - start)
+        if report["first_epr"] is None:
+            report["first_epr"] = end - start
+        # the end nodes use the pair right away, so their registers are free for the next one
+        orchestrator.consume(route[0], registers[(0, 0)])
+        orchestrator.consume(route[last], registers[(last - 1, last)])
+        if len(report["pair_times"]) < num_pairs:
+            new_round()
+            for i in range(last):
+                start_link(i)
+        elif on_done is not None:
+            on_done(report)
+
+    def new_round():
+        current["coordinator"] = SwapCoordinator(sim, route, policy, sim.rng, on_done=e2e_done, on_swap=on_swap)
+        current["requests"] = {} # (link, node index) -> LinkRequest
+        current["held"] = set() # (link, node index)
+
+    def round_failed():
+        # stop the other links of the round and free every register it holds, then start the round again
+        for request in current["requests"].values():
+            orchestrator.cancel(request)
+        for i, index in current["held"]:
+            orchestrator.drop(route[index], registers[(i, index)])
+        del waiting[:]
+        report["link_failures"] += 1
+        if report["link_failures"] > max_retries:
+            print("Request failed after ", report["link_failures"], " failed rounds, ", len(report["pair_times"]),
+                  " of ", num_pairs, " pairs delivered")
+            report["failed"] = True
+            if on_done is not None:
+                on_done(report)
+            return
+        new_round()
+        for i in sorted(unlocked):
+            start_link(i)
+
+    def link_stored(i):
+        if report["first_link"] is None:
+            report["first_link"] = sim.now() - start
+        if gate.path_authenticated.is_set():
+            current["coordinator"].link_ready(i)
+        else:
+            waiting.append(i)
+
+    def start_link(i):
+        requests = current["requests"]
+        held = current["held"]
+        coordinator = current["coordinator"]
+        stored = []
+
+        def done(request, success):
+            index = i if request.node_id == route[i] else i + 1
+            del requests[(i, index)]
+            if not success:
+                print("Link ", route[i], "-", route[i + 1], " failed, the round is started again")
+                coordinator.fail() # round_failed() through e2e_done
+                return
+            registers[(i, index)] = request.register
+            held.add((i, index))
+            stored.append(request)
+            if len(stored) == 2:
+                link_stored(i)
+
+        # neighbouring links attempt in alternating slots, so a repeater electron serves both of its links
+        first = orchestrator.next_slot() + 1
+        message = ("START_ENTANGLEMENT", route[i + 1], None, first + (i - first) % 2, 2)
+        requests[(i, i)] = orchestrator.handle_message(route[i], message, on_done=done)
+        requests[(i, i + 1)] = orchestrator.handle_message(route[i + 1], ("START_ENTANGLEMENT", route[i]) + message[2:],
+                                                           on_done=done)
+
+    def unlock(i):
+        unlocked.add(i)
+        start_link(i)
+
+    def path_authenticated():
+        report["authenticated"] = True
+        report["path_authenticated"] = sim.now() - start
+        if mode == "gated":
+            for i in range(last):
+                unlock(i)
+        for i in waiting:
+            current["coordinator"].link_ready(i)
+        del waiting[:]
+
+    new_round()
+    gate = AuthGate(route, on_link_unlocked=unlock if mode == "pipelined" else None,
+                    on_path_authenticated=path_authenticated)
+    if calibration is None:
+        for node_id in route[1:]:
+            gate.authenticate(node_id)
+    else:
+        for node_id in route[1:]:
+            simulate_handshake(sim, calibration, route[0], node_id, lambda initiator, peer, s, e: gate.authenticate(peer))
+    return report
+
+if __name__ == '__main__':
+    from des_kernel import Simulator, CalibrationTable
+    NUM_TRIALS = 1000
+    calibration = CalibrationTable.from_files("pqc")
+    for route in [["Alice", "Bob"], ["Alice", "Bob", "Cathy"], ["Alice", "Bob", "Cathy", "Dave", "Eva"]]:
+        print("-- TIME TO FIRST EPR (" + str(len(route)) + " nodes, PQC) --")
+        for mode in MODES:
+            reports = []
+            t0 = time.perf_counter()
+            for trial in range(NUM_TRIALS):
+                sim = Simulator(seed=trial)
+                reports.append(simulate_first_epr(sim, calibration, route, mode))
+                sim.run()
+            wall = time.perf_counter() - t0
+            first_epr = sorted(r["first_epr"] for r in reports)
+            after_auth = sorted(r["first_epr"] - r["path_authenticated"] for r in reports)
+            print(mode, ": mean/p50/p95 (ms) ", sum(first_epr) / NUM_TRIALS * 1e3, first_epr[NUM_TRIALS // 2] * 1e3,
+                  first_epr[int(NUM_TRIALS * 0.95) - 1] * 1e3, " after path authentication (ms) ",
+                  sum(after_auth) / NUM_TRIALS * 1e3, " wall: ", wall, " s")
@@ -0,0 +1,432 @@
+# Event-driven EPR replenishment per link
+# (QuNetSim Basics/entanglement.py: generate_entanglement(host) loops forever, checks host.is_idle() and scans
+#  EVERY connection with len(host.get_epr_pairs(...)) < 4 on each pass)
+# LinkReplenisher keeps the stored pairs of ONE link between two watermarks instead:
+# - a consumption event (take / consumed) lowers the level; only when level + pairs in flight drop below `low`
+#   the link generates pairs again, up to `high` (hysteresis: no generation after every single consumption)
+# - one pair of a link is generated at a time (max_in_flight), the electrons of its endpoints serve other links too
+# - a failed generation is retried after an exponential backoff (base_backoff .. max_backoff), reset on success;
+#   on the event loop if there is one, otherwise on a timer thread (wall clock)
+# - nothing runs while no pair is consumed: no polling, no scan over the connections of the host
+# ReplenishmentDaemon runs the replenishers of many links on an EventLoop (generation with the NodeOrchestrator)
+# and hands out the link's pair with the highest current fidelity (memory index, epr_index.py) on take(),
+# QuNetSimReplenisher is the drop-in for generate_entanglement: one thread per host that sleeps on a condition
+# until one of its links is below its low watermark.
+import threading
+import time
+from collections import deque
+from node_orchestration import NodeOrchestrator, SLOT_DURATION
+
+LOW_WATERMARK = 2
+HIGH_WATERMARK = 4 # generate_entanglement's target of 4 pairs per connection
+BASE_BACKOFF = 10 * SLOT_DURATION
+MAX_BACKOFF = 1000 * SLOT_DURATION
+
+class LinkReplenisher:
+    def __init__(self, link, generate, low=LOW_WATERMARK, high=HIGH_WATERMARK, loop=None,
+                 base_backoff=BASE_BACKOFF, max_backoff=MAX_BACKOFF, max_in_flight=1):
+        """
+        Args:
+            link (tuple): (node_id, peer)
+            generate (function): generate(replenisher) starts ONE pair, reports back with stored() or failed()
+            low (int): generation starts when stored + in-flight pairs drop below this
+            high (int): target level, generation stops once stored + in-flight pairs reach it
+            loop (EventLoop): schedules the backoff retries, None = threading.Timer on the wall clock
+            max_in_flight (int): pairs of this link generated at the same time
+        """
+        if not 0 < low <= high:
+            raise ValueError("watermarks need 0 < low <= high")
+        self.link = link
+        self.generate = generate
+        self.low = low
+        self.high = high
+        self.loop = loop
+        self.base_backoff = base_backoff
+        self.max_backoff = max_backoff
+        self.backoff = base_backoff
+        self.max_in_flight = max_in_flight
+        self.refilling = False # between dropping below low and reaching high again
+        self.pairs = deque() # stored pairs, oldest first
+        self.in_flight = 0
+        self.retry = None # pending backoff event (or timer)
+        self.stats = {"generated": 0, "failed": 0, "consumed": 0, "empty": 0, "refills": 0}
+
+    @property
+    def level(self):
+        return len(self.pairs)
+
+    def start(self):
+        self.refilling = True
+        self._refill()
+        return self
+
+    def take(self, pair=None):
+        """
+        Consumption event: the application uses a stored pair.
+
+        Args:
+            pair: the stored pair to use (as given to stored()), the oldest one if None
+        Returns:
+            the pair as given to stored(), None if no pair is stored (the request missed)
+        """
+        if not self.pairs:
+            self.stats["empty"] += 1
+            self._check()
+            return None
+        if pair is None:
+            pair = self.pairs.popleft()
+        else:
+            self.pairs.remove(pair)
+        self.stats["consumed"] += 1
+        self._check()
+        return pair
+
+    def _check(self):
+        if not self.refilling and self.level + self.in_flight < self.low:
+            self.stats["refills"] += 1
+            self.refilling = True
+            self._refill()
+
+    def _refill(self):
+        if self.retry is not None:
+            return
+        while self.level + self.in_flight < self.high and self.in_flight < self.max_in_flight:
+            self.in_flight += 1
+            self.generate(self)
+        if self.level + self.in_flight >= self.high:
+            self.refilling = False
+
+    def stored(self, pair):
+        self.in_flight -= 1
+        self.pairs.append(pair)
+        self.stats["generated"] += 1
+        self.backoff = self.base_backoff
+        if self.refilling:
+            self._refill()
+
+    def failed(self):
+        self.in_flight -= 1
+        self.stats["failed"] += 1
+        if self.retry is not None:
+            return
+        if self.loop is not None:
+            self.retry = self.loop.call_later(self.backoff, self._retry)
+        else:
+            self.retry = threading.Timer(self.backoff, self._retry)
+            self.retry.daemon = True
+            self.retry.start()
+        self.backoff = min(2 * self.backoff, self.max_backoff)
+
+    def _retry(self):
+        self.retry = None
+        self._refill()
+
+class ReplenishmentDaemon:
+    """
+    Replenishers of every link of a NodeOrchestrator. A pair is generated with START_ENTANGLEMENT on both endpoints
+    (any free register); consumers take() pairs and the registers are released through the orchestrator.
+    """
+    def __init__(self, orchestrator, low=LOW_WATERMARK, high=HIGH_WATERMARK, order="best"):
+        """
+        Args:
+            order (str): pair handed out by take(): "best" (highest current fidelity) or "oldest"
+        """
+        if order not in ("best", "oldest"):
+            raise ValueError("unknown take order: " + str(order))
+        self.orchestrator = orchestrator
+        self.low = low
+        self.high = high
+        self.order = order
+        self.links = {} # (node_id, peer) -> LinkReplenisher, both orientations
+        self.parity = {} # LinkReplenisher -> slot parity, neighbouring links attempt in alternating slots
+
+    def add_link(self, node_id, peer, low=None, high=None):
+        replenisher = LinkReplenisher((node_id, peer), self._generate, self.low if low is None else low,
+                                      self.high if high is None else high, self.orchestrator.loop)
+        self.links[(node_id, peer)] = replenisher
+        self.links[(peer, node_id)] = replenisher
+        self.parity[replenisher] = len(self.parity) % 2
+        return replenisher.start()
+
+    def _generate(self, replenisher):
+        orchestrator = self.orchestrator
+        node_id, peer = replenisher.link
+        ends = {} # node_id -> register of an end that stored its half
+        outstanding = {} # node_id -> LinkRequest that has not finished yet
+        attempt = {"failed": False}
+
+        def done(request, success):
+            del outstanding[request.node_id]
+            if success:
+                ends[request.node_id] = request.register
+            elif not attempt["failed"]:
+                attempt["failed"] = True
+                # the other end can not complete the pair any more, stop its attempts
+                for other in list(outstanding.values()):
+                    orchestrator.cancel(other)
+                    del outstanding[other.node_id]
+            if outstanding:
+                return
+            if attempt["failed"]:
+                # every end that stored its half is freed, failed() once for the attempt
+                for end, register in ends.items():
+                    orchestrator.drop(end, register)
+                replenisher.failed()
+            else:
+                replenisher.stored((ends[node_id], ends[peer]))
+
+        slot = orchestrator.next_slot() + 1
+        slot += (self.parity[replenisher] - slot) % 2
+        outstanding[node_id] = orchestrator.handle_message(node_id, ("START_ENTANGLEMENT", peer, None, slot, 2),
+                                                           on_done=done)
+        outstanding[peer] = orchestrator.handle_message(peer, ("START_ENTANGLEMENT", node_id, None, slot, 2),
+                                                        on_done=done)
+
+    def _best(self, replenisher):
+        # stored pair of the link with the highest current fidelity, from the memory index of its first end
+        a, b = replenisher.link
+        register = self.orchestrator.memory[a].index.best(b)
+        for pair in replenisher.pairs:
+            if pair[0] == register:
+                return pair
+        return None # best pair with b is not one of this link's (e.g. a swapped pair): oldest
+
+    def take(self, node_id, peer):
+        """
+        Returns:
+            (dict): node_id -> register of the consumed pair (released), None if the link had no pair stored
+        """
+        replenisher = self.links[(node_id, peer)]
+        pair = replenisher.take(self._best(replenisher) if self.order == "best" else None)
+        if pair is None:
+            return None
+        a, b = replenisher.link
+        self.orchestrator.consume(a, pair[0])
+        self.orchestrator.consume(b, pair[1])
+        return {a: pair[0], b: pair[1]}
+
+class PollingReplenisher:
+    """
+    generate_entanglement on the EventLoop, for comparison: every host wakes up every poll_interval and scans all of
+    its connections for links below the target.
+    """
+    def __init__(self, daemon, poll_interval):
+        self.daemon = daemon
+        self.loop = daemon.orchestrator.loop
+        self.poll_interval = poll_interval
+        self.hosts = {} # node_id -> replenishers of its connections
+        self.wakeups = 0
+        self.checks = 0 # connections scanned
+        for (node_id, peer), replenisher in daemon.links.items():
+            if replenisher.link[0] == node_id: # the sending end polls, like host.send_epr in generate_entanglement
+                self.hosts.setdefault(node_id, []).append(replenisher)
+                replenisher.low = replenisher.high + 1 # never triggered by consumption
+        for node_id in self.hosts:
+            self.loop.call_later(poll_interval, self._poll, node_id)
+
+    def _poll(self, node_id):
+        self.wakeups += 1
+        self.checks += len(self.hosts[node_id])
+        for replenisher in self.hosts[node_id]:
+            if replenisher.level + replenisher.in_flight < replenisher.high:
+                replenisher.refilling = True
+                replenisher._refill()
+        self.loop.call_later(self.poll_interval, self._poll, node_id)
+
+class QuNetSimReplenisher:
+    """
+    Event-driven replacement of generate_entanglement(host) on a QuNetSim host. The host's worker thread sleeps until
+    get_epr() (or consumed()) brings a link below its low watermark, then tops that link up to `high` with
+    send_epr(await_ack=True). Only the links that were consumed from are checked.
+    """
+    def __init__(self, host, low=LOW_WATERMARK, high=HIGH_WATERMARK, base_backoff=0.1, max_backoff=5.0):
+        self.host = host
+        self.low = low
+        self.high = high
+        self.base_backoff = base_backoff
+        self.max_backoff = max_backoff
+        self.condition = threading.Condition()
+        self.pending = set() # peers to check, filled by consumption events
+        self.backoff = {} # peer -> current backoff (seconds)
+        self.running = False
+        self.thread = None
+        self.stats = {"sent": 0, "failed": 0, "wakeups": 0}
+
+    def start(self):
+        # every quantum connection is checked once at start, afterwards only on consumption
+        with self.condition:
+            for connection in self.host.get_connections():
+                if connection['type'] == 'quantum':
+                    self.pending.add(connection['connection'])
+            self.running = True
+        self.thread = threading.Thread(target=self._run, daemon=True)
+        self.thread.start()
+        return self
+
+    def stop(self):
+        with self.condition:
+            self.running = False
+            self.condition.notify()
+        if self.thread is not None:
+            self.thread.join()
+
+    def consumed(self, peer):
+        # consumption event: a pair with peer was used on this host or on the peer
+        with self.condition:
+            self.pending.add(peer)
+            self.condition.notify()
+
+    def get_epr(self, peer, q_id=None, wait=-1):
+        # host.get_epr plus the consumption event
+        q = self.host.get_epr(peer, q_id=q_id, wait=wait)
+        if q is not None:
+            self.consumed(peer)
+        return q
+
+    def _run(self):
+        retry_at = {} # peer -> time of the backoff retry
+        while True:
+            with self.condition:
+                while self.running and not self.pending and not retry_at:
+                    self.condition.wait()
+                if not self.running:
+                    return
+                if not self.pending:
+                    self.condition.wait(max(0.0, min(retry_at.values()) - time.monotonic()))
+                now = time.monotonic()
+                for peer in [p for p, t in retry_at.items() if t <= now]:
+                    del retry_at[peer]
+                    self.pending.add(peer)
+                peers = self.pending
+                self.pending = set()
+            self.stats["wakeups"] += 1
+            for peer in peers:
+                level = len(self.host.get_epr_pairs(peer))
+                if level >= self.low and peer not in self.backoff:
+                    continue
+                while level < self.high:
+                    epr_id, ack_arrived = self.host.send_epr(peer, await_ack=True)
+                    if not ack_arrived:
+                        self.stats["failed"] += 1
+                        backoff = min(2 * self.backoff.get(peer, self.base_backoff / 2), self.max_backoff)
+                        self.backoff[peer] = backoff
+                        retry_at[peer] = time.monotonic() + backoff
+                        break
+                    self.stats["sent"] += 1
+                    self.backoff.pop(peer, None)
+                    level += 1
+
+def replenish_entanglement(host, low=LOW_WATERMARK, high=HIGH_WATERMARK):
+    # host.run_protocol(replenish_entanglement) in place of generate_entanglement; use the returned
+    # replenisher's get_epr() (or call consumed()) so consumption wakes it up
+    return QuNetSimReplenisher(host, low, high).start()
+
+if __name__ == '__main__':
+    import random
+    from des_kernel import Simulator
+    # CPU per host: generate_entanglement (every connection checked per pass) against QuNetSimReplenisher, both
+    # driving the same QuNetSim host calls
+    POLL_INTERVAL = 1e-3
+    CONNECTIONS = 4
+    DURATION = 2.0
+
+    class BenchHost:
+        # the part of qunetsim.components.Host the replenishers use; send_epr stores the pair right away
+        def __init__(self, peers):
+            self.lock = threading.Lock()
+            self.epr = {peer: [] for peer in peers}
+            self.ids = 0
+
+        def is_idle(self):
+            return True
+
+        def get_connections(self):
+            return [{"type": "quantum", "connection": peer} for peer in self.epr]
+
+        def get_epr_pairs(self, host_id):
+            with self.lock:
+                return list(self.epr[host_id])
+
+        def send_epr(self, receiver_id, await_ack=False):
+            with self.lock:
+                self.ids += 1
+                self.epr[receiver_id].append(self.ids)
+                return self.ids, True
+
+        def get_epr(self, host_id, q_id=None, wait=-1):
+            with self.lock:
+                return self.epr[host_id].pop(0) if self.epr[host_id] else None
+
+    def generate_entanglement(host, stop):
+        # QuNetSim Basics/entanglement.py without the prints, polling every POLL_INTERVAL
+        while not stop.is_set():
+            if host.is_idle():
+                for connection in host.get_connections():
+                    if connection['type'] == 'quantum':
+                        if len(host.get_epr_pairs(connection['connection'])) < HIGH_WATERMARK:
+                            host.send_epr(connection['connection'], await_ack=True)
+            time.sleep(POLL_INTERVAL)
+
+    for num_hosts in [10, 50, 200]:
+        results = {}
+        for variant in ["polling", "event"]:
+            hosts = [BenchHost(["peer" + str(c) for c in range(CONNECTIONS)]) for _ in range(num_hosts)]
+            stop = threading.Event()
+            cpu0, t0 = time.process_time(), time.perf_counter()
+            if variant == "polling":
+                threads = [threading.Thread(target=generate_entanglement, args=(host, stop)) for host in hosts]
+                for t in threads:
+                    t.start()
+                consumers = hosts
+            else:
+                consumers = [QuNetSimReplenisher(host).start() for host in hosts]
+            rng = random.Random(1)
+            taken = 0
+            # consumers: 1000 pairs/sec over all hosts
+            while time.perf_counter() - t0 < DURATION:
+                if consumers[rng.randrange(num_hosts)].get_epr("peer" + str(rng.randrange(CONNECTIONS))) is not None:
+                    taken += 1
+                time.sleep(1e-3)
+            stop.set()
+            if variant == "polling":
+                for t in threads:
+                    t.join()
+            else:
+                for replenisher in consumers:
+                    replenisher.stop()
+            results[variant] = ((time.process_time() - cpu0) / (time.perf_counter() - t0), taken)
+        print("-- REPLENISHMENT CPU (" + str(num_hosts) + " hosts, " + str(CONNECTIONS) + " connections each) --")
+        print("CPU per host (% of a core): generate_entanglement ", results["polling"][0] / num_hosts * 100,
+              " QuNetSimReplenisher ", results["event"][0] / num_hosts * 100, " pairs taken ",
+              results["polling"][1], " / ", results["event"][1])
+
+    # watermarks on the node orchestrator: consumers on every link of a chain, Poisson arrivals
+    for num_nodes in [10, 100]:
+        for variant in ["event", "polling"]:
+            sim = Simulator(seed=1)
+            orchestrator = NodeOrchestrator(sim, seed=1)
+            node_ids = ["node" + str(i) for i in range(num_nodes)]
+            for node_id in node_ids:
+                orchestrator.add_node(node_id, num_registers=2 * HIGH_WATERMARK)
+            daemon = ReplenishmentDaemon(orchestrator)
+            for a, b in zip(node_ids, node_ids[1:]):
+                daemon.add_link(a, b)
+            poller = PollingReplenisher(daemon, 100e-6) if variant == "polling" else None
+            rng = random.Random(1)
+            for a, b in zip(node_ids, node_ids[1:]):
+                t = rng.expovariate(500.0)
+                while t < 0.1:
+                    sim.call_at(t, daemon.take, a, b)
+                    t += rng.expovariate(500.0)
+            cpu0 = time.process_time()
+            sim.run(until=0.1)
+            cpu = time.process_time() - cpu0
+            links = {id(r): r for r in daemon.links.values()}.values()
+            consumed = sum(r.stats["consumed"] for r in links)
+            empty = sum(r.stats["empty"] for r in links)
+            # replenishment decisions: one per consumption event, or one per connection and poll
+            checks = consumed + empty if poller is None else poller.checks
+            print("-- REPLENISHMENT ON THE ORCHESTRATOR (" + str(num_nodes) + " nodes, " + variant + ") --")
+            print("pairs consumed ", consumed, " requests without a pair ", empty, " link checks ", checks,
+                  " events ", sim.events_dispatched, " CPU per link and simulated second (ms) ",
+                  cpu / (num_nodes - 1) / 0.1 * 1e3)
@@ -0,0 +1,102 @@
+# Time-to-first-EPR benchmark: how much does the security layer delay usable entanglement?
+# (PQC Tests/list.txt: "Impact on time to first EPR (baseline vs PQC-gated)")
+# The same end-to-end entanglement request (epr_pipeline.simulate_first_epr) runs over the same topologies and seeds
+# with every authentication scheme:
+# - "none": no handshake, the unauthenticated control
+# - "send1byte": the 1-byte message exchange of the baseline scripts (transmission only, no cryptography)
+# - "ecdh", "rsa", "pqc" (ML-KEM-768 + ML-DSA-44): handshake steps from des_kernel.CalibrationTable
+# Recorded per scheme and topology: time to the first end-to-end pair, end-to-end pairs/sec of the whole request
+# (handshakes included) and the overhead relative to "none", with percentiles.
+# Results are appended to first_epr_benchmark.txt as scheme,nodes,mode,trial,first_epr,pairs_per_sec lines.
+import time
+import numpy as np
+from des_kernel import Simulator, CalibrationTable
+from epr_pipeline import simulate_first_epr
+
+SCHEMES = ("none", "send1byte", "ecdh", "rsa", "pqc")
+TOPOLOGIES = {2: ["Alice", "Bob"], 3: ["Alice", "Bob", "Eva"], 5: ["Alice", "Bob", "Cathy", "Dave", "Eva"]}
+CHAIN_LENGTHS = (8, 16) # generated repeater chains, number of nodes
+PERCENTILES = (50, 95, 99)
+RESULT_FILE = "first_epr_benchmark.txt"
+
+def chain(num_nodes):
+    return ["node" + str(i) for i in range(num_nodes)]
+
+def run_trials(scheme, route, num_trials, num_pairs=10, mode="pipelined", policy="nested", attempt_model=None):
+    """
+    Runs the request num_trials times, trial t with seed t for every scheme (same link and swap randomness).
+
+    Args:
+        scheme (str): one of SCHEMES
+        route (list): node IDs from the source to the destination
+        num_pairs (int): end-to-end pairs per request
+    Returns:
+        (tuple): (time to first EPR in seconds, end-to-end pairs/sec), np.ndarray of num_trials values each
+    """
+    calibration = None if scheme == "none" else CalibrationTable.from_files(scheme)
+    first_epr = np.empty(num_trials)
+    pairs_per_sec = np.empty(num_trials)
+    for trial in range(num_trials):
+        sim = Simulator(seed=trial)
+        report = simulate_first_epr(sim, calibration, route, mode, policy, attempt_model=attempt_model,
+                                    num_pairs=num_pairs)
+        sim.run()
+        if len(report["pair_times"]) < num_pairs:
+            print("Trial ", trial, " of ", scheme, " delivered ", len(report["pair_times"]), " of ", num_pairs, " pairs")
+            first_epr[trial] = pairs_per_sec[trial] = np.nan
+            continue
+        first_epr[trial] = report["first_epr"]
+        pairs_per_sec[trial] = num_pairs / report["pair_times"][-1]
+    return first_epr, pairs_per_sec
+
+def summarize(values, scale=1.0):
+    values = values[~np.isnan(values)] * scale
+    summary = {"mean": float(values.mean())}
+    for q, value in zip(PERCENTILES, np.percentile(values, PERCENTILES)):
+        summary["p" + str(q)] = float(value)
+    return summary
+
+def benchmark(routes, num_trials, num_pairs=10, mode="pipelined", schemes=SCHEMES, result_file=None):
+    """
+    Runs every scheme over every route and reports time to first EPR, pairs/sec and overhead relative to "none".
+
+    Args:
+        routes (dict): label -> route
+    Returns:
+        (dict): (label, scheme) -> {"first_epr", "pairs_per_sec", "overhead"} summaries (ms, pairs/sec, ms)
+    """
+    results = {}
+    for label, route in routes.items():
+        baseline = None
+        for scheme in schemes:
+            first_epr, pairs_per_sec = run_trials(scheme, route, num_trials, num_pairs, mode)
+            if scheme == "none":
+                baseline = first_epr
+            entry = {"first_epr": summarize(first_epr, 1e3), "pairs_per_sec": summarize(pairs_per_sec)}
+            if baseline is not None:
+                # paired by seed: trial t of every scheme sees the same link and swap randomness
+                entry["overhead"] = summarize(first_epr - baseline, 1e3)
+            results[(label, scheme)] = entry
+            if result_file is not None:
+                with open(result_file, "a") as f:
+                    for trial in range(num_trials):
+                        f.write(f"{scheme},{len(route)},{mode},{trial},{first_epr[trial]},{pairs_per_sec[trial]}\n")
+    return results
+
+if __name__ == '__main__':
+    NUM_TRIALS = 200
+    NUM_PAIRS = 10
+    routes = {str(n) + " nodes": route for n, route in TOPOLOGIES.items()}
+    routes.update({str(n) + "-node chain": chain(n) for n in CHAIN_LENGTHS})
+    t0 = time.perf_counter()
+    results = benchmark(routes, NUM_TRIALS, NUM_PAIRS, result_file=RESULT_FILE)
+    for label in routes:
+        print("-- TIME TO FIRST EPR (" + label + ", " + str(NUM_PAIRS) + " pairs per request) --")
+        for scheme in SCHEMES:
+            entry = results[(label, scheme)]
+            first_epr, overhead = entry["first_epr"], entry.get("overhead")
+            print(scheme, ": first EPR mean/p50/p95/p99 (ms) ", round(first_epr["mean"], 3), round(first_epr["p50"], 3),
+                  round(first_epr["p95"], 3), round(first_epr["p99"], 3),
+                  " pairs/sec ", round(entry["pairs_per_sec"]["mean"], 1),
+                  " overhead mean/p95 (ms) ", round(overhead["mean"], 3), round(overhead["p95"], 3))
+    print("wall: ", time.perf_counter() - t0, " s")
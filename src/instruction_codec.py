@@ -0,0 +1,145 @@
+# Packed instruction batches for the Instruction Interface Layer (decoder)
+# (Control Plane Design/README.md: I=000, X=001, Y=010, Z=011, CNOT=100, MEASURE=101)
+# Every instruction is a 3-bit opcode plus an operand field (nuclear register), OPCODE_BITS + OPERAND_BITS bits.
+# Instructions of one node are collected as small ints (no tuple per instruction) and all instructions of a
+# schedule slot go to the decoder as ONE InstructionBatch: the codes bit-packed into uint64 words
+# (10 six-bit instructions per word), encoded and decoded with NumPy shifts over the whole batch.
+import struct
+import time
+import numpy as np
+
+# Instruction interface (Control Plane Design/README.md)
+OPCODES = {"I": 0b000, "X": 0b001, "Y": 0b010, "Z": 0b011, "CNOT": 0b100, "MEASURE": 0b101}
+MNEMONICS = {code: name for name, code in OPCODES.items()}
+OPCODE_BITS = 3
+OPERAND_BITS = 3 # registers 0..7, NV nodes have NUM_REGISTERS = 4
+WORD_BITS = 64
+BATCH_HEADER = struct.Struct("<IIB") # slot, number of instructions, operand bits
+
+def instruction_code(opcode, operand=0, operand_bits=OPERAND_BITS):
+    # one instruction as a small int: opcode in the high bits, operand in the low bits
+    if operand < 0 or operand >> operand_bits:
+        raise ValueError("operand does not fit into " + str(operand_bits) + " bits")
+    return (OPCODES[opcode] << operand_bits) | operand
+
+class InstructionBatch:
+    __slots__ = ("slot", "count", "operand_bits", "words")
+
+    def __init__(self, slot, count, operand_bits, words):
+        self.slot = slot
+        self.count = count
+        self.operand_bits = operand_bits
+        self.words = words # np.ndarray of uint64
+
+    def to_bytes(self):
+        return BATCH_HEADER.pack(self.slot, self.count, self.operand_bits) + self.words.astype("<u8").tobytes()
+
+    @classmethod
+    def from_bytes(cls, data):
+        slot, count, operand_bits = BATCH_HEADER.unpack_from(data, 0)
+        words = np.frombuffer(data, dtype="<u8", offset=BATCH_HEADER.size).astype(np.uint64)
+        return cls(slot, count, operand_bits, words)
+
+def _layout(operand_bits):
+    width = OPCODE_BITS + operand_bits
+    per_word = WORD_BITS // width
+    shifts = (np.arange(per_word, dtype=np.uint64) * np.uint64(width))
+    return width, per_word, shifts
+
+def pack_codes(codes, slot=0, operand_bits=OPERAND_BITS):
+    """
+    Bit-packs instruction codes (see instruction_code) into one batch.
+
+    Args:
+        codes (list or np.ndarray): instruction codes in execution order
+        slot (int): schedule slot the instructions belong to
+    Returns:
+        (InstructionBatch): the packed batch
+    """
+    width, per_word, shifts = _layout(operand_bits)
+    codes = np.asarray(codes, dtype=np.uint64)
+    count = codes.shape[0]
+    if count and int(codes.max()) >> width:
+        raise ValueError("instruction code wider than " + str(width) + " bits")
+    padded = np.zeros(-(-count // per_word) * per_word, dtype=np.uint64)
+    padded[:count] = codes
+    # fields of one word do not overlap, so the sum of the shifted fields is their bitwise or
+    words = (padded.reshape(-1, per_word) << shifts).sum(axis=1, dtype=np.uint64)
+    return InstructionBatch(slot, count, operand_bits, words)
+
+def encode(opcodes, operands, slot=0, operand_bits=OPERAND_BITS):
+    # vectorized encoder for opcode and operand arrays of the same length
+    opcodes = np.asarray(opcodes, dtype=np.uint64)
+    operands = np.asarray(operands, dtype=np.uint64)
+    if (operands >> np.uint64(operand_bits)).any():
+        raise ValueError("operand does not fit into " + str(operand_bits) + " bits")
+    return pack_codes((opcodes << np.uint64(operand_bits)) | operands, slot, operand_bits)
+
+def decode(batch):
+    """
+    Unpacks a whole batch at once.
+
+    Returns:
+        (tuple): (opcodes, operands) as uint8 arrays in execution order
+    """
+    width, _, shifts = _layout(batch.operand_bits)
+    mask = np.uint64((1 << width) - 1)
+    codes = ((batch.words[:, None] >> shifts) & mask).ravel()[:batch.count]
+    operand_mask = np.uint64((1 << batch.operand_bits) - 1)
+    return ((codes >> np.uint64(batch.operand_bits)).astype(np.uint8), (codes & operand_mask).astype(np.uint8))
+
+class InstructionDecoder:
+    """
+    Instruction interface of one or many NV nodes: takes one batch per schedule slot.
+    """
+    def __init__(self):
+        self.batches = 0
+        self.instructions = 0
+        self.counts = np.zeros(1 << OPCODE_BITS, dtype=np.int64) # executed instructions per opcode
+
+    def execute(self, batch):
+        opcodes, operands = decode(batch)
+        self.counts += np.bincount(opcodes, minlength=self.counts.shape[0])
+        self.batches += 1
+        self.instructions += batch.count
+        return opcodes, operands
+
+    def summary(self):
+        return {MNEMONICS[code]: int(n) for code, n in enumerate(self.counts) if code in MNEMONICS and n}
+
+if __name__ == '__main__':
+    NUM_INSTRUCTIONS = 10000000
+    rng = np.random.default_rng(1)
+    opcodes = rng.integers(0, len(OPCODES), NUM_INSTRUCTIONS)
+    operands = rng.integers(0, 4, NUM_INSTRUCTIONS)
+
+    t0 = time.perf_counter()
+    batch = encode(opcodes, operands)
+    encode_time = time.perf_counter() - t0
+    data = batch.to_bytes()
+    t0 = time.perf_counter()
+    decoded_opcodes, decoded_operands = InstructionDecoder().execute(InstructionBatch.from_bytes(data))
+    decode_time = time.perf_counter() - t0
+    assert (decoded_opcodes == opcodes).all() and (decoded_operands == operands).all()
+    print("-- PACKED INSTRUCTION BATCH (" + str(NUM_INSTRUCTIONS) + " instructions) --")
+    print("size: ", len(data), " bytes (", len(data) * 8 / NUM_INSTRUCTIONS, " bits/instruction )")
+    print("encode: ", NUM_INSTRUCTIONS / encode_time, " instructions/sec, decode: ", NUM_INSTRUCTIONS / decode_time, " instructions/sec")
+
+    # per-instruction Python objects, as NVNode.instructions used to hold them
+    names = list(OPCODES)
+    objects = [(0.0, names[o], r) for o, r in zip(opcodes[:1000000].tolist(), operands[:1000000].tolist())]
+    t0 = time.perf_counter()
+    counts = {}
+    for _, name, operand in objects:
+        code = OPCODES[name]
+        counts[code] = counts.get(code, 0) + 1
+    print("per-instruction tuples: ", len(objects) / (time.perf_counter() - t0), " instructions/sec")
+
+    # typical schedule slot: a handful of instructions per node
+    slot_codes = [instruction_code("CNOT", 1), instruction_code("X", 1), instruction_code("Z", 1)]
+    decoder = InstructionDecoder()
+    t0 = time.perf_counter()
+    for slot in range(100000):
+        decoder.execute(pack_codes(slot_codes, slot))
+    elapsed = time.perf_counter() - t0
+    print("3-instruction slot batches: ", decoder.batches / elapsed, " batches/sec, ", decoder.summary())
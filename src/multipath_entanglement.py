@@ -0,0 +1,234 @@
+# Multi-path entanglement distribution across node-disjoint routes
+# A single route from get_quantum_route carries the whole end-to-end request, so the link with the fewest
+# EPR pairs (the bottleneck) caps the end-to-end throughput.
+# This splits a request for n end-to-end pairs over several node-disjoint paths:
+# 1. Find node-disjoint paths between the end nodes on the quantum connections
+# 2. Split n in proportion to each path's EPR availability (EPR pairs on its bottleneck link)
+# 3. Authenticate the repeaters of ALL paths concurrently (one handshake thread per repeater, like pqc_handshake)
+# 4. Distribute the pairs on every path in parallel, each pair by entanglement swapping along its path
+# 5. Report per-path delivery and aggregate pairs/sec
+import threading
+import time
+import networkx
+from qunetsim.objects import Logger
+from swap_scheduler import swap_tree
+
+MAX_PATHS = 4 # upper bound on the number of disjoint paths used for one request
+
+def quantum_graph(network):
+    # undirected graph of all quantum connections in the network
+    graph = networkx.Graph()
+    for host_id in network.ARP.keys():
+        host = network.get_host(host_id)
+        for connection in host.get_connections():
+            if connection['type'] == 'quantum':
+                graph.add_edge(host.host_id, connection['connection'])
+    return graph
+
+def disjoint_routes(network, source, dest, max_paths=MAX_PATHS):
+    """
+    Node-disjoint routes between two end nodes, shortest first.
+
+    Args:
+        network (Network): QuNetSim network instance
+        source (str): The sender ID
+        dest (str): The receiver ID
+        max_paths (int): maximum number of routes returned
+    Returns:
+        (list): list of routes, each ordered by the steps in the route
+    """
+    try:
+        routes = list(networkx.node_disjoint_paths(quantum_graph(network), source, dest))
+    except Exception as e:
+        Logger.get_instance().error(e)
+        return []
+    routes.sort(key=len)
+    return routes[:max_paths]
+
+def path_capacity(network, route):
+    # EPR availability of a path = EPR pairs on its bottleneck link
+    capacity = None
+    for u, v in zip(route, route[1:]):
+        num_epr_pairs = len(network.get_host(u).get_epr_pairs(v))
+        capacity = num_epr_pairs if capacity is None else min(capacity, num_epr_pairs)
+    return capacity or 0
+
+def split_request(num_pairs, capacities):
+    """
+    Splits num_pairs in proportion to the capacities (largest remainder), equally if no path holds pairs.
+
+    Args:
+        num_pairs (int): number of end-to-end pairs requested
+        capacities (list): EPR availability of every path
+    Returns:
+        (list): number of pairs assigned to every path, sums to num_pairs
+    """
+    if not capacities:
+        return []
+    total = sum(capacities)
+    if total == 0:
+        capacities = [1] * len(capacities)
+        total = len(capacities)
+    shares = [num_pairs * c / total for c in capacities]
+    counts = [int(s) for s in shares]
+    # hand out what is left to the paths with the largest remainder
+    leftover = num_pairs - sum(counts)
+    by_remainder = sorted(range(len(shares)), key=lambda i: shares[i] - counts[i], reverse=True)
+    for i in by_remainder[:leftover]:
+        counts[i] += 1
+    return counts
+
+def authenticate_paths(initiator, routes, handshake_fn, sessions):
+    """
+    Authenticates every repeater of every route concurrently.
+    Nodes the initiator already has a successful session with are skipped.
+
+    Args:
+        initiator (Host): the end node that starts the request
+        routes (list): routes returned by disjoint_routes
+        handshake_fn (function): handshake_fn(initiator, node_id), e.g. handshake_with_node
+        sessions (SessionTable): handshake_state, where handshake_fn stores successful sessions
+    Returns:
+        (bool): True if every node on every route is authenticated
+    """
+    nodes = []
+    for route in routes:
+        for node_id in route[1:]:
+            if node_id not in nodes:
+                nodes.append(node_id)
+
+    threads = []
+    for node_id in nodes:
+        if sessions.lookup(initiator.host_id, node_id) is not None:
+            continue
+        print("Starting handshake thread for node: ", node_id)
+        t = threading.Thread(target=handshake_fn, args=(initiator, node_id))
+        t.start()
+        threads.append(t)
+    for t in threads: t.join()
+    return all(sessions.lookup(initiator.host_id, node_id) is not None for node_id in nodes)
+
+def generate_link(network, u, v):
+    """
+    Link-level EPR pair between two neighbours.
+
+    Returns:
+        (tuple): (qubit at u, qubit at v), or None if the pair could not be created
+    """
+    host_u = network.get_host(u)
+    host_v = network.get_host(v)
+    epr_id, ack_arrived = host_u.send_epr(v, await_ack=True)
+    if not ack_arrived:
+        return None
+    q_u = host_u.get_epr(v, q_id=epr_id)
+    q_v = host_v.get_epr(u, q_id=epr_id, wait=5)
+    if q_u is None or q_v is None:
+        return None
+    return q_u, q_v
+
+def swap_links(links, policy="nested"):
+    """
+    Joins link-level pairs into one end-to-end pair by swapping at every repeater,
+    in nested (doubling) or sequential order (swap_scheduler.swap_tree).
+
+    Args:
+        links (list): links[i] = (qubit at route[i], qubit at route[i+1])
+    Returns:
+        (tuple): (source qubit, dest qubit) sharing |Phi+>
+    """
+    # segments[(i, j)] = (qubit at route[i], qubit at route[j]) sharing |Phi+>
+    segments = {(i, i + 1): pair for i, pair in enumerate(links)}
+    for _, left, right in swap_tree(len(links), policy):
+        q_start, q_far = segments.pop(left)
+        q_left, q_right = segments.pop(right)
+        # Bell state measurement at the repeater between q_far (left segment) and q_left (right segment)
+        q_far.cnot(q_left)
+        q_far.H()
+        m_z = q_far.measure()
+        m_x = q_left.measure()
+        # Pauli correction on the far end of the right segment
+        if m_x == 1:
+            q_right.X()
+        if m_z == 1:
+            q_right.Z()
+        segments[(left[0], right[1])] = (q_start, q_right)
+    return segments[(0, len(links))]
+
+def swap_along_path(network, route, policy="nested"):
+    """
+    Creates one end-to-end EPR pair along a route: one link-level pair per link, then swap_links.
+
+    Returns:
+        (tuple): (source qubit, dest qubit) sharing |Phi+>, or None if a link-level pair could not be created
+    """
+    links = []
+    for u, v in zip(route, route[1:]):
+        pair = generate_link(network, u, v)
+        if pair is None:
+            return None
+        links.append(pair)
+    return swap_links(links, policy)
+
+def distribute_on_path(network, route, num_pairs, report):
+    # runs in its own thread, one per route
+    start = time.perf_counter()
+    delivered = []
+    for _ in range(num_pairs):
+        pair = swap_along_path(network, route)
+        if pair is not None:
+            delivered.append(pair)
+    report["pairs"] = delivered
+    report["delivered"] = len(delivered)
+    report["time"] = time.perf_counter() - start
+
+def distribute_multipath(network, initiator, dest_id, num_pairs, handshake_fn, sessions, max_paths=MAX_PATHS):
+    """
+    Entanglement service entry point: n end-to-end pairs over node-disjoint paths.
+
+    Args:
+        network (Network): QuNetSim network instance
+        initiator (Host): source end node
+        dest_id (str): ID of the destination end node
+        num_pairs (int): number of end-to-end pairs requested
+        handshake_fn (function): handshake_fn(initiator, node_id)
+        sessions (SessionTable): handshake_state
+        max_paths (int): maximum number of disjoint paths
+    Returns:
+        (dict): {"paths": [per-path report], "delivered": int, "time": float, "pairs_per_sec": float}
+    """
+    routes = disjoint_routes(network, initiator.host_id, dest_id, max_paths)
+    if not routes:
+        return {"paths": [], "delivered": 0, "time": 0.0, "pairs_per_sec": 0.0}
+
+    capacities = [path_capacity(network, route) for route in routes]
+    counts = split_request(num_pairs, capacities)
+
+    t0 = time.perf_counter()
+    if not authenticate_paths(initiator, routes, handshake_fn, sessions):
+        print("Authentication failed on at least one path. Aborting.")
+        return {"paths": [], "delivered": 0, "time": time.perf_counter() - t0, "pairs_per_sec": 0.0}
+    auth_time = time.perf_counter() - t0
+
+    reports = []
+    threads = []
+    for route, capacity, count in zip(routes, capacities, counts):
+        report = {"route": route, "capacity": capacity, "requested": count}
+        reports.append(report)
+        if count == 0:
+            report.update(pairs=[], delivered=0, time=0.0)
+            continue
+        t = threading.Thread(target=distribute_on_path, args=(network, route, count, report))
+        t.start()
+        threads.append(t)
+    for t in threads: t.join()
+    total_time = time.perf_counter() - t0
+
+    delivered = sum(r["delivered"] for r in reports)
+    print("-- MULTI-PATH DELIVERY --")
+    for r in reports:
+        rate = r["delivered"] / r["time"] if r["time"] > 0 else 0.0
+        print(str(r["route"]) + " : " + str(r["delivered"]) + "/" + str(r["requested"]) + " pairs, " + str(rate) + " pairs/sec")
+    print("authentication time: ", auth_time)
+    print("aggregate pairs/sec: ", delivered / total_time if total_time > 0 else 0.0)
+    return {"paths": reports, "delivered": delivered, "time": total_time,
+            "pairs_per_sec": delivered / total_time if total_time > 0 else 0.0}
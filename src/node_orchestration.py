@@ -0,0 +1,512 @@
+# Event-driven Node Orchestration Layer for NV-center repeater nodes
+# (see Control Plane Design/Quantum Network Architecture.md, "Node Orchestration Layer")
+# Translates classical control messages into local instructions, e.g.
+#   START_ENTANGLEMENT(B, N2, slot=5) --> ALLOC_MEM(N2), PREPARE_ELECTRON(), SCHEDULE_ENT_ATTEMPT(slot=5), WAIT_FOR_HERALD()
+# Once the herald result arrives it sends CNOT to the instruction interface (store in the nuclear register) and
+# the Pauli correction gates for the heralded Bell state.
+#
+# Every node is an explicit state machine and every operation is an event in ONE priority queue (EventLoop),
+# so no thread is blocked per operation: WAIT_FOR_HERALD only records that the node waits, the herald is a new event.
+# One process can host hundreds of NV nodes, and the dispatch latency of every event is measured.
+import heapq
+import itertools
+import random
+import time
+from quantum_memory import MemoryPool, ALLOCATED, STORED
+from timer_wheel import TimerWheel
+from instruction_codec import OPERAND_BITS, InstructionDecoder, instruction_code, pack_codes
+from pauli_frame import PauliFrameTracker
+
+
+# electron spin states
+ELECTRON_IDLE = "IDLE"
+ELECTRON_PREPARED = "PREPARED"
+ELECTRON_ATTEMPTING = "ATTEMPTING"
+ELECTRON_WAITING = "WAITING_FOR_HERALD"
+
+# event priorities at the same time stamp: heralds first, then local steps, then new requests
+PRIO_HERALD = 0
+PRIO_STEP = 1
+PRIO_REQUEST = 2
+
+# NV abstraction parameters (seconds)
+SLOT_DURATION = 10e-6 # one TDMA slot = one entanglement attempt
+PREPARE_TIME = 2e-6 # electron spin initialisation
+HERALD_DELAY = 5e-6 # photon travel to the heralding station and classical result back
+CNOT_TIME = 5e-6 # electron -> nuclear register swap
+GATE_TIME = 0.1e-6 # single qubit Pauli gate on the nuclear register
+P_SUCCESS = 0.05 # success probability of one entanglement attempt
+MAX_ATTEMPTS = 1000 # attempts before the link request fails
+NUM_REGISTERS = 4 # nuclear spin registers per NV node
+DECOHERENCE_TICK = 1e-3 # fidelity of all stored pairs is updated (vectorized) once per tick when min_fidelity is set
+
+# Bell states heralded by the middle station, as (x, z) bits: correction = X^x Z^z
+BELL_STATES = {0: "PHI_PLUS", 1: "PSI_PLUS", 2: "PHI_MINUS", 3: "PSI_MINUS"}
+
+class EventLoop:
+    """
+    Heap-based event queue. Events are ordered by (time, priority, sequence number).
+    With the default wall clock the loop sleeps until the next event is due, one thread for all nodes.
+    While a handler runs, now() is the scheduled time of its event, not the clock: when the loop lags behind the
+    wall clock, events run late but everything they schedule stays on the slot grid, so both endpoints of a link
+    keep attempting in the same slots (max_lag records how far behind the loop fell).
+    """
+    def __init__(self, clock=time.perf_counter, record_dispatch=True):
+        self.clock = clock
+        self._queue = []
+        self._seq = itertools.count()
+        self.events_dispatched = 0
+        self.record_dispatch = record_dispatch # False for long campaigns, the list grows with every event
+        self.dispatch_times = [] # handler run time of every dispatched event (seconds)
+        self.max_lag = 0.0 # seconds the latest event was dispatched after its scheduled time
+        self._dispatching = None # scheduled time of the event being dispatched
+
+    def now(self):
+        return self._dispatching if self._dispatching is not None else self.clock()
+
+    def call_at(self, when, callback, *args, priority=PRIO_STEP):
+        event = [when, priority, next(self._seq), callback, args]
+        heapq.heappush(self._queue, event)
+        return event
+
+    def call_later(self, delay, callback, *args, priority=PRIO_STEP):
+        return self.call_at(self.now() + delay, callback, *args, priority=priority)
+
+    def cancel(self, event):
+        event[3] = None # skipped when popped
+
+    def _wait_until(self, when):
+        delay = when - self.now()
+        if delay > 0:
+            time.sleep(delay)
+
+    def run(self, until=None):
+        """
+        Dispatches events in time order until the queue is empty or the next event is later than `until`.
+        """
+        queue = self._queue
+        while queue:
+            when = queue[0][0]
+            if until is not None and when > until:
+                break
+            self._wait_until(when)
+            _, _, _, callback, args = heapq.heappop(queue)
+            if callback is None:
+                continue
+            lag = self.clock() - when
+            if lag > self.max_lag:
+                self.max_lag = lag
+            self._dispatching = when
+            try:
+                if self.record_dispatch:
+                    start = time.perf_counter()
+                    callback(*args)
+                    self.dispatch_times.append(time.perf_counter() - start)
+                else:
+                    callback(*args)
+            finally:
+                self._dispatching = None
+            self.events_dispatched += 1
+
+    def __len__(self):
+        return len(self._queue)
+
+class NVNode:
+    __slots__ = ("node_id", "electron", "memory", "instructions", "operand_bits", "stats", "slot_epoch",
+                 "slot_requests")
+
+    def __init__(self, node_id, memory):
+        self.node_id = node_id
+        self.electron = ELECTRON_IDLE
+        self.memory = memory # NuclearMemory (quantum_memory.py), register allocation and stored links
+        self.instructions = [] # instruction codes of the current slot, sent to the decoder as one packed batch
+        # operand field wide enough for every register of the node (repeaters may have more than 8)
+        self.operand_bits = max(OPERAND_BITS, (memory.num_registers - 1).bit_length())
+        self.stats = {"attempts": 0, "stored": 0, "failed": 0, "expired": 0}
+        self.slot_epoch = -1 # epoch of the TDMA slot table the node runs (tdma_scheduler.apply_slot_table)
+        self.slot_requests = [] # LinkRequests started from that slot table, cancelled when a newer one arrives
+
+class LinkRequest:
+    # one START_ENTANGLEMENT on one node, executed as a small program of local instructions
+    __slots__ = ("node_id", "peer", "register", "slot", "period", "reservation", "program", "pc", "attempts", "on_done",
+                 "cancelled")
+
+    def __init__(self, node_id, peer, register, slot, period=1, reservation=None, on_done=None):
+        self.node_id = node_id
+        self.peer = peer
+        self.register = register # None = any free register
+        self.slot = slot
+        self.period = period # slots between two attempts of this link (TDMA)
+        self.reservation = reservation # path reservation to allocate the register from (MemoryPool.reserve_path)
+        self.program = [("ALLOC_MEM", register), ("PREPARE_ELECTRON",), ("SCHEDULE_ENT_ATTEMPT",), ("WAIT_FOR_HERALD",)]
+        self.pc = 0
+        self.attempts = 0
+        self.on_done = on_done # on_done(request, success)
+        self.cancelled = False # withdrawn by the control layer (NodeOrchestrator.cancel), no further attempts
+
+class NodeOrchestrator:
+    def __init__(self, loop=None, p_success=P_SUCCESS, seed=None, attempt_model=None, fast_forward=False, cutoff=None,
+                 pauli_frame=False, min_fidelity=None):
+        """
+        Args:
+            loop (EventLoop): event loop shared by all nodes, e.g. des_kernel.Simulator for virtual time
+            p_success (float): success probability of one attempt when no attempt_model is given
+            seed (int): seed of the per-attempt RNG
+            attempt_model (AttemptModel): vectorized outcome source (attempt_model.py), replaces p_success
+            fast_forward (bool): with an attempt_model, deliver a run of failed attempts as ONE failed herald
+                                 that skips the link's failed slots, instead of one event per attempt
+            cutoff (float): seconds a stored link is kept before it is discarded (memory decoherence), None = forever
+            pauli_frame (bool): record heralded Bell states and swap outcomes in a PauliFrameTracker and apply one
+                                correction when a pair is consumed, instead of correcting after every herald
+            min_fidelity (float): stored pairs whose fidelity decayed below this are discarded, checked for all
+                                  nodes at once every DECOHERENCE_TICK; None = no fidelity cutoff
+        """
+        self.loop = loop if loop is not None else EventLoop()
+        self.p_success = p_success
+        self.rng = random.Random(seed)
+        self.attempt_model = attempt_model
+        self.fast_forward = fast_forward
+        self.nodes = {}
+        self.memory = MemoryPool(NUM_REGISTERS) # register state, fidelity and frame of all nodes (structured array)
+        # (link, slot) -> requests of the endpoints that attempt in that slot, the heralding station needs both
+        self._slot_attempts = {}
+        self._link_runs = {} # link -> [failures left before the next success, its Bell state]
+        self.cutoff = cutoff
+        self.timers = TimerWheel().attach(self.loop) # memory cutoffs (and other control-plane deadlines)
+        self._cutoff_timers = {} # (node_id, register) -> Timer
+        self.decoder = InstructionDecoder() # instruction interface of the hosted nodes
+        # both ends of every stored pair (swaps update the far ends); its frames are only used with pauli_frame
+        self.pairs = PauliFrameTracker()
+        self.frames = self.pairs if pauli_frame else None
+        self.min_fidelity = min_fidelity
+        self._decoherence_event = None
+
+    def add_node(self, node_id, num_registers=NUM_REGISTERS):
+        self.nodes[node_id] = NVNode(node_id, self.memory.add(node_id, num_registers))
+        return self.nodes[node_id]
+
+    def slot_time(self, slot):
+        return slot * SLOT_DURATION
+
+    def next_slot(self, after=None):
+        # first slot whose electron preparation can still start at or after `after`
+        now = self.loop.now() if after is None else after
+        return int(-(-(now + PREPARE_TIME) // SLOT_DURATION))
+
+    # -- classical messages from the distributed control layer --
+    def handle_message(self, node_id, message, on_done=None):
+        """
+        Entry point of the layer.
+        message = ("START_ENTANGLEMENT", peer, register, slot[, period[, reservation]])
+        register None lets ALLOC_MEM pick the lowest free register (of the reservation, if one is given)
+        """
+        kind = message[0]
+        if kind == "START_ENTANGLEMENT":
+            request = LinkRequest(node_id, *message[1:], on_done=on_done)
+            self.loop.call_later(0.0, self._step, request, priority=PRIO_REQUEST)
+            return request
+        raise ValueError("unknown control message: " + str(kind))
+
+    def send_instruction(self, node, opcode, operand=0):
+        # collect the instruction, the whole slot goes to the instruction interface (decoder) at the end of the slot
+        code = instruction_code(opcode, operand, node.operand_bits) # ValueError if the operand does not fit
+        if not node.instructions:
+            slot = int(self.loop.now() // SLOT_DURATION)
+            self.loop.call_at(self.slot_time(slot + 1), self._flush_instructions, node, slot)
+        node.instructions.append(code)
+
+    def _flush_instructions(self, node, slot):
+        batch = pack_codes(node.instructions, slot, node.operand_bits)
+        node.instructions = []
+        self.decoder.execute(batch)
+
+    # -- state machine --
+    def _step(self, request):
+        node = self.nodes[request.node_id]
+        if request.cancelled:
+            if request.pc == 2:
+                node.electron = ELECTRON_IDLE # prepared for the attempt this request no longer makes
+            return
+        op = request.program[request.pc]
+        handler = getattr(self, "_op_" + op[0].lower())
+        handler(node, request, *op[1:])
+
+    def _schedule_prepare(self, request):
+        # PREPARE_ELECTRON runs right before the attempt slot, so the electron is only booked for that slot
+        # and can serve the node's other links in the slots in between
+        request.pc = 1
+        next_slot = self.next_slot()
+        if request.slot < next_slot:
+            # keep the link on its own slots (slot mod period) so both endpoints stay aligned
+            missed = -(-(next_slot - request.slot) // request.period)
+            request.slot += missed * request.period
+        self.loop.call_at(self.slot_time(request.slot) - PREPARE_TIME, self._step, request)
+
+    def _fail(self, node, request):
+        node.stats["failed"] += 1
+        self._free_allocated(node, request)
+        if request.on_done is not None:
+            request.on_done(request, False)
+
+    def _free_allocated(self, node, request):
+        # the register ALLOC_MEM took for the request, while no link is stored in it
+        memory = node.memory
+        if request.register is not None and memory.state[request.register] == ALLOCATED \
+                and memory.owner[request.register][1] is request:
+            memory.release(request.register)
+
+    def cancel(self, request):
+        """
+        Withdraws a START_ENTANGLEMENT (e.g. a newer TDMA slot table): the request makes no further attempts and
+        its allocated register is free again. A link it stored already stays with its owner; on_done is not called.
+
+        Returns:
+            (bool): False if the request was cancelled before
+        """
+        if request.cancelled:
+            return False
+        request.cancelled = True
+        self._free_allocated(self.nodes[request.node_id], request)
+        return True
+
+    def _op_alloc_mem(self, node, request, register):
+        register = node.memory.allocate((request.peer, request), register, request.reservation)
+        if register is None:
+            self._fail(node, request) # register busy: the control layer has to pick another one
+            return
+        request.register = register
+        self._schedule_prepare(request)
+
+    def _op_prepare_electron(self, node, request):
+        if node.electron != ELECTRON_IDLE:
+            # electron booked by another link in this slot: this attempt is lost, the station reports a failure
+            self._attempt_missed(request)
+            return
+        node.electron = ELECTRON_PREPARED
+        request.pc += 1
+        self.loop.call_later(PREPARE_TIME, self._step, request)
+
+    def _op_schedule_ent_attempt(self, node, request):
+        # spin-photon entanglement in the slot; the heralding station needs the photons of both endpoints
+        node.electron = ELECTRON_ATTEMPTING
+        node.stats["attempts"] += 1
+        request.attempts += 1
+        request.pc += 1 # WAIT_FOR_HERALD
+        link = (request.node_id, request.peer) if request.node_id < request.peer else (request.peer, request.node_id)
+        key = (link, request.slot)
+        waiting = self._slot_attempts.setdefault(key, [])
+        waiting.append(request)
+        if len(waiting) == 2:
+            del self._slot_attempts[key]
+            if self.attempt_model is not None:
+                success, bell_state, skip = self._model_outcome(link)
+            else:
+                success = self.rng.random() < self.p_success
+                bell_state = self.rng.randrange(4) if success else None
+                skip = 0
+            for r in waiting:
+                self.loop.call_later(HERALD_DELAY, self._herald, r, success, bell_state, skip, priority=PRIO_HERALD)
+        else:
+            # the peer may still attempt in this slot, otherwise the station reports a failure
+            self.loop.call_later(HERALD_DELAY, self._expire_slot, key, priority=PRIO_HERALD)
+        node.electron = ELECTRON_WAITING
+
+    def _model_outcome(self, link):
+        # outcome of this slot from the attempt model: (success, bell state, failed slots to skip)
+        run = self._link_runs.get(link)
+        if run is None:
+            run = list(self.attempt_model.next_run(link))
+            self._link_runs[link] = run
+        failures, bell_state = run
+        if failures == 0:
+            del self._link_runs[link]
+            return True, bell_state, 0
+        if self.fast_forward:
+            run[0] = 0
+            return False, None, failures - 1
+        run[0] = failures - 1
+        return False, None, 0
+
+    def _op_wait_for_herald(self, node, request):
+        # nothing to do: the herald is an event of its own (_herald), no thread waits for it
+        pass
+
+    def _attempt_missed(self, request):
+        request.attempts += 1
+        if request.attempts >= MAX_ATTEMPTS:
+            self._fail(self.nodes[request.node_id], request)
+            return
+        request.slot += request.period
+        self._schedule_prepare(request)
+
+    def _expire_slot(self, key):
+        waiting = self._slot_attempts.pop(key, None)
+        if waiting:
+            for r in waiting:
+                self._herald(r, False, None)
+
+    def _herald(self, request, success, bell_state, skip=0):
+        node = self.nodes[request.node_id]
+        if request.cancelled:
+            node.electron = ELECTRON_IDLE
+            return
+        if not success:
+            node.electron = ELECTRON_IDLE
+            # fast forward: `skip` more failed attempts of this link, in its own slots
+            request.attempts += skip
+            node.stats["attempts"] += skip
+            if request.attempts >= MAX_ATTEMPTS:
+                self._fail(node, request)
+                return
+            request.slot += request.period * (1 + skip)
+            self._schedule_prepare(request)
+            return
+        # store in the nuclear register (CNOT), then the electron is free again
+        self.send_instruction(node, "CNOT", request.register)
+        self.loop.call_later(CNOT_TIME, self._stored, request, bell_state)
+
+    def _stored(self, request, bell_state):
+        node = self.nodes[request.node_id]
+        node.electron = ELECTRON_IDLE
+        if request.cancelled:
+            return # cancelled during the CNOT, its register is free already
+        link = (request.node_id, request.peer) if request.node_id < request.peer else (request.peer, request.node_id)
+        end = (request.node_id, request.register)
+        if self.frames is not None:
+            # no gate now, the correction is part of the pair's Pauli frame
+            self.frames.herald_end((link, request.slot), end, bell_state)
+            node.memory.store(request.register, request.peer, bell_state, self.loop.now())
+        else:
+            self.pairs.herald_end((link, request.slot), end, 0) # corrected below, the pair is |PHI_PLUS>
+            # Pauli correction to the reference state |PHI_PLUS>, applied by the end of the link with the larger id
+            x, z = bell_state & 1, bell_state >> 1
+            if request.node_id > request.peer:
+                if x:
+                    self.send_instruction(node, "X", request.register)
+                if z:
+                    self.send_instruction(node, "Z", request.register)
+            node.memory.store(request.register, request.peer, 0, self.loop.now())
+        node.stats["stored"] += 1
+        if self.cutoff is not None:
+            key = (request.node_id, request.register)
+            self._cutoff_timers[key] = self.timers.arm(self.cutoff, self._cutoff_expired, key)
+        if self.min_fidelity is not None and self._decoherence_event is None:
+            self._decoherence_event = self.loop.call_later(DECOHERENCE_TICK, self._decoherence_tick)
+        if request.on_done is not None:
+            request.on_done(request, True)
+
+    def _cutoff_expired(self, keys):
+        # batch of stored links that passed the cutoff: discard them, the registers are free again
+        for node_id, register in keys:
+            del self._cutoff_timers[(node_id, register)]
+            self._discard(node_id, register)
+
+    def _discard(self, node_id, register):
+        node = self.nodes[node_id]
+        node.memory.release(register)
+        node.stats["expired"] += 1
+        self.pairs.discard((node_id, register))
+
+    def _decoherence_tick(self):
+        # one vectorized fidelity update and threshold check over the registers of all nodes
+        self._decoherence_event = None
+        now = self.loop.now()
+        self.memory.decohere(now)
+        for node_id, register in self.memory.expired(now, min_fidelity=self.min_fidelity):
+            timer = self._cutoff_timers.pop((node_id, register), None)
+            if timer is not None:
+                self.timers.cancel(timer)
+            self._discard(node_id, register)
+        if (self.memory.states == STORED).any():
+            self._decoherence_event = self.loop.call_later(DECOHERENCE_TICK, self._decoherence_tick)
+
+    def fidelity(self, node_id, register):
+        # current fidelity of the pair stored in the register
+        return self.memory.fidelity(node_id, register, self.loop.now())
+
+    def _release(self, node_id, register):
+        timer = self._cutoff_timers.pop((node_id, register), None)
+        if timer is not None:
+            self.timers.cancel(timer)
+        self.nodes[node_id].memory.release(register)
+
+    def consume(self, node_id, register):
+        # the stored link is used by the application before its cutoff
+        gate = self.pairs.consume((node_id, register))
+        if self.frames is not None and gate is not None and gate != "I":
+            self.send_instruction(self.nodes[node_id], gate, register) # the pair's only correction
+        self._release(node_id, register)
+
+    def drop(self, node_id, register):
+        # the stored pair is of no use any more (measured, failed purification), the register is free again
+        self.pairs.discard((node_id, register))
+        self._release(node_id, register)
+
+    def distill(self, node_id, keep_register, sacrifice_register):
+        # local half of a purification round: CNOT from the kept onto the sacrificed pair, measure the sacrificed one
+        node = self.nodes[node_id]
+        self.send_instruction(node, "CNOT", keep_register)
+        self.send_instruction(node, "MEASURE", sacrifice_register)
+        self.drop(node_id, sacrifice_register)
+
+    def swap(self, node_id, left_register, right_register, m_x, m_z):
+        # Bell state measurement of two stored links at a repeater, both registers are free afterwards
+        node = self.nodes[node_id]
+        self.send_instruction(node, "CNOT", left_register)
+        self.send_instruction(node, "MEASURE", left_register)
+        self.send_instruction(node, "MEASURE", right_register)
+        pair = self.pairs.swap((node_id, left_register), (node_id, right_register), m_x, m_z)
+        if pair is not None:
+            # Werner parameters multiply: p = (4F - 1) / 3 of the joined pair is p_left * p_right
+            p = (4 * self.fidelity(node_id, left_register) - 1) * (4 * self.fidelity(node_id, right_register) - 1) / 9
+            for (end_node, end_register), (far_node, _) in zip(pair.ends, pair.ends[::-1]):
+                memory = self.memory[end_node]
+                # without Pauli frames the outcome is corrected at the far end, the stored frame stays
+                frame = pair.frame if self.frames is not None else int(memory.record["frame"][end_register])
+                memory.set_pair(end_register, frame, (1 + 3 * p) / 4, self.loop.now(), far_node)
+        self._release(node_id, left_register)
+        self._release(node_id, right_register)
+
+def dispatch_summary(dispatch_times):
+    # mean / median / p99 dispatch latency in microseconds
+    if not dispatch_times:
+        return 0.0, 0.0, 0.0
+    x = sorted(dispatch_times)
+    return (sum(x) / len(x) * 1e6, x[len(x) // 2] * 1e6, x[int(len(x) * 0.99) - 1] * 1e6)
+
+def run_chain(num_nodes, links_per_node=1, seed=1, loop=None):
+    """
+    Hosts num_nodes NV nodes in a chain and keeps every link busy with START_ENTANGLEMENT requests.
+
+    Returns:
+        (NodeOrchestrator): the orchestrator after every request finished
+    """
+    orchestrator = NodeOrchestrator(loop, seed=seed)
+    node_ids = ["node" + str(i) for i in range(num_nodes)]
+    for node_id in node_ids:
+        orchestrator.add_node(node_id)
+    start_slot = orchestrator.next_slot() + 1
+    for i, (a, b) in enumerate(zip(node_ids, node_ids[1:])):
+        # even links use registers 0/1 and odd links registers 2/3, so a node never allocates the same register twice
+        # even links attempt in even slots and odd links in odd slots, so one electron serves both links of a node
+        for k in range(links_per_node):
+            register = (i % 2) * 2 + k % 2
+            message = ("START_ENTANGLEMENT", b, register, start_slot + (i % 2), 2)
+            orchestrator.handle_message(a, message)
+            orchestrator.handle_message(b, ("START_ENTANGLEMENT", a) + message[2:])
+    orchestrator.loop.run()
+    return orchestrator
+
+if __name__ == '__main__':
+    for num_nodes in [10, 100, 500]:
+        t0 = time.perf_counter()
+        orchestrator = run_chain(num_nodes)
+        elapsed = time.perf_counter() - t0
+        stored = sum(n.stats["stored"] for n in orchestrator.nodes.values())
+        failed = sum(n.stats["failed"] for n in orchestrator.nodes.values())
+        mean, median, p99 = dispatch_summary(orchestrator.loop.dispatch_times)
+        print("-- NODE ORCHESTRATION (" + str(num_nodes) + " NV nodes) --")
+        print("events dispatched: ", orchestrator.loop.events_dispatched, " in ", elapsed, " s")
+        # under the wall clock, a loop that cannot keep up runs late (max lag) but stays on the slot grid
+        print("link endpoints stored/failed: ", stored, "/", failed, " max lag: ", orchestrator.loop.max_lag * 1e3, " ms")
+        print("dispatch latency mean/median/p99 (us): ", (mean, median, p99))
@@ -0,0 +1,141 @@
+# Pauli-frame tracking for stored entanglement
+# (Entanglement Services.md: "Correction (if necessary)" after every herald and after every swap)
+# Correcting every heralded pair and every swapped segment to |PHI_PLUS> right away costs a gate per step and,
+# after a swap, a classical message to the node that holds the far end before the segment can be used.
+# Instead the control plane only RECORDS the correction of every pair as (x, z) bits (X^x Z^z, same encoding as
+# BELL_STATES: 0 = PHI_PLUS, 1 = PSI_PLUS, 2 = PHI_MINUS, 3 = PSI_MINUS):
+# - herald: the pair's frame is its heralded Bell state
+# - swap of (a, b) and (c, d) with BSM outcome (m_x, m_z) at b/c: the frame of (a, d) is frame_ab ^ frame_cd ^ m
+# - consume: ONE physical gate (I, X, Z or Y = XZ up to a phase) on one end of the pair, only when it is used
+import time
+
+# (x, z) bits -> the single gate that applies X^x Z^z
+CORRECTION_GATES = {0: "I", 1: "X", 2: "Z", 3: "Y"}
+
+class TrackedPair:
+    __slots__ = ("ends", "frame", "consumed")
+
+    def __init__(self, end_a, end_b, frame):
+        self.ends = (end_a, end_b) # (node_id, register) of both ends
+        self.frame = frame
+        self.consumed = 0
+
+class PauliFrameTracker:
+    def __init__(self):
+        self.pairs = {} # (node_id, register) -> TrackedPair
+        self._heralds = {} # key of a link pair -> first end that reported it
+        # "immediate" = gates the per-step correction of Entanglement Services.md would have applied
+        self.stats = {"immediate_gates": 0, "frame_gates": 0, "swaps": 0, "pairs_consumed": 0}
+
+    def herald_end(self, key, end, bell_state):
+        """
+        Reports one end of a heralded link pair, the pair is tracked once both ends reported.
+
+        Args:
+            key: same value at both ends, e.g. (link, slot)
+            end (tuple): (node_id, register)
+            bell_state (int): heralded Bell state as (x, z) bits
+        """
+        first = self._heralds.pop(key, None)
+        if first is None:
+            self._heralds[key] = end
+            return None
+        return self.herald(first, end, bell_state)
+
+    def herald(self, end_a, end_b, bell_state):
+        pair = TrackedPair(end_a, end_b, bell_state)
+        self.pairs[end_a] = pair
+        self.pairs[end_b] = pair
+        self.stats["immediate_gates"] += bin(bell_state).count("1") # X and/or Z on one end
+        return pair
+
+    def swap(self, left_end, right_end, m_x, m_z):
+        """
+        Bell state measurement of two ends at one repeater, joins their pairs into one pair of the far ends.
+
+        Returns:
+            (TrackedPair): the joined pair, None if one of the ends is not tracked
+        """
+        left = self.pairs.pop(left_end, None)
+        right = self.pairs.pop(right_end, None)
+        if left is None or right is None:
+            return None
+        far_left = left.ends[0] if left.ends[1] == left_end else left.ends[1]
+        far_right = right.ends[0] if right.ends[1] == right_end else right.ends[1]
+        outcome = m_x | (m_z << 1)
+        pair = TrackedPair(far_left, far_right, left.frame ^ right.frame ^ outcome)
+        self.pairs[far_left] = pair
+        self.pairs[far_right] = pair
+        self.stats["swaps"] += 1
+        self.stats["immediate_gates"] += bin(outcome).count("1")
+        return pair
+
+    def frame(self, end):
+        pair = self.pairs.get(end)
+        return None if pair is None else pair.frame
+
+    def consume(self, end):
+        """
+        The end node uses its qubit of the pair. The second end of the pair (ends[1]) applies the whole frame.
+
+        Returns:
+            (str): gate to apply on this end before use ("I" = none), None if the end is not tracked
+        """
+        pair = self.pairs.pop(end, None)
+        if pair is None:
+            return None
+        pair.consumed += 1
+        if pair.consumed == 2:
+            self.stats["pairs_consumed"] += 1
+        if end != pair.ends[1]:
+            return "I"
+        gate = CORRECTION_GATES[pair.frame]
+        if gate != "I":
+            self.stats["frame_gates"] += 1
+        return gate
+
+    def discard(self, end):
+        # the qubit of this end is lost (cutoff), the pair is of no use any more
+        pair = self.pairs.pop(end, None)
+        if pair is not None:
+            for other in pair.ends:
+                if self.pairs.get(other) is pair:
+                    del self.pairs[other]
+
+if __name__ == '__main__':
+    import numpy as np
+    from node_orchestration import GATE_TIME
+    from swap_scheduler import POLICIES, SwapCoordinator
+    from des_kernel import Simulator
+    NUM_TRIALS = 2000
+    for num_links in [2, 4, 8, 16, 32]:
+        route = ["node" + str(i) for i in range(num_links + 1)]
+        for policy in POLICIES:
+            latency = {"immediate": [], "frame": []}
+            tracker = PauliFrameTracker()
+            t0 = time.perf_counter()
+            for trial in range(NUM_TRIALS):
+                for corrections in latency:
+                    sim = Simulator(seed=trial)
+                    coordinator = SwapCoordinator(sim, route, policy, sim.rng, corrections=corrections)
+                    if corrections == "frame":
+                        for i in range(num_links):
+                            tracker.herald((route[i], 1), (route[i + 1], 0), sim.rng.choice([1, 3]))
+                        coordinator.on_swap = lambda k, m_x, m_z: tracker.swap((route[k], 0), (route[k], 1), m_x, m_z)
+                    for i in range(num_links):
+                        coordinator.link_ready(i)
+                    sim.run()
+                    end = coordinator.end
+                    if corrections == "frame":
+                        tracker.consume((route[0], 1))
+                        if tracker.consume((route[-1], 0)) != "I":
+                            end += GATE_TIME # the one correction, on the end node that consumes
+                    latency[corrections].append(end)
+            wall = time.perf_counter() - t0
+            pairs = tracker.stats["pairs_consumed"]
+            immediate, frame = np.mean(latency["immediate"]), np.mean(latency["frame"])
+            print("-- PAULI FRAME (" + str(num_links) + " links, " + policy + " swapping) --")
+            print("gates per end-to-end pair: immediate ", tracker.stats["immediate_gates"] / pairs,
+                  " frame ", tracker.stats["frame_gates"] / pairs)
+            print("swapping latency (us): immediate ", immediate * 1e6, " frame ", frame * 1e6,
+                  " saved ", (immediate - frame) * 1e6, " wall: ", wall, " s")
@@ -0,0 +1,390 @@
+# Nuclear-spin quantum memory of the NV nodes (ALLOC_MEM in the Node Orchestration Layer)
+# Every NV node has a few nuclear spin registers (N1, N2, ...) that store entanglement after the electron -> nuclear CNOT.
+# NuclearMemory is the allocator of one node:
+# - free registers are bits of an int, allocate = lowest set bit (x & -x), free = set the bit again, both O(1)
+# - registers can be reserved for an upcoming path (reserve), only requests of that path allocate them
+# - every register records its owner (peer, request) and, once stored, the peer, Bell state and store time
+# - stored links are released when they are consumed or when they expire (cutoff)
+# - stored links are indexed per peer (epr_index.py): count, oldest and best pair without a scan over the registers
+#   (ranked with the node's T2, set_pair re-ranks a pair whose fidelity changed and files a swapped pair under its
+#   new peer)
+# MemoryPool keeps the state of every register of every node in ONE NumPy structured array (nodes x registers,
+# fields REGISTER_DTYPE: state, peer, store time, fidelity, Pauli frame), so occupancy, decoherence (fidelity decay
+# with the elapsed time and the node's T2) and cutoff detection over all nodes of a large simulation are a few
+# vectorized operations instead of a Python loop. Every NuclearMemory works on a zero-copy view of its row.
+import time
+import numpy as np
+from epr_index import EntanglementIndex, LINK_FIDELITY, COHERENCE_TIME
+
+# register states, as stored in the occupancy matrix
+FREE = 0
+RESERVED = 1 # free, but kept for a path reservation
+ALLOCATED = 2 # ALLOC_MEM done, entanglement not stored yet
+STORED = 3
+UNAVAILABLE = 255 # padding of nodes with fewer registers than the widest node
+STATE_NAMES = {FREE: "FREE", RESERVED: "RESERVED", ALLOCATED: "ALLOCATED", STORED: "STORED"}
+
+# one register of the pool
+REGISTER_DTYPE = np.dtype([
+    ("state", np.uint8),
+    ("frame", np.uint8), # Pauli frame of the stored pair as (x, z) bits
+    ("peer", np.int32), # row of the node holding the other end, -1 if unknown
+    ("stored_at", np.float64),
+    ("updated_at", np.float64), # time `fidelity` refers to
+    ("fidelity", np.float32),
+])
+T2 = COHERENCE_TIME # default decoherence time constant of a node's nuclear registers
+
+def lowest_bit(mask):
+    # index of the lowest set bit, -1 if the mask is empty
+    return (mask & -mask).bit_length() - 1
+
+def bits(mask):
+    # indices of all set bits, lowest first
+    out = []
+    while mask:
+        low = mask & -mask
+        out.append(low.bit_length() - 1)
+        mask ^= low
+    return out
+
+class NuclearMemory:
+    __slots__ = ("num_registers", "free_mask", "reservations", "reservation_expiry", "reserved_by",
+                 "owner", "content", "record", "state", "index", "peer_rows")
+
+    def __init__(self, num_registers, record=None, peer_rows=None, t2=T2):
+        """
+        Args:
+            num_registers (int): nuclear spin registers of the node
+            record (np.ndarray): row of a MemoryPool array (REGISTER_DTYPE) to keep the registers in, private if None
+            peer_rows (dict): node_id -> row in the pool, to record the peer of a stored pair
+            t2 (float): decoherence time constant of the registers, orders the index by current fidelity
+        """
+        self.num_registers = num_registers
+        self.free_mask = (1 << num_registers) - 1 # bit r set = register r free and not reserved
+        self.reservations = {} # reservation id -> bitmap of registers kept for it
+        self.reservation_expiry = {} # reservation id -> time the reservation is dropped (None = never)
+        self.reserved_by = [None] * num_registers # register -> reservation id
+        self.owner = [None] * num_registers # register -> (peer, request) while allocated or stored
+        self.content = [None] * num_registers # register -> {"peer": ..., "bell_state": ..., "stored_at": ...}
+        self.record = record if record is not None else np.zeros(num_registers, dtype=REGISTER_DTYPE)
+        self.state = self.record["state"] # zero-copy field view
+        self.peer_rows = peer_rows if peer_rows is not None else {}
+        self.index = EntanglementIndex(t2) # stored links by peer, pair id = register
+
+    def is_free(self, register):
+        return (self.free_mask >> register) & 1 == 1
+
+    def num_free(self):
+        return bin(self.free_mask).count("1")
+
+    def free_registers(self):
+        return bits(self.free_mask)
+
+    def allocate(self, owner, register=None, reservation=None):
+        """
+        ALLOC_MEM: takes one register, from the free registers or from a reservation.
+
+        Args:
+            owner (tuple): (peer, request) the register is allocated for
+            register (int): the register to take, the lowest available one if None
+            reservation: reservation id, only registers reserved under it are taken
+        Returns:
+            (int): allocated register, None if it is not available
+        """
+        if reservation is None:
+            mask = self.free_mask
+        else:
+            mask = self.reservations.get(reservation, 0)
+        if register is None:
+            register = lowest_bit(mask)
+            if register < 0:
+                return None
+        elif register < 0 or not (mask >> register) & 1:
+            return None
+        bit = 1 << register
+        if reservation is None:
+            self.free_mask ^= bit
+        else:
+            self._unreserve(reservation, bit)
+        self.owner[register] = owner
+        self.state[register] = ALLOCATED
+        return register
+
+    def store(self, register, peer, bell_state, now, fidelity=LINK_FIDELITY):
+        # entanglement is in the register (after CNOT and corrections)
+        self.content[register] = {"peer": peer, "bell_state": bell_state, "stored_at": now}
+        self.record[register] = (STORED, bell_state, self.peer_rows.get(peer, -1), now, now, fidelity)
+        self.index.add(peer, register, now, fidelity)
+
+    def fidelity(self, register, now, t2=None):
+        # fidelity of the stored pair at `now`, decayed from the last update
+        t2 = self.index.coherence_time if t2 is None else t2
+        entry = self.record[register]
+        return 0.25 + (float(entry["fidelity"]) - 0.25) * float(np.exp(-(now - entry["updated_at"]) / t2))
+
+    def set_pair(self, register, frame, fidelity, now, peer=None):
+        # the pair in the register changed (swap): new Pauli frame and fidelity, and the new far end (None = same peer)
+        self.record["frame"][register] = frame
+        self.record["fidelity"][register] = fidelity
+        self.record["updated_at"][register] = now
+        if peer is not None:
+            self.content[register]["peer"] = peer
+            self.record["peer"][register] = self.peer_rows.get(peer, -1)
+            if self.owner[register] is not None:
+                self.owner[register] = (peer, self.owner[register][1])
+        self.index.update(register, fidelity, now, peer)
+
+    def release(self, register):
+        # consume, expiry or a failed request: the register is free again
+        self.owner[register] = None
+        if self.content[register] is not None:
+            self.index.remove(register)
+        self.content[register] = None
+        self.state[register] = FREE
+        self.free_mask |= 1 << register
+
+    def reserve(self, reservation, count, expires_at=None):
+        """
+        Keeps `count` free registers for an upcoming path, all or nothing.
+
+        Returns:
+            (list): reserved registers, [] if fewer than count registers are free
+        """
+        mask = self.free_mask
+        taken = 0
+        for _ in range(count):
+            if not mask:
+                return []
+            low = mask & -mask
+            taken |= low
+            mask ^= low
+        self.free_mask = mask
+        self.reservations[reservation] = self.reservations.get(reservation, 0) | taken
+        self.reservation_expiry[reservation] = expires_at
+        registers = bits(taken)
+        for register in registers:
+            self.reserved_by[register] = reservation
+            self.state[register] = RESERVED
+        return registers
+
+    def _unreserve(self, reservation, bit):
+        mask = self.reservations[reservation] & ~bit
+        self.reserved_by[bit.bit_length() - 1] = None
+        if mask:
+            self.reservations[reservation] = mask
+        else:
+            del self.reservations[reservation]
+            self.reservation_expiry.pop(reservation, None)
+
+    def cancel_reservation(self, reservation):
+        # registers of the reservation that were not allocated go back to the free registers
+        mask = self.reservations.pop(reservation, 0)
+        self.reservation_expiry.pop(reservation, None)
+        for register in bits(mask):
+            self.reserved_by[register] = None
+            self.state[register] = FREE
+        self.free_mask |= mask
+        return mask != 0
+
+    def stored(self):
+        # [(register, content)] of every register that holds entanglement
+        return [(r, c) for r, c in enumerate(self.content) if c is not None]
+
+    def expire(self, now, cutoff):
+        """
+        Releases stored links older than `cutoff` seconds and reservations past their expiry time.
+
+        Returns:
+            (list): registers released because their link was too old
+        """
+        expired = self.index.older_than(now - cutoff)
+        for register in expired:
+            self.release(register)
+        for reservation in [k for k, t in self.reservation_expiry.items() if t is not None and t <= now]:
+            self.cancel_reservation(reservation)
+        return expired
+
+class MemoryPool:
+    """
+    Memories of all nodes, with their registers in one (nodes x registers) structured array (REGISTER_DTYPE).
+    Every NuclearMemory writes into its row, so occupancy(), decohere() and expired() never loop over the nodes.
+    """
+    def __init__(self, num_registers, capacity=64):
+        self.width = num_registers
+        self.registers = self._empty(capacity, num_registers)
+        self.t2 = np.full(capacity, T2) # decoherence time constant per node
+        self.index = {} # node_id -> row
+        self.node_ids = []
+        self.memories = []
+
+    @staticmethod
+    def _empty(rows, width):
+        registers = np.zeros((rows, width), dtype=REGISTER_DTYPE)
+        registers["state"] = UNAVAILABLE
+        registers["peer"] = -1
+        return registers
+
+    @property
+    def states(self):
+        # (nodes x registers) uint8 view of the register states
+        return self.registers["state"]
+
+    def _grow(self, rows, width):
+        registers = self._empty(rows, width)
+        registers[:self.registers.shape[0], :self.width] = self.registers
+        t2 = np.full(rows, T2)
+        t2[:self.t2.shape[0]] = self.t2
+        self.registers = registers
+        self.t2 = t2
+        self.width = width
+        for row, memory in enumerate(self.memories):
+            memory.record = registers[row, :memory.num_registers] # rebind the row views to the new array
+            memory.state = memory.record["state"]
+
+    def add(self, node_id, num_registers=None, t2=T2):
+        num_registers = self.width if num_registers is None else num_registers
+        row = len(self.memories)
+        if row == self.registers.shape[0] or num_registers > self.width:
+            self._grow(max(self.registers.shape[0], 2 * row, 1), max(self.width, num_registers))
+        self.registers["state"][row, :num_registers] = FREE
+        self.t2[row] = t2
+        memory = NuclearMemory(num_registers, self.registers[row, :num_registers], self.index, t2)
+        self.index[node_id] = row
+        self.node_ids.append(node_id)
+        self.memories.append(memory)
+        return memory
+
+    def __getitem__(self, node_id):
+        return self.memories[self.index[node_id]]
+
+    def occupancy(self):
+        """
+        Register counts of every node per state.
+
+        Returns:
+            (dict): state name -> np.ndarray with one count per node (in the order nodes were added)
+        """
+        states = self.states[:len(self.memories)]
+        return {name: (states == state).sum(axis=1) for state, name in STATE_NAMES.items()}
+
+    def utilization(self):
+        # fraction of all registers that are reserved, allocated or stored
+        states = self.states[:len(self.memories)]
+        available = states != UNAVAILABLE
+        return float(((states != FREE) & available).sum() / max(1, available.sum()))
+
+    def nodes_with_free(self, count):
+        # node ids with at least `count` free registers, e.g. candidates for a path reservation
+        free = (self.states[:len(self.memories)] == FREE).sum(axis=1)
+        return [self.node_ids[i] for i in np.flatnonzero(free >= count)]
+
+    def fidelity(self, node_id, register, now):
+        return self[node_id].fidelity(register, now, self.t2[self.index[node_id]])
+
+    def decohere(self, now):
+        """
+        Decays the fidelity of every stored pair to `now` (Werner model, T2 of its node), in place.
+        """
+        registers = self.registers[:len(self.memories)]
+        stored = registers["state"] == STORED
+        if not stored.any():
+            return
+        rows = np.nonzero(stored)[0]
+        elapsed = now - registers["updated_at"][stored]
+        fidelity = registers["fidelity"][stored]
+        registers["fidelity"][stored] = 0.25 + (fidelity - 0.25) * np.exp(-elapsed / self.t2[rows])
+        registers["updated_at"][stored] = now
+
+    def expired(self, now, cutoff=None, min_fidelity=None):
+        """
+        Stored pairs past the cutoff or below min_fidelity (call decohere() first), over all nodes at once.
+
+        Returns:
+            (list): [(node_id, register)]
+        """
+        registers = self.registers[:len(self.memories)]
+        hit = np.zeros(registers.shape, dtype=bool)
+        if cutoff is not None:
+            hit |= now - registers["stored_at"] > cutoff
+        if min_fidelity is not None:
+            hit |= registers["fidelity"] < min_fidelity
+        hit &= registers["state"] == STORED
+        rows, columns = np.nonzero(hit)
+        node_ids = self.node_ids
+        return [(node_ids[r], c) for r, c in zip(rows.tolist(), columns.tolist())]
+
+    def reserve_path(self, route, reservation, expires_at=None):
+        """
+        Reserves memory on every node of a path: one register on the end nodes, two on every repeater.
+        All or nothing, a node without enough free registers cancels the reservation on the whole route.
+
+        Returns:
+            (dict): node_id -> reserved registers, {} if the path could not be reserved
+        """
+        reserved = {}
+        for i, node_id in enumerate(route):
+            count = 1 if i == 0 or i == len(route) - 1 else 2
+            registers = self[node_id].reserve(reservation, count, expires_at)
+            if not registers:
+                self.release_path(reserved, reservation)
+                return {}
+            reserved[node_id] = registers
+        return reserved
+
+    def release_path(self, route, reservation):
+        for node_id in route:
+            self[node_id].cancel_reservation(reservation)
+
+if __name__ == '__main__':
+    NUM_OPS = 1000000
+    memory = NuclearMemory(8)
+    t0 = time.perf_counter()
+    for _ in range(NUM_OPS):
+        memory.release(memory.allocate(None))
+    elapsed = time.perf_counter() - t0
+    print("-- NUCLEAR MEMORY ALLOCATOR --")
+    print("allocate + free: ", elapsed / NUM_OPS * 1e9, " ns per pair")
+
+    for num_nodes in [1000, 10000, 100000]:
+        pool = MemoryPool(4)
+        for i in range(num_nodes):
+            memory = pool.add("node" + str(i))
+            for _ in range(i % 5):
+                register = memory.allocate(None)
+                if i % 2:
+                    memory.store(register, "peer", 0, 0.0)
+        t0 = time.perf_counter()
+        counts = pool.occupancy()
+        vectorized = time.perf_counter() - t0
+        t0 = time.perf_counter()
+        loop_counts = [sum(1 for r in range(m.num_registers) if m.content[r] is not None) for m in pool.memories]
+        loop = time.perf_counter() - t0
+        assert loop_counts == counts["STORED"].tolist()
+        print("-- OCCUPANCY (" + str(num_nodes) + " nodes) --")
+        print("vectorized: ", vectorized * 1e3, " ms, per-node loop: ", loop * 1e3, " ms, utilization: ", pool.utilization())
+
+    # decoherence and cutoff detection over every stored pair of the network, once per tick
+    import math
+    for num_nodes in [1000, 10000, 100000]:
+        pool = MemoryPool(4)
+        for i in range(num_nodes):
+            memory = pool.add("node" + str(i), t2=T2 * (1 + i % 3))
+            for r in range(4):
+                memory.store(memory.allocate(None), "node" + str((i + 1) % num_nodes), r, r * 1e-3)
+        t0 = time.perf_counter()
+        pool.decohere(0.02)
+        expired = pool.expired(0.02, cutoff=0.018, min_fidelity=0.8)
+        vectorized = time.perf_counter() - t0
+        t0 = time.perf_counter()
+        loop_expired = []
+        for i, memory in enumerate(pool.memories):
+            for r, c in enumerate(memory.content):
+                if c is not None:
+                    fidelity = 0.25 + (LINK_FIDELITY - 0.25) * math.exp(-(0.02 - c["stored_at"]) / pool.t2[i])
+                    if 0.02 - c["stored_at"] > 0.018 or fidelity < 0.8:
+                        loop_expired.append((pool.node_ids[i], r))
+        loop = time.perf_counter() - t0
+        assert sorted(expired) == sorted(loop_expired)
+        print("-- DECOHERENCE + CUTOFF (" + str(num_nodes) + " nodes, " + str(4 * num_nodes) + " stored pairs) --")
+        print("vectorized: ", vectorized * 1e3, " ms, per-register loop: ", loop * 1e3, " ms, expired: ", len(expired))
@@ -0,0 +1,268 @@
+# Persistent session cache for crash-fast restart
+# When a repeater control process restarts, every session in handshake_state is lost and every neighbour has
+# to run a full PQC handshake again at the same time.
+# SessionCache keeps the live session records in an encrypted, append-only file:
+# - every new session is appended as one AES-GCM encrypted record (nonce | ciphertext+tag)
+# - at startup the file is memory-mapped, decrypted and the live (not expired) records go back into the SessionTable
+# - later records of the same (initiator, peer) replace earlier ones, remove() appends a tombstone
+# - counter advances of a cached session are journaled as new records, so a restart never rolls them back:
+#   recv_seq (replay window) on every advance, send_seq as a high-water mark reserved SEQ_RESERVE ahead, so only
+#   one record per SEQ_RESERVE messages is written and a restarted node continues above every number it used
+# - a background thread compacts the file (rewrites only the live records) once it holds too many dead ones
+# The cache key should come from the node's long-term secret (cache_key_from_secret), never from a session key.
+import mmap
+import os
+import struct
+import threading
+import time
+from cryptography.hazmat.primitives.ciphers.aead import AESGCM
+from session_table import SessionRecord, hkdf_sha256
+
+MAGIC = b"PQCSC001" # file header, also used as associated data of every record
+NONCE_SIZE = 12
+LEN = struct.Struct(">I") # length prefix of one encrypted record
+FIXED = struct.Struct(">8s32s32sddQQ") # session_id, enc_key, mac_key, expires_at, hs_latency, send_seq, recv_seq
+COMPACT_INTERVAL = 30.0 # seconds between two compaction checks
+COMPACT_RATIO = 2 # compact when the file holds more than COMPACT_RATIO times as many records as live sessions
+SEQ_RESERVE = 64 # send sequence numbers reserved by one journal record
+
+def cache_key_from_secret(long_term_secret):
+    # 256-bit AES key derived from the node's long-term secret (e.g. its ML-DSA secret key)
+    return hkdf_sha256(long_term_secret, MAGIC, b"session-cache", 32)
+
+def encode_record(initiator, peer, record, send_seq=None):
+    # send_seq overrides the record's counter, e.g. with a reserved high-water mark
+    ids = (initiator + "|" + peer).encode()
+    return struct.pack(">H", len(ids)) + ids + FIXED.pack(record.session_id, record.enc_key, record.mac_key,
+                                                          record.expires_at, record.hs_latency,
+                                                          record.send_seq if send_seq is None else send_seq,
+                                                          record.recv_seq)
+
+def decode_record(plaintext):
+    (ids_len,) = struct.unpack_from(">H", plaintext, 0)
+    initiator, peer = plaintext[2:2 + ids_len].decode().split("|")
+    session_id, enc_key, mac_key, expires_at, hs_latency, send_seq, recv_seq = FIXED.unpack_from(plaintext, 2 + ids_len)
+    record = SessionRecord(session_id, enc_key, mac_key, expires_at, hs_latency)
+    record.send_seq = send_seq
+    record.recv_seq = recv_seq
+    return initiator, peer, record
+
+class SessionCache:
+    def __init__(self, path, key):
+        """
+        Args:
+            path (str): cache file, created if it does not exist
+            key (bytes): 32-byte AES-GCM key, see cache_key_from_secret
+        """
+        self.path = path
+        self.aead = AESGCM(key)
+        self.lock = threading.Lock() # appends vs. compaction
+        self.records_in_file = 0
+        self.live = {} # (initiator, peer) -> SessionRecord, what a compaction would keep
+        self.marks = {} # (initiator, peer) -> (reserved send_seq, recv_seq) in the file
+        self._stop = threading.Event()
+        self._compactor = None
+        if not os.path.exists(path) or os.path.getsize(path) == 0:
+            with open(path, "wb") as f:
+                f.write(MAGIC)
+        self._file = open(path, "ab")
+
+    def _seal(self, plaintext):
+        nonce = os.urandom(NONCE_SIZE)
+        blob = nonce + self.aead.encrypt(nonce, plaintext, MAGIC)
+        return LEN.pack(len(blob)) + blob
+
+    def _write(self, initiator, peer, record):
+        mark = record.send_seq + SEQ_RESERVE
+        data = self._seal(encode_record(initiator, peer, record, mark))
+        with self.lock:
+            self._file.write(data)
+            self._file.flush()
+            self.records_in_file += 1
+            self.live[(initiator, peer)] = record
+            self.marks[(initiator, peer)] = (mark, record.recv_seq)
+
+    def _attach(self, initiator, peer, record):
+        record.journal = lambda r: self.update_counters(initiator, peer, r)
+
+    def append(self, initiator, peer, record):
+        # called after handshake_state.put(), one small write per new session; later counter advances of the
+        # record are journaled by update_counters
+        self._write(initiator, peer, record)
+        self._attach(initiator, peer, record)
+
+    def update_counters(self, initiator, peer, record):
+        """
+        Journals the counters of a cached session (called by SessionRecord.next_send / accept).
+
+        Returns:
+            (bool): True if a record was written: recv_seq advanced, or send_seq passed its reserved mark
+        """
+        with self.lock:
+            send_mark, recv_mark = self.marks.get((initiator, peer), (0, 0))
+        if record.send_seq <= send_mark and record.recv_seq <= recv_mark:
+            return False
+        self._write(initiator, peer, record)
+        return True
+
+    def remove(self, initiator, peer):
+        # tombstone: a record that is already expired
+        tombstone = SessionRecord(bytes(8), bytes(32), bytes(32), 0.0)
+        with self.lock:
+            record = self.live.get((initiator, peer))
+        if record is not None:
+            record.journal = None
+        self._write(initiator, peer, tombstone)
+        with self.lock:
+            self.live.pop((initiator, peer), None)
+            self.marks.pop((initiator, peer), None)
+
+    def _read_all(self):
+        # decrypts every record of the memory-mapped file, in file order
+        entries = []
+        with open(self.path, "rb") as f:
+            size = os.fstat(f.fileno()).st_size
+            if size <= len(MAGIC):
+                return entries
+            with mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as mm:
+                if mm[:len(MAGIC)] != MAGIC:
+                    raise ValueError("not a session cache file: " + self.path)
+                offset = len(MAGIC)
+                while offset + LEN.size <= size:
+                    (blob_len,) = LEN.unpack_from(mm, offset)
+                    offset += LEN.size
+                    if offset + blob_len > size:
+                        break # torn write at the end of the file (crash while appending)
+                    blob = mm[offset:offset + blob_len]
+                    offset += blob_len
+                    try:
+                        entries.append(decode_record(self.aead.decrypt(blob[:NONCE_SIZE], blob[NONCE_SIZE:], MAGIC)))
+                    except Exception:
+                        continue # tampered or corrupted record, that session needs a new handshake
+        return entries
+
+    def load_into(self, table, now=None):
+        """
+        Reloads the live sessions into a SessionTable at startup.
+
+        Args:
+            table (SessionTable): usually the (empty) handshake_state of the restarted process
+            now (float): current time, time.time() if None
+        Returns:
+            (int): number of sessions restored
+        """
+        if now is None:
+            now = time.time()
+        entries = self._read_all()
+        live = {}
+        for initiator, peer, record in entries:
+            if record.expires_at > now:
+                live[(initiator, peer)] = record
+            else:
+                live.pop((initiator, peer), None)
+        for (initiator, peer), record in live.items():
+            # the stored send_seq is the reserved mark: the restarted node continues above it
+            table.insert(initiator, peer, record)
+            self._attach(initiator, peer, record)
+        with self.lock:
+            self.records_in_file = len(entries)
+            self.live = live
+            self.marks = {key: (record.send_seq, record.recv_seq) for key, record in live.items()}
+        return len(live)
+
+    def compact(self, now=None):
+        # rewrites the file with only the live records, then atomically replaces it
+        if now is None:
+            now = time.time()
+        with self.lock:
+            live = {k: r for k, r in self.live.items() if r.expires_at > now}
+            marks = {k: (max(self.marks.get(k, (0, 0))[0], r.send_seq), r.recv_seq) for k, r in live.items()}
+            tmp_path = self.path + ".tmp"
+            with open(tmp_path, "wb") as f:
+                f.write(MAGIC)
+                for (initiator, peer), record in live.items():
+                    f.write(self._seal(encode_record(initiator, peer, record, marks[(initiator, peer)][0])))
+                f.flush()
+                os.fsync(f.fileno())
+            self._file.close()
+            os.replace(tmp_path, self.path)
+            self._file = open(self.path, "ab")
+            self.records_in_file = len(live)
+            self.live = live
+            self.marks = marks
+        return len(live)
+
+    def _compaction_loop(self, interval):
+        while not self._stop.wait(interval):
+            if self.records_in_file > COMPACT_RATIO * max(1, len(self.live)):
+                self.compact()
+
+    def start_compaction(self, interval=COMPACT_INTERVAL):
+        # background compaction thread (daemon, so it never keeps the process alive)
+        self._compactor = threading.Thread(target=self._compaction_loop, args=(interval,), daemon=True)
+        self._compactor.start()
+
+    def close(self):
+        self._stop.set()
+        if self._compactor is not None:
+            self._compactor.join()
+        with self.lock:
+            self._file.close()
+
+def benchmark_recovery(num_sessions, path="session_cache_bench.bin", kem_name="ML-KEM-768", sign_algo="ML-DSA-44"):
+    """
+    Recovery time after a restart with the cache (reload file) and without it (redo every handshake).
+
+    Returns:
+        (tuple): (seconds to reload the cache, seconds of handshake crypto to redo all sessions)
+    """
+    import oqs
+    from session_table import SessionTable
+    if os.path.exists(path):
+        os.remove(path)
+    key = cache_key_from_secret(os.urandom(32))
+
+    # before the crash
+    table = SessionTable()
+    cache = SessionCache(path, key)
+    for i in range(num_sessions):
+        peer = "node" + str(i)
+        cache.append("Alice", peer, table.put("Alice", peer, os.urandom(32)))
+    cache.close()
+
+    # restart WITH the cache
+    t0 = time.perf_counter()
+    restored = SessionTable()
+    cache = SessionCache(path, key)
+    cache.load_into(restored)
+    with_cache = time.perf_counter() - t0
+    cache.close()
+    os.remove(path)
+
+    # restart WITHOUT the cache: keygen, encaps, sign, verify, decaps for every neighbour
+    with oqs.Signature(sign_algo) as signer:
+        sig_pk = signer.generate_keypair()
+        t0 = time.perf_counter()
+        for i in range(num_sessions):
+            with oqs.KeyEncapsulation(kem_name) as kem_receiver, oqs.KeyEncapsulation(kem_name) as kem_sender:
+                pk = kem_receiver.generate_keypair()
+                ct, ss_enc = kem_sender.encap_secret(pk)
+                sig = signer.sign(pk + ct)
+                with oqs.Signature(sign_algo) as verifier:
+                    verifier.verify(pk + ct, sig, sig_pk)
+                ss_dec = kem_receiver.decap_secret(ct)
+                restored.put("Alice", "node" + str(i), ss_dec)
+        without_cache = time.perf_counter() - t0
+    return with_cache, without_cache
+
+if __name__ == '__main__':
+    from session_routing import load_handshake_latency
+    for num_sessions in [4, 100, 1000]:
+        with_cache, without_cache = benchmark_recovery(num_sessions)
+        print("-- RECOVERY TIME (" + str(num_sessions) + " sessions) --")
+        print("with session cache: ", with_cache * 1000, " ms")
+        print("without cache, handshake crypto only: ", without_cache * 1000, " ms")
+        # the network part of a handshake dominates, so even fully parallel handshakes take at least one measured handshake
+        print("without cache, lower bound from pqc_overall_latency.txt: ", (without_cache + load_handshake_latency()) * 1000, " ms")
+        with open("session_cache_recovery.txt", "a") as f:
+            f.write(f"{num_sessions},{with_cache},{without_cache}\n")
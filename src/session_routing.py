@@ -0,0 +1,152 @@
+# Session-aware routing for PQC-gated entanglement requests
+# dijsktra_routing only counts hops and routing_algorithm only looks at how many EPR pairs each link holds.
+# Neither of them knows that a path through repeaters the initiator ALREADY has a PQC session with is much
+# cheaper than a path that needs new handshakes (~ seconds each, see pqc_overall_latency.txt).
+#
+# Edge weight (seconds) of u -> v =
+#   entanglement weight of the link u-v   (expected wait for a link-level EPR pair)
+# + expected handshake cost of node v     (0 if a fresh session exists, measured handshake latency otherwise)
+#
+# Every node on the path is entered exactly once, so the path weight ranks paths by their setup cost instead of
+# their hop count. The initiator is the source of the route (the one that runs handshake_with_node with every node
+# on the path), so its own cost is always 0.
+# pqc_handshake runs the handshakes of a path in parallel threads, so the time until all of them are done is the
+# per-hop MAXIMUM, not the sum: the additive path weight is an upper bound on the setup latency (exact for paths
+# that need at most one new handshake). Dijkstra needs additive weights, so the sum is kept for ranking and
+# path_setup_latency() gives the parallel estimate of a chosen path.
+import os
+import time
+import networkx
+from qunetsim.objects import Logger
+
+REFRESH_WINDOW = 60.0 # sessions closer than this to expiry are treated as (partially) needing a new handshake
+EPR_GENERATION_TIME = 1.0 # seconds to generate one link-level EPR pair when the link holds none
+DEFAULT_HANDSHAKE_LATENCY = 3.0 # seconds, used when no measurement is available
+
+def load_handshake_latency(filename="pqc_overall_latency.txt", default=DEFAULT_HANDSHAKE_LATENCY):
+    """
+    Average measured latency of one PQC handshake, read from the trial files written by the handshake scripts.
+
+    Args:
+        filename (str): "trial,latency" file, e.g. pqc_overall_latency.txt (unicast, one peer)
+        default (float): value returned when the file does not exist or is empty
+    Returns:
+        (float): average handshake latency in seconds
+    """
+    if not os.path.exists(filename):
+        return default
+    with open(filename, "r") as f:
+        values = [float(line.strip().split(",")[1]) for line in f if line.strip()]
+    if not values:
+        return default
+    return sum(values) / len(values)
+
+def entanglement_weight(num_epr_pairs):
+    # an empty link has to generate a pair first, a link that holds pairs is (almost) free
+    # +1 keeps the weight finite and still prefers links that hold more pairs, like 1/num_epr_pairs does
+    return EPR_GENERATION_TIME / (num_epr_pairs + 1)
+
+def expected_handshake_cost(record, now, handshake_latency, refresh_window=REFRESH_WINDOW):
+    """
+    Expected time the initiator spends on a handshake with one node before the path can be used.
+
+    Args:
+        record (SessionRecord): session of the initiator with that node, None if there is no live session
+        now (float): current time (time.time())
+        handshake_latency (float): latency of one full PQC handshake in seconds
+        refresh_window (float): remaining lifetime below which the session is about to be renewed
+    Returns:
+        (float): 0 for a fresh session, handshake_latency for a missing/expired one
+    """
+    if record is None:
+        return handshake_latency
+    # prefer the latency measured for this peer over the global average
+    latency = record.hs_latency or handshake_latency
+    remaining = record.expires_at - now
+    if remaining <= 0:
+        return latency
+    if remaining >= refresh_window:
+        return 0.0
+    # session is about to expire, so it is likely to be renewed while the request is still running
+    return latency * (1.0 - remaining / refresh_window)
+
+def path_setup_latency(route, handshake_state, handshake_latency, now=None, refresh_window=REFRESH_WINDOW):
+    """
+    Expected handshake latency of a route when the handshakes with its nodes run in parallel.
+
+    Returns:
+        (float): maximum expected_handshake_cost over the nodes of the route (the initiator route[0] excluded)
+    """
+    if now is None:
+        now = time.time()
+    source = route[0]
+    return max((expected_handshake_cost(handshake_state.lookup(source, node, now), now, handshake_latency, refresh_window)
+                for node in route[1:]), default=0.0)
+
+def session_cost_graph(network, di_graph, source, handshake_state, handshake_latency, now=None, epr_count=None):
+    """
+    Weighted graph of the network where every edge costs its expected setup time in seconds.
+
+    Args:
+        network (Network): QuNetSim network instance, used to look up hosts and their EPR pairs
+        di_graph (networkx DiGraph): The directed graph representation of the network.
+        source (str): The initiator ID
+        handshake_state (SessionTable): live sessions, looked up by (initiator, node)
+        handshake_latency (float): latency of one full PQC handshake in seconds
+        now (float): current time, time.time() if None
+        epr_count (function): epr_count(u, v) = EPR pairs u holds with v, e.g. epr_index.orchestrator_epr_count;
+                              len(host.get_epr_pairs(v)) if None
+    Returns:
+        (networkx DiGraph): graph with a 'weight' attribute on every quantum connection
+    """
+    if now is None:
+        now = time.time()
+    entanglement_network = networkx.DiGraph()
+    for node in di_graph.nodes():
+        host = network.get_host(node)
+        for connection in host.get_connections():
+            if connection['type'] != 'quantum':
+                continue
+            peer_id = connection['connection']
+            if epr_count is not None:
+                num_epr_pairs = epr_count(host.host_id, peer_id) # O(1), no pair list is built
+            else:
+                num_epr_pairs = len(host.get_epr_pairs(peer_id))
+            if peer_id == source:
+                hs_cost = 0.0 # the initiator does not need a session with itself
+            else:
+                hs_cost = expected_handshake_cost(handshake_state.lookup(source, peer_id, now), now, handshake_latency)
+            entanglement_network.add_edge(host.host_id, peer_id, weight=entanglement_weight(num_epr_pairs) + hs_cost)
+    return entanglement_network
+
+def make_session_aware_routing(network, handshake_state, handshake_latency=None, epr_count=None):
+    """
+    Builds a QuNetSim routing function that minimises expected end-to-end setup time.
+
+    Args:
+        network (Network): QuNetSim network instance
+        handshake_state (SessionTable): live sessions, filled by handshake_with_node
+        handshake_latency (float): default latency of one handshake, loaded from pqc_overall_latency.txt if None
+        epr_count (function): epr_count(u, v) from an EPR index, see session_cost_graph
+    Returns:
+        (function): routing function with the (di_graph, source, dest) signature QuNetSim expects
+    """
+    if handshake_latency is None:
+        handshake_latency = load_handshake_latency()
+
+    def session_aware_routing(di_graph, source, dest):
+        entanglement_network = session_cost_graph(network, di_graph, source, handshake_state, handshake_latency,
+                                                  epr_count=epr_count)
+        try:
+            # Compute the path with the lowest expected setup time
+            route = networkx.shortest_path(entanglement_network, source, dest, weight='weight')
+            path_cost = networkx.path_weight(entanglement_network, route, weight='weight')
+            print('-------' + str(route) + '-------')
+            print('path cost (additive, upper bound on setup time): ', path_cost,
+                  ' expected handshake latency (parallel): ',
+                  path_setup_latency(route, handshake_state, handshake_latency))
+            return route
+        except Exception as e:
+            Logger.get_instance().error(e)
+
+    return session_aware_routing
@@ -0,0 +1,217 @@
+# Thread-safe sharded session table
+# handshake_state used to be a module-level dict of dicts that several handshake_with_node threads mutated
+# through hs_bucket() without any locking, and every per-peer bucket kept the kem object, pk_hex, ss_enc,
+# ss_dec and auth_ok for the whole process.
+# The table only keeps what outlives the handshake:
+#   session ID, derived keys (HKDF_DONE step in the instruction list), expiry and counters
+# - Sharded by initiator, one lock per shard, so handshakes of different initiators never contend
+# - O(1) lookup by (initiator, peer)
+# - TTL eviction: lazily on lookup, and in bulk with evict_expired() (min-heap of expiry times per shard)
+import hashlib
+import heapq
+import hmac
+import threading
+import time
+
+NUM_SHARDS = 16
+SESSION_TTL = 600.0 # seconds a session key is used before the initiator has to run a new handshake
+HKDF_SALT = b"PQC-NV-CONTROL-PLANE"
+
+def hkdf_sha256(ikm, salt, info, length):
+    # HKDF (RFC 5869) with SHA-256: extract then expand
+    prk = hmac.new(salt, ikm, hashlib.sha256).digest()
+    okm = b""
+    block = b""
+    counter = 1
+    while len(okm) < length:
+        block = hmac.new(prk, block + info + bytes([counter]), hashlib.sha256).digest()
+        okm += block
+        counter += 1
+    return okm[:length]
+
+def derive_session_keys(ss, initiator, peer):
+    """
+    HKDF_DONE: derives the session ID, encryption key and MAC key from the KEM shared secret.
+
+    Args:
+        ss (bytes): shared secret from decapsulation (or encapsulation on the peer side)
+        initiator (str): ID of the node that started the handshake
+        peer (str): ID of the other node
+    Returns:
+        (tuple): (session_id bytes(8), enc_key bytes(32), mac_key bytes(32))
+    """
+    info = (initiator + "|" + peer).encode()
+    okm = hkdf_sha256(ss, HKDF_SALT, info, 72)
+    return okm[:8], okm[8:40], okm[40:72]
+
+class SessionRecord:
+    # compact record, no per-instance __dict__
+    __slots__ = ("session_id", "enc_key", "mac_key", "expires_at", "hs_latency", "send_seq", "recv_seq", "journal")
+
+    def __init__(self, session_id, enc_key, mac_key, expires_at, hs_latency=0.0):
+        self.session_id = session_id
+        self.enc_key = enc_key
+        self.mac_key = mac_key
+        self.expires_at = expires_at
+        self.hs_latency = hs_latency # measured latency of the handshake that created this session
+        # sequence numbers of the protected messages of this session (bulk EPR batch ids, slot tables, ...):
+        self.send_seq = 0 # highest sequence number sent, next_send() hands out the next one
+        self.recv_seq = 0 # highest sequence number accepted from the peer, anything at or below it is a replay
+        self.journal = None # journal(record) after every counter advance, set by a SessionCache that persists it
+
+    def remaining(self, now=None):
+        return self.expires_at - (time.time() if now is None else now)
+
+    def next_send(self):
+        # sequence number of the next message sent under this session
+        self.send_seq += 1
+        if self.journal is not None:
+            self.journal(self)
+        return self.send_seq
+
+    def accept(self, seq):
+        """
+        Replay check of a verified message from the peer.
+
+        Returns:
+            (bool): True if seq is above every sequence number accepted before (recv_seq is then seq)
+        """
+        if seq <= self.recv_seq:
+            return False
+        self.recv_seq = seq
+        if self.journal is not None:
+            self.journal(self)
+        return True
+
+class _Shard:
+    __slots__ = ("lock", "records", "expiry_heap")
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.records = {} # (initiator, peer) -> SessionRecord
+        self.expiry_heap = [] # (expires_at, initiator, peer), stale entries are skipped on eviction
+
+class SessionTable:
+    def __init__(self, num_shards=NUM_SHARDS, ttl=SESSION_TTL):
+        self.ttl = ttl
+        self._shards = [_Shard() for _ in range(num_shards)]
+
+    def _shard(self, initiator):
+        return self._shards[hash(initiator) % len(self._shards)]
+
+    def put(self, initiator, peer, ss, hs_latency=0.0, now=None):
+        """
+        Stores a new session after a successful handshake, replacing any older session for the same peer.
+
+        Args:
+            initiator (str): ID of the node that started the handshake
+            peer (str): ID of the other node
+            ss (bytes): shared secret, only used to derive the keys and not stored
+            hs_latency (float): measured handshake latency in seconds
+            now (float): current time, time.time() if None
+        Returns:
+            (SessionRecord): the stored record
+        """
+        if now is None:
+            now = time.time()
+        session_id, enc_key, mac_key = derive_session_keys(ss, initiator, peer)
+        record = SessionRecord(session_id, enc_key, mac_key, now + self.ttl, hs_latency)
+        return self.insert(initiator, peer, record)
+
+    def insert(self, initiator, peer, record):
+        # stores an already built record (e.g. one reloaded from disk)
+        shard = self._shard(initiator)
+        with shard.lock:
+            shard.records[(initiator, peer)] = record
+            heapq.heappush(shard.expiry_heap, (record.expires_at, initiator, peer))
+        return record
+
+    def lookup(self, initiator, peer, now=None):
+        """
+        Returns the live session between initiator and peer, or None if there is none or it has expired.
+        """
+        shard = self._shard(initiator)
+        with shard.lock:
+            record = shard.records.get((initiator, peer))
+            if record is None:
+                return None
+            if record.expires_at <= (time.time() if now is None else now):
+                del shard.records[(initiator, peer)]
+                return None
+            return record
+
+    def remove(self, initiator, peer):
+        shard = self._shard(initiator)
+        with shard.lock:
+            return shard.records.pop((initiator, peer), None)
+
+    def peers(self, initiator, now=None):
+        # live sessions of one initiator, {peer: SessionRecord}
+        if now is None:
+            now = time.time()
+        shard = self._shard(initiator)
+        with shard.lock:
+            return {peer: record for (init, peer), record in shard.records.items()
+                    if init == initiator and record.expires_at > now}
+
+    def evict_expired(self, now=None):
+        """
+        Removes every expired session. Cost is O(k log n) for k expired sessions, live ones are not scanned.
+
+        Returns:
+            (int): number of evicted sessions
+        """
+        if now is None:
+            now = time.time()
+        evicted = 0
+        for shard in self._shards:
+            with shard.lock:
+                heap = shard.expiry_heap
+                while heap and heap[0][0] <= now:
+                    expires_at, initiator, peer = heapq.heappop(heap)
+                    record = shard.records.get((initiator, peer))
+                    # skip heap entries of sessions that were renewed or removed since
+                    if record is not None and record.expires_at == expires_at:
+                        del shard.records[(initiator, peer)]
+                        evicted += 1
+        return evicted
+
+    def __len__(self):
+        return sum(len(shard.records) for shard in self._shards)
+
+def measure_memory(num_sessions=100000):
+    """
+    Memory use of num_sessions sessions in the SessionTable compared with the old dict-of-dicts layout.
+
+    Returns:
+        (tuple): (bytes used by SessionTable, bytes used by dict-of-dicts)
+    """
+    import tracemalloc
+    ss = [hashlib.sha256(i.to_bytes(4, "big")).digest() for i in range(num_sessions)]
+    num_initiators = max(1, num_sessions // 100)
+
+    tracemalloc.start()
+    before = tracemalloc.get_traced_memory()[0]
+    table = SessionTable()
+    for i in range(num_sessions):
+        table.put("node" + str(i % num_initiators), "peer" + str(i), ss[i])
+    table_bytes = tracemalloc.get_traced_memory()[0] - before
+    del table
+
+    before = tracemalloc.get_traced_memory()[0]
+    state = {}
+    for i in range(num_sessions):
+        bucket = state.setdefault("node" + str(i % num_initiators), {})
+        # the objects the old bucket kept alive (hex ML-KEM-768 pk, both shared secrets), without the native KEM object
+        pk_hex = (ss[i] * 37).hex()
+        bucket["peer" + str(i)] = {"kem": None, "pk_hex": pk_hex, "ss_enc": bytes(ss[i]), "ss_dec": bytes(bytearray(ss[i])), "auth_ok": True}
+    dict_bytes = tracemalloc.get_traced_memory()[0] - before
+    tracemalloc.stop()
+    return table_bytes, dict_bytes
+
+if __name__ == '__main__':
+    NUM_SESSIONS = 100000
+    table_bytes, dict_bytes = measure_memory(NUM_SESSIONS)
+    print("-- SESSION TABLE MEMORY (" + str(NUM_SESSIONS) + " sessions) --")
+    print("SessionTable: ", table_bytes, " bytes (", table_bytes / NUM_SESSIONS, " bytes/session )")
+    print("dict of dicts: ", dict_bytes, " bytes (", dict_bytes / NUM_SESSIONS, " bytes/session )")
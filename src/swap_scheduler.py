@@ -0,0 +1,238 @@
+# Entanglement swapping coordinator for multi-hop paths
+# (Entanglement Services.md, "Entanglement Swapping Workflow": routers generate elementary entanglement and swap)
+# A route from get_quantum_route with n links needs n - 1 Bell state measurements (BSM) at the repeaters.
+# - "sequential": swaps from the source towards the destination, the swap at route[k] waits for the segment
+#   route[0] .. route[k], so the n - 1 swaps and their classical messages are strictly one after the other
+# - "nested": doubling, segments are joined pairwise in a balanced tree (1-hop -> 2-hop -> 4-hop ...), all swaps of
+#   one level run in parallel and a swap starts as soon as ITS two segments are ready, in whatever order they arrive
+# SwapCoordinator runs either policy on an EventLoop / des_kernel.Simulator: link-level pairs are reported with
+# link_ready() asynchronously and out of order, a finished segment is announced to the repeater that swaps it next
+# with one classical message per hop, and the end nodes learn about the end-to-end pair the same way.
+# corrections="immediate" corrects every swapped segment right away: the BSM outcome travels to the far end of the
+# segment and is applied there before the segment can be swapped again. corrections="frame" only records it
+# (pauli_frame.py), the segment is announced right after the BSM.
+# A link that cannot be generated fails the whole path (fail()): on_done gets no end time and the links that are
+# still stored, or stored later, are dropped.
+import random
+import time
+from node_orchestration import CNOT_TIME, GATE_TIME
+from des_kernel import CLASSICAL_DELAY
+
+POLICIES = ("sequential", "nested")
+READOUT_TIME = 4e-6 # single-shot electron readout
+SWAP_TIME = CNOT_TIME + GATE_TIME + 2 * READOUT_TIME # BSM: CNOT, H, measure both qubits
+
+def swap_tree(num_links, policy="nested"):
+    """
+    Swaps of a path of num_links links in dependency order.
+
+    Returns:
+        (list): [(k, left segment (i, k), right segment (k, j))], k is the index of the swapping node on the route
+    """
+    if policy == "sequential":
+        return [(k, (0, k), (k, k + 1)) for k in range(1, num_links)]
+    if policy != "nested":
+        raise ValueError("unknown swap policy: " + str(policy))
+    swaps = []
+
+    def build(i, j):
+        if j - i < 2:
+            return
+        k = (i + j) // 2
+        build(i, k)
+        build(k, j)
+        swaps.append((k, (i, k), (k, j)))
+
+    build(0, num_links)
+    return swaps
+
+class SwapCoordinator:
+    def __init__(self, loop, route, policy="nested", rng=None, on_done=None, on_swap=None,
+                 classical_delay=CLASSICAL_DELAY, swap_time=SWAP_TIME, corrections="frame"):
+        """
+        Args:
+            loop (EventLoop): event loop of the nodes, e.g. des_kernel.Simulator
+            route (list): node IDs from the source to the destination
+            policy (str): "sequential" or "nested"
+            rng (random.Random): source of the BSM outcomes
+            on_done (function): on_done(coordinator, end_time), when both end nodes know about the end-to-end pair;
+                                end_time is None if a link of the path failed (fail())
+            on_swap (function): on_swap(k, m_x, m_z) after the BSM at route[k], e.g. to free its registers
+            corrections (str): "frame" (Pauli frame, no correction before the next swap) or "immediate"
+        """
+        self.loop = loop
+        self.route = route
+        self.policy = policy
+        self.rng = rng if rng is not None else random.Random()
+        self.on_done = on_done
+        self.on_swap = on_swap
+        self.classical_delay = classical_delay
+        self.swap_time = swap_time
+        self.corrections = corrections
+        num_links = len(route) - 1
+        self.final = (0, num_links)
+        self.swaps = swap_tree(num_links, policy)
+        self.consumer = {} # segment -> swap that consumes it
+        for swap in self.swaps:
+            self.consumer[swap[1]] = swap
+            self.consumer[swap[2]] = swap
+        self.arrived = {} # swap -> number of its segments known at the swapping node
+        self.outcomes = [] # (k, m_x, m_z) of every BSM, in the order they happened
+        self.start = loop.now()
+        self.end = None
+        self.failed = False
+
+    def link_ready(self, i):
+        # the link-level pair route[i] - route[i+1] is stored, both endpoints know it
+        self._segment_ready((i, i + 1), None)
+
+    def fail(self):
+        # a link of the path could not be generated: no end-to-end pair, later segments are ignored
+        if self.failed:
+            return
+        self.failed = True
+        if self.on_done is not None:
+            self.on_done(self, None)
+
+    def _segment_ready(self, segment, origin):
+        # origin = index of the node that created the segment (None for a link, known at both ends)
+        if self.failed:
+            return
+        if segment == self.final:
+            hops = 0 if origin is None else max(origin, self.final[1] - origin)
+            self.loop.call_later(hops * self.classical_delay, self._done)
+            return
+        swap = self.consumer[segment]
+        hops = 0 if origin is None else abs(swap[0] - origin)
+        self.loop.call_later(hops * self.classical_delay, self._arrive, swap)
+
+    def _arrive(self, swap):
+        if self.failed:
+            return
+        count = self.arrived.get(swap, 0) + 1
+        self.arrived[swap] = count
+        if count == 2:
+            self.loop.call_later(self.swap_time, self._swapped, swap)
+
+    def _swapped(self, swap):
+        if self.failed:
+            return # the path failed while the BSM ran, its registers are dropped already
+        k, (i, _), (_, j) = swap
+        m_x, m_z = self.rng.getrandbits(1), self.rng.getrandbits(1)
+        self.outcomes.append((k, m_x, m_z))
+        if self.on_swap is not None:
+            self.on_swap(k, m_x, m_z)
+        if self.corrections == "immediate":
+            # outcome to the far end route[j], which corrects its qubit and then announces the segment
+            delay = (j - k) * self.classical_delay + (GATE_TIME if m_x or m_z else 0.0)
+            self.loop.call_later(delay, self._segment_ready, (i, j), j)
+            return
+        self._segment_ready((i, j), k)
+
+    def _done(self):
+        self.end = self.loop.now()
+        if self.on_done is not None:
+            self.on_done(self, self.end)
+
+def swap_on_orchestrator(orchestrator, route, policy="nested", start_slot=None, on_done=None, reservation=None):
+    """
+    Generates every link of the route with the NodeOrchestrator (START_ENTANGLEMENT, any free register) and swaps
+    them with a SwapCoordinator as the links are stored. The swapping nodes measure and free their two registers.
+
+    A failed link fails the coordinator (on_done(coordinator, None)) and drops the links stored for it.
+
+    Args:
+        reservation: path reservation (MemoryPool.reserve_path) the link registers are allocated from, None = any
+    Returns:
+        (SwapCoordinator): the coordinator, finished once the loop ran; coordinator.registers maps
+                           (link, node index) -> register, e.g. to consume the end-to-end pair
+    """
+    first = orchestrator.next_slot() + 1 if start_slot is None else start_slot
+    registers = {} # (link, node index) -> register
+    stored = {}
+    held = set() # (link, node index) of stored link registers not measured by a swap yet
+
+    def on_swap(k, m_x, m_z):
+        held.discard((k - 1, k))
+        held.discard((k, k))
+        orchestrator.swap(route[k], registers[(k - 1, k)], registers[(k, k)], m_x, m_z)
+
+    coordinator = SwapCoordinator(orchestrator.loop, route, policy, orchestrator.rng, on_done, on_swap)
+    coordinator.registers = registers
+
+    def link_done(link, index):
+        def done(request, success):
+            if not success:
+                if not coordinator.failed:
+                    print("Link ", route[link], "-", route[link + 1], " failed, no end-to-end pair")
+                    for link_end in held:
+                        orchestrator.drop(route[link_end[1]], registers[link_end])
+                    held.clear()
+                    coordinator.fail()
+                return
+            if coordinator.failed:
+                orchestrator.drop(request.node_id, request.register)
+                return
+            registers[(link, index)] = request.register
+            held.add((link, index))
+            stored[link] = stored.get(link, 0) + 1
+            if stored[link] == 2:
+                coordinator.link_ready(link)
+        return done
+
+    for i, (a, b) in enumerate(zip(route, route[1:])):
+        # neighbouring links attempt in alternating slots, so every repeater electron serves both of its links
+        message = ("START_ENTANGLEMENT", b, None, first + (i % 2), 2, reservation)
+        orchestrator.handle_message(a, message, on_done=link_done(i, i))
+        orchestrator.handle_message(b, ("START_ENTANGLEMENT", a) + message[2:], on_done=link_done(i, i + 1))
+    return coordinator
+
+def time_to_end_to_end(num_links, policy, link_times, seed=0):
+    """
+    Time until both end nodes know about the end-to-end pair, for given link-level ready times.
+
+    Args:
+        link_times (list): ready time of every link (seconds from the request)
+    """
+    from des_kernel import Simulator
+    sim = Simulator(seed=seed)
+    route = ["node" + str(i) for i in range(num_links + 1)]
+    coordinator = SwapCoordinator(sim, route, policy, sim.rng)
+    for i, t in enumerate(link_times):
+        sim.call_at(t, coordinator.link_ready, i)
+    sim.run()
+    return coordinator.end
+
+if __name__ == '__main__':
+    import numpy as np
+    from attempt_model import success_probability, success_time_distribution
+    from des_kernel import Simulator
+    from node_orchestration import NodeOrchestrator
+    NUM_TRIALS = 1000
+    rng = np.random.default_rng(1)
+    for num_links in [2, 4, 8, 16, 32]:
+        print("-- TIME TO END-TO-END ENTANGLEMENT (" + str(num_links) + " links) --")
+        simultaneous = [time_to_end_to_end(num_links, policy, [0.0] * num_links) for policy in POLICIES]
+        print("all links ready at once (us): ", dict(zip(POLICIES, [t * 1e6 for t in simultaneous])))
+        # out-of-order link readiness, every link generates with the attempt model (10 km links, single click)
+        link_times = success_time_distribution(success_probability(np.full(num_links, 10.0)), NUM_TRIALS, rng)
+        for policy in POLICIES:
+            t0 = time.perf_counter()
+            times = np.array([time_to_end_to_end(num_links, policy, link_times[:, trial].tolist(), seed=trial)
+                              for trial in range(NUM_TRIALS)])
+            wall = time.perf_counter() - t0
+            swap_part = times - link_times.max(axis=0) # time after the last link was ready
+            print(policy, ": mean/p95 (ms) ", float(times.mean()) * 1e3, float(np.percentile(times, 95)) * 1e3,
+                  " swapping after the last link (us) ", float(swap_part.mean()) * 1e6, " wall: ", wall, " s")
+
+    print("-- SWAPPING ON THE NODE ORCHESTRATOR (8 links, p_success 0.05) --")
+    for policy in POLICIES:
+        sim = Simulator(seed=1)
+        orchestrator = NodeOrchestrator(sim, seed=1)
+        route = ["node" + str(i) for i in range(9)]
+        for node_id in route:
+            orchestrator.add_node(node_id)
+        coordinator = swap_on_orchestrator(orchestrator, route, policy)
+        sim.run()
+        print(policy, ": end-to-end pair after ", coordinator.end * 1e3, " ms, swaps: ", len(coordinator.outcomes),
+              " registers in use: ", int(orchestrator.memory.occupancy()["STORED"].sum()))
@@ -0,0 +1,276 @@
+# Hierarchical timer wheel for the control plane
+# Stored links have to be discarded once they pass the memory cutoff (NV nuclear-spin coherence), and every handshake,
+# herald and ack needs a deadline. One threading.Timer (a thread) or one heap entry per timeout does not scale to
+# thousands of stored pairs, so all of them share one wheel:
+# - LEVELS wheels of SLOTS buckets, level L buckets are SLOTS^L ticks wide (Varghese & Lauck, scheme 7)
+# - arm and cancel are O(1): a timer is added to / removed from the set of its bucket
+# - when level 0 wraps, the next bucket of level 1 is cascaded down, and so on
+# - expired timers are handed to their callback in batches: callback([payload, ...]) once per callback and advance
+# The wheel is driven by advance(now), either from an EventLoop (attach, works in wall-clock and virtual time, the
+# loop is only woken when a bucket is due) or from a background thread (start) for the QuNetSim threads.
+import math
+import threading
+import time
+
+TICK = 100e-6 # seconds per tick of level 0
+SLOT_BITS = 8
+SLOTS = 1 << SLOT_BITS # buckets per level
+LEVELS = 4 # 256^4 ticks = ~5 days at 100 us per tick, later deadlines wait in the overflow list
+
+class Timer:
+    __slots__ = ("deadline", "callback", "payload", "bucket")
+
+    def __init__(self, deadline, callback, payload):
+        self.deadline = deadline # tick
+        self.callback = callback
+        self.payload = payload
+        self.bucket = None # set the timer is in, None once expired or cancelled
+
+class TimerWheel:
+    def __init__(self, tick=TICK, clock=time.perf_counter, levels=LEVELS):
+        """
+        Args:
+            tick (float): resolution in seconds, timers fire at the first tick boundary after their deadline
+            clock (callable): time source, replaced by the loop's clock on attach()
+            levels (int): number of wheels
+        """
+        self.tick = tick
+        self.clock = clock
+        self.origin = clock()
+        self.levels = levels
+        self.wheels = [[set() for _ in range(SLOTS)] for _ in range(levels)]
+        self.overflow = set() # deadlines beyond the last level
+        self.due = set() # armed with a deadline that already passed, fired by the next advance
+        self.current = 0 # last processed tick
+        self.pending = 0
+        self.lock = threading.Lock() # arm/cancel from QuNetSim threads while the driver thread advances
+        self.expired = 0
+        self._loop = None
+        self._loop_event = None
+        self._loop_tick = None
+        self._stop = threading.Event()
+        self._thread = None
+
+    def to_tick(self, when):
+        return int((when - self.origin) / self.tick + 1e-9)
+
+    def _bucket(self, deadline):
+        if deadline <= self.current:
+            return self.due
+        for level in range(self.levels):
+            shift = SLOT_BITS * (level + 1)
+            if deadline >> shift == self.current >> shift:
+                return self.wheels[level][(deadline >> (SLOT_BITS * level)) & (SLOTS - 1)]
+        return self.overflow
+
+    def arm_at(self, when, callback, payload=None):
+        """
+        Arms a timer for the absolute time `when` (clock seconds).
+
+        Returns:
+            (Timer): handle for cancel()
+        """
+        # first tick at or after `when`, with the same rounding slack as to_tick (259 * TICK is tick 259, not 260)
+        timer = Timer(math.ceil((when - self.origin) / self.tick - 1e-9), callback, payload)
+        with self.lock:
+            timer.bucket = self._bucket(timer.deadline)
+            timer.bucket.add(timer)
+            self.pending += 1
+        if self._loop is not None:
+            self._wake_loop()
+        return timer
+
+    def arm(self, delay, callback, payload=None):
+        # callback([payload, ...]) is called with every payload of that callback expiring in the same advance
+        return self.arm_at(self.clock() + delay, callback, payload)
+
+    def cancel(self, timer):
+        with self.lock:
+            if timer.bucket is None:
+                return False
+            timer.bucket.discard(timer)
+            timer.bucket = None
+            self.pending -= 1
+            return True
+
+    def _cascade(self, bucket):
+        # re-files the timers of a higher-level bucket one level down (or into level 0 / due)
+        for timer in bucket:
+            timer.bucket = self._bucket(timer.deadline)
+            timer.bucket.add(timer)
+        bucket.clear()
+
+    def _next_tick(self, target):
+        # next tick <= target at which a bucket has to be processed (a non-empty level 0 bucket or a cascade
+        # that brings timers down), empty revolutions are skipped whole
+        mask = SLOTS - 1
+        level0 = self.wheels[0]
+        t = self.current + 1
+        while t < target:
+            if t & mask:
+                if level0[t & mask]:
+                    return t
+                t += 1
+                continue
+            level = 1
+            while level < self.levels:
+                index = (t >> (SLOT_BITS * level)) & mask
+                if self.wheels[level][index]:
+                    return t
+                if index:
+                    break
+                level += 1
+            else:
+                if self.overflow:
+                    return t
+            # nothing is cascaded at t, so the next SLOTS^level ticks are empty
+            t += 1 << (SLOT_BITS * level)
+        return target
+
+    def advance(self, now=None):
+        """
+        Processes every tick up to `now` and fires the expired timers in batches.
+
+        Returns:
+            (int): number of timers that expired
+        """
+        target = self.to_tick(self.clock() if now is None else now)
+        batches = {}
+        with self.lock:
+            fired = list(self.due)
+            self.due.clear()
+            while self.current < target and self.pending > len(fired):
+                self.current = self._next_tick(target)
+                t = self.current
+                if t & (SLOTS - 1) == 0:
+                    for level in range(1, self.levels):
+                        self._cascade(self.wheels[level][(t >> (SLOT_BITS * level)) & (SLOTS - 1)])
+                        if (t >> (SLOT_BITS * level)) & (SLOTS - 1):
+                            break
+                    else:
+                        self._cascade(self.overflow)
+                    fired.extend(self.due)
+                    self.due.clear()
+                bucket = self.wheels[0][t & (SLOTS - 1)]
+                fired.extend(bucket)
+                bucket.clear()
+            if self.current < target:
+                self.current = target # nothing left to expire on the way
+            for timer in fired:
+                timer.bucket = None
+                batches.setdefault(timer.callback, []).append(timer.payload)
+            self.pending -= len(fired)
+            self.expired += len(fired)
+        for callback, payloads in batches.items():
+            callback(payloads)
+        return len(fired)
+
+    # -- drivers --
+    def attach(self, loop):
+        """
+        Drives the wheel from an EventLoop / des_kernel.Simulator: the loop gets ONE event, at the next tick with
+        work to do, and only while timers are pending, so a virtual-time run still ends when the queue is empty.
+        """
+        self._loop = loop
+        self.clock = loop.now
+        self.origin = loop.now()
+        self.current = 0
+        self._wake_loop()
+        return self
+
+    def _wake_loop(self):
+        if not self.pending:
+            return
+        with self.lock:
+            tick = self.current + 1 if self.due else self._next_tick(self.current + (1 << (SLOT_BITS * self.levels)))
+        if self._loop_event is not None and self._loop_tick <= tick:
+            return
+        if self._loop_event is not None:
+            self._loop.cancel(self._loop_event)
+        self._loop_tick = tick
+        self._loop_event = self._loop.call_at(self.origin + tick * self.tick, self._on_loop_tick)
+
+    def _on_loop_tick(self):
+        self._loop_event = None
+        self.advance()
+        self._wake_loop()
+
+    def start(self):
+        # wall-clock driver thread for code that does not run on an EventLoop (daemon, never keeps the process alive)
+        self._thread = threading.Thread(target=self._run_thread, daemon=True)
+        self._thread.start()
+        return self
+
+    def _run_thread(self):
+        while not self._stop.wait(self.tick):
+            self.advance()
+
+    def stop(self):
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join()
+
+    def __len__(self):
+        return self.pending
+
+if __name__ == '__main__':
+    import heapq
+    import random
+    NUM_TIMERS = 1000000
+    rng = random.Random(1)
+    delays = [rng.uniform(1e-3, 10.0) for _ in range(NUM_TIMERS)]
+    clock = [0.0]
+    expired = []
+
+    def on_expire(payloads):
+        expired.append(len(payloads))
+
+    wheel = TimerWheel(clock=lambda: clock[0])
+    t0 = time.perf_counter()
+    timers = [wheel.arm(d, on_expire, i) for i, d in enumerate(delays)]
+    arm_time = time.perf_counter() - t0
+    t0 = time.perf_counter()
+    for timer in timers[::2]:
+        wheel.cancel(timer) # e.g. links consumed before their cutoff
+    cancel_time = time.perf_counter() - t0
+    t0 = time.perf_counter()
+    while wheel.pending:
+        clock[0] += 0.01
+        wheel.advance()
+    expire_time = time.perf_counter() - t0
+    print("-- TIMER WHEEL (" + str(NUM_TIMERS) + " timers, half cancelled) --")
+    print("arm: ", arm_time / NUM_TIMERS * 1e9, " ns, cancel: ", cancel_time / (NUM_TIMERS // 2) * 1e9, " ns")
+    print("expired: ", wheel.expired, " in ", len(expired), " batch callbacks, ", expire_time, " s")
+
+    # the same work on a heap with lazy cancellation
+    heap = []
+    t0 = time.perf_counter()
+    entries = []
+    for i, d in enumerate(delays):
+        entry = [d, i, True]
+        heapq.heappush(heap, entry)
+        entries.append(entry)
+    for entry in entries[::2]:
+        entry[2] = False
+    fired = 0
+    while heap:
+        fired += heapq.heappop(heap)[2]
+    print("heap arm + lazy cancel + expire: ", time.perf_counter() - t0, " s")
+
+    NUM_THREAD_TIMERS = 2000
+    t0 = time.perf_counter()
+    thread_timers = [threading.Timer(60.0, lambda: None) for _ in range(NUM_THREAD_TIMERS)]
+    for timer in thread_timers:
+        timer.start()
+    for timer in thread_timers:
+        timer.cancel()
+    print("threading.Timer start + cancel: ", (time.perf_counter() - t0) / NUM_THREAD_TIMERS * 1e6, " us per timer")
+
+    from des_kernel import Simulator
+    sim = Simulator()
+    wheel = TimerWheel().attach(sim)
+    fired_at = []
+    for d in [0.5, 2.0, 3600.0]:
+        wheel.arm(d, lambda payloads: fired_at.extend((sim.now(), p) for p in payloads), d)
+    sim.run()
+    print("virtual time (deadline, fired at): ", [(p, round(t, 6)) for t, p in fired_at], " loop events: ", sim.events_dispatched)
@@ -0,0 +1,38 @@
+from des_kernel import Simulator
+from node_orchestration import NodeOrchestrator, NUM_REGISTERS
+from admission_control import AdmissionQueue
+
+ROUTE = ["node0", "node1", "node2"]
+
+class BrokenLinkModel:
+    # node0 - node1 succeeds on every attempt, node1 - node2 never does
+    def next_run(self, link):
+        return (0, 0) if link == ("node0", "node1") else (10 ** 9, 0)
+
+def make_orchestrator(**kwargs):
+    orchestrator = NodeOrchestrator(Simulator(seed=1), seed=1, **kwargs)
+    for node_id in ROUTE:
+        orchestrator.add_node(node_id)
+    return orchestrator
+
+def test_failed_path_releases_the_request():
+    orchestrator = make_orchestrator(attempt_model=BrokenLinkModel())
+    queue = AdmissionQueue(orchestrator, max_retries=1)
+    request = queue.submit("app", ROUTE)
+    orchestrator.loop.run()
+    assert request.status == "failed"
+    assert request.failures == 2
+    assert queue.stats["link_retries"] == 1 and queue.stats["failed"] == 1
+    # committed memory, setup slots, path reservation and the stored node0 - node1 link are all given back
+    assert all(count == 0 for count in queue.committed.values())
+    assert all(count == 0 for count in queue.setups.values())
+    for node_id in ROUTE:
+        assert orchestrator.memory[node_id].num_free() == NUM_REGISTERS
+        assert not orchestrator.memory[node_id].reservations
+
+def test_edf_queue_is_bounded_per_tenant():
+    orchestrator = make_orchestrator()
+    queue = AdmissionQueue(orchestrator, "edf", max_setups=0, max_queue=2, overcommit=8.0) # nothing can start
+    statuses = [queue.submit("app", ROUTE).status for _ in range(3)]
+    assert statuses == ["queued", "queued", "rejected_queue"]
+    assert queue.submit("other", ROUTE).status == "queued"
@@ -0,0 +1,33 @@
+import numpy as np
+import pytest
+from attempt_model import AttemptModel, PSI_STATES, success_probability, success_time_distribution
+from node_orchestration import HERALD_DELAY, SLOT_DURATION
+
+def test_success_probability_falls_with_distance():
+    p = success_probability(np.array([1.0, 10.0, 50.0]))
+    assert np.all(np.diff(p) < 0) and np.all(p > 0)
+    # two photons have to arrive with Barrett-Kok, one with single click
+    assert np.all(success_probability(10.0, "barrett_kok") < success_probability(10.0))
+    with pytest.raises(ValueError):
+        success_probability(10.0, "unknown")
+
+def test_success_times_sit_on_the_slot_grid():
+    rng = np.random.default_rng(1)
+    times = success_time_distribution(np.array([0.5, 0.05]), 20000, rng, period=2)
+    slots = (times - HERALD_DELAY) / (2 * SLOT_DURATION)
+    assert np.allclose(slots, np.round(slots)) and slots.min() == 0
+    # geometric: (1 - p) / p failed attempts on average
+    assert abs(slots[0].mean() - 1.0) < 0.1 and abs(slots[1].mean() - 19.0) < 1.0
+
+def test_next_run_refills_per_link():
+    model = AttemptModel(seed=1, batch_size=4)
+    model.add_link(("a", "b"), distance_km=1.0)
+    runs = [model.next_run(("a", "b")) for _ in range(10)] # two refills
+    assert all(failures >= 0 and bell in PSI_STATES for failures, bell in runs)
+    model.next_run(("b", "c")) # unknown links are added with the default distance
+    assert model.index == {("a", "b"): 0, ("b", "c"): 1}
+    assert model.p[0] > model.p[1]
+
+def test_same_seed_same_outcomes():
+    first, second = AttemptModel(seed=7), AttemptModel(seed=7)
+    assert [first.next_run("link") for _ in range(50)] == [second.next_run("link") for _ in range(50)]
@@ -0,0 +1,86 @@
+import os
+from des_kernel import Simulator
+from node_orchestration import NodeOrchestrator
+from session_table import SessionTable
+from bulk_epr import (BULK_REQUEST, BULK_REPORT, EPRBatch, bitmap_from_runs, decode_report, decode_request,
+                      encode_report, encode_request, receive_epr_pairs, runs, simulate_batch, simulate_per_pair)
+
+MAC_KEY = os.urandom(32)
+
+def test_runs_round_trip():
+    bitmap = 0b1110011001
+    assert runs(bitmap) == [(0, 1), (3, 5), (7, 10)]
+    assert bitmap_from_runs(runs(bitmap)) == bitmap
+    assert runs(0) == []
+
+def test_report_picks_the_shorter_encoding():
+    few_runs = (1 << 1000) - 1 # everything received: one run
+    scattered = int("01" * 500, 2)
+    for successes in [few_runs, scattered]:
+        assert decode_report(encode_report(7, 1000, successes, MAC_KEY), MAC_KEY) == (7, 1000, successes)
+    assert len(encode_report(7, 1000, few_runs, MAC_KEY)) < len(encode_report(7, 1000, scattered, MAC_KEY))
+
+def test_tampered_request_and_report_are_rejected():
+    request = bytearray(encode_request(3, 10, MAC_KEY))
+    request[11] ^= 1 # number of pairs
+    assert decode_request(bytes(request), MAC_KEY) is None
+    assert decode_report(encode_report(3, 10, 0b11, os.urandom(32)), MAC_KEY) is None
+
+def test_batch_yields_only_the_received_pairs():
+    batch = EPRBatch(1, 6, 0b101101, fetch=lambda index: "q" + str(index))
+    assert len(batch) == 4
+    assert list(batch) == [(0, "q0"), (2, "q2"), (3, "q3"), (5, "q5")]
+
+def run(variant, count):
+    sim = Simulator(seed=1)
+    orchestrator = NodeOrchestrator(sim, seed=1)
+    orchestrator.add_node("Alice")
+    orchestrator.add_node("Bob")
+    if variant == "batch":
+        report = simulate_batch(orchestrator, "Alice", "Bob", count, MAC_KEY)
+    else:
+        report = simulate_per_pair(orchestrator, "Alice", "Bob", count)
+    sim.run()
+    return report
+
+def test_single_pair_is_authenticated_too():
+    report = run("batch", 1)
+    assert report["messages"] == 2 and report["report_bytes"] > 0 and report["confirmed"]
+
+def test_batch_saves_the_per_pair_acks():
+    batch, per_pair = run("batch", 20), run("per-pair", 20)
+    assert batch["pairs"] == per_pair["pairs"] == 20 and batch["confirmed"]
+    assert batch["messages"] == 2 and per_pair["messages"] == 20
+    assert batch["end"] < per_pair["end"]
+
+class Message:
+    def __init__(self, content):
+        self.content = content
+
+class Host:
+    # the QuNetSim host calls of receive_epr_pairs: classical inbox, EPR store and sent messages
+    def __init__(self, inbox, pairs):
+        self.inbox = inbox
+        self.pairs = pairs
+        self.sent = []
+
+    def get_classical(self, sender_id, wait=0):
+        messages, self.inbox = self.inbox, []
+        return messages
+
+    def get_epr(self, sender_id, q_id=None, wait=0):
+        return self.pairs.get(q_id)
+
+    def send_classical(self, receiver_id, content):
+        self.sent.append(content)
+
+def test_receiver_reports_its_pairs_and_rejects_a_replay():
+    session = SessionTable().put("Alice", "Bob", os.urandom(32))
+    request = Message(BULK_REQUEST + "|" + encode_request(1, 3, session.mac_key).hex())
+    host = Host([request], {"1-0": "q0", "1-2": "q2"})
+    batch = receive_epr_pairs(host, "Alice", session, wait=0.1)
+    assert list(batch) == [(0, "q0"), (2, "q2")]
+    kind, blob = host.sent[0].split("|")
+    assert kind == BULK_REPORT and decode_report(bytes.fromhex(blob), session.mac_key) == (1, 3, 0b101)
+    host.inbox = [request] # the same request again
+    assert receive_epr_pairs(host, "Alice", session, wait=0.1) is None and len(host.sent) == 1
@@ -0,0 +1,49 @@
+import math
+import pytest
+from cutoff_optimizer import ATTEMPT_TIME, choose_cutoff, policy_table, simulate_cutoff, sweep
+
+def entry(cutoff, rate, fidelity, num_links=4, p_success=0.05, t2=0.1):
+    return {"num_links": num_links, "p_success": p_success, "t2": t2, "cutoff": cutoff, "rate": rate,
+            "fidelity": fidelity}
+
+TABLE = policy_table([
+    entry(1e-3, 100.0, 0.80), entry(2e-3, 150.0, 0.75), entry(math.inf, 200.0, 0.70),
+    entry(5e-4, 50.0, 0.78), # dominated by the 1 ms cutoff
+    entry(1e-3, 10.0, 0.95, num_links=8),
+])
+
+def test_fastest_cutoff_meeting_the_target():
+    assert choose_cutoff(TABLE, 4, 0.05, 0.1, 0.74) == 2e-3
+    assert choose_cutoff(TABLE, 4, 0.05, 0.1, 0.8) == 1e-3
+    assert choose_cutoff(TABLE, 3, 0.06, 0.1, 0.8) == 1e-3 # closest configuration: 4 links
+
+def test_no_cutoff_needed_is_none():
+    assert choose_cutoff(TABLE, 4, 0.05, 0.1, 0.6) is None
+
+def test_unreachable_target_raises():
+    with pytest.raises(ValueError):
+        choose_cutoff(TABLE, 4, 0.05, 0.1, 0.9)
+    with pytest.raises(ValueError):
+        choose_cutoff([], 4, 0.05, 0.1, 0.5)
+
+def test_simulated_rate_is_a_float():
+    result = simulate_cutoff(2, 0.5, 5 * ATTEMPT_TIME, trials=100)
+    assert type(result["rate"]) is float and result["rate"] > 0
+
+def test_cutoff_is_in_seconds():
+    short = simulate_cutoff(4, 0.05, 5 * ATTEMPT_TIME, trials=100)
+    assert short == simulate_cutoff(4, 0.05, 5.5 * ATTEMPT_TIME, trials=100) # whole attempts only
+    assert short["fidelity"] > simulate_cutoff(4, 0.05, None, trials=100)["fidelity"]
+    assert simulate_cutoff(2, 0.5, math.inf, trials=100) == simulate_cutoff(2, 0.5, None, trials=100)
+
+def test_failed_trials_count_in_the_rate():
+    # a zero cutoff: both links have to succeed in the same attempt, 1% of the attempts
+    result = simulate_cutoff(2, 0.1, 0.0, trials=200, max_attempts=30)
+    assert result["failed"] > 100
+    # most trials spent max_attempts attempts without a pair: less than one pair per max_attempts
+    assert result["rate"] < 1 / (30 * ATTEMPT_TIME)
+
+def test_sweep_reports_the_cutoff_in_seconds():
+    results = sweep([2], [0.5], [0.1], [1e-4, None], trials=100, workers=1)
+    assert [r["cutoff"] for r in results] == [1e-4, math.inf]
+
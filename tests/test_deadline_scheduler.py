@@ -0,0 +1,55 @@
+from admission_control import EntanglementRequest
+from des_kernel import Simulator
+from deadline_scheduler import EDFQueue, WorkEstimator, deadline_report
+
+ROUTE = ["node0", "node1", "node2"]
+
+def make_request(request_id, deadline, route=ROUTE, num_pairs=1):
+    return EntanglementRequest(request_id, "app", route, num_pairs, 0.0, deadline)
+
+def test_earliest_feasible_deadline_first():
+    queue = EDFQueue(Simulator(seed=1))
+    for request_id, deadline in [(0, 3.0), (1, 1.0), (2, 2.0)]:
+        assert queue.push(make_request(request_id, deadline))
+    assert [queue.pop().request_id for _ in range(3)] == [1, 2, 0]
+    assert queue.pop() is None
+
+def test_infeasible_requests_are_dropped():
+    sim = Simulator(seed=1)
+    dropped = []
+    queue = EDFQueue(sim, on_drop=dropped.append)
+    estimate = queue.estimator.remaining(make_request(0, None))
+    assert not queue.push(make_request(0, estimate / 2)) # can not finish in time, never queued
+    queue.push(make_request(1, 2 * estimate))
+    sim.call_at(1.5 * estimate, lambda: None)
+    sim.run() # by now the request can not finish either
+    assert queue.pop() is None
+    assert [r.request_id for r in dropped] == [0, 1] and dropped[1].status == "dropped_infeasible"
+    assert queue.stats["dropped"] == 2 and len(queue) == 0
+
+def test_blocked_path_is_skipped_and_kept():
+    queue = EDFQueue(Simulator(seed=1), max_skips=2)
+    other = ["node2", "node3"]
+    queue.push(make_request(0, 1.0))
+    queue.push(make_request(1, 2.0, route=other))
+    chosen = queue.pop(can_start=lambda route: route is other)
+    assert chosen.request_id == 1 and len(queue) == 1 and queue.stats["skipped"] == 1
+    assert queue.pop().request_id == 0
+
+def test_remaining_work_grows_with_pairs_and_path_length():
+    estimator = WorkEstimator()
+    one_link = estimator.path_time(1)
+    assert estimator.path_time(4) > 2 * one_link # slowest of four links, plus the swaps
+    request = make_request(0, None, num_pairs=3)
+    request.pairs_done = 1
+    assert estimator.remaining(request) == 2 * estimator.path_time(2)
+
+def test_deadline_report_counts_every_miss():
+    requests = [make_request(i, 1.0) for i in range(5)] + [make_request(5, None)]
+    for request, status in zip(requests, ["done", "done", "dropped_infeasible", "failed", "running"]):
+        request.status = status
+    requests[0].finished, requests[1].finished = 0.5, 1.5 # requests[1] finished late
+    report = deadline_report(requests)
+    assert report["requests"] == 5 # without a deadline nothing can be missed
+    assert (report["late"], report["dropped"], report["failed"], report["unfinished"]) == (1, 1, 1, 1)
+    assert report["miss_ratio"] == 4 / 5
@@ -0,0 +1,64 @@
+import time
+from des_kernel import Simulator, CalibrationTable, CLASSICAL_DELAY, CRYPTO_COSTS, VirtualClock
+from des_kernel import run_attempt_campaign, simulate_handshake, simulate_path_handshake
+
+def test_virtual_clock_only_moves_forward():
+    clock = VirtualClock()
+    clock.advance(2.0)
+    clock.advance(1.0)
+    assert clock() == 2.0
+
+def test_simulator_jumps_to_events_in_order_without_sleeping():
+    sim = Simulator(seed=1)
+    fired = []
+    sim.call_at(100.0, lambda: fired.append(("late", sim.now())))
+    sim.call_at(50.0, lambda: fired.append(("early", sim.now())))
+    sim.cancel(sim.call_at(75.0, fired.append, "cancelled"))
+    start = time.perf_counter()
+    sim.run()
+    assert time.perf_counter() - start < 1.0 # 100 s of virtual time
+    assert fired == [("early", 50.0), ("late", 100.0)]
+    assert sim.events_dispatched == 2
+
+def test_handshake_takes_the_modeled_duration():
+    sim = Simulator(seed=1)
+    calibration = CalibrationTable("pqc", samples={"pk_transmission": [1e-3], "ct_transmission": [2e-3]})
+    done = []
+    simulate_handshake(sim, calibration, "Alice", "Bob", lambda *args: done.append(args))
+    sim.run()
+    crypto = CRYPTO_COSTS["pqc"]
+    expected = (4 * CLASSICAL_DELAY + 1e-3 + 2e-3 + crypto["keygen"] + crypto["encaps"] + crypto["sign"]
+                + crypto["verify"] + crypto["decaps"] + 2 * crypto["hmac"])
+    assert len(done) == 1
+    initiator, peer, start, end = done[0]
+    assert (initiator, peer, start) == ("Alice", "Bob", 0.0)
+    assert abs(end - expected) < 1e-12
+
+def test_path_handshake_finishes_with_the_slowest_node():
+    sim = Simulator(seed=1)
+    calibration = CalibrationTable("send1byte", samples={"pk_transmission": [1e-3, 5e-3]})
+    ends = []
+
+    def handshake_done(initiator, peer, start, end):
+        ends.append(end)
+
+    for peer in ["Bob", "Cathy", "Dave"]:
+        simulate_handshake(sim, calibration, "Alice", peer, handshake_done)
+    sim.run()
+
+    sim = Simulator(seed=1) # same seed: same transmission draws
+    done = []
+    simulate_path_handshake(sim, calibration, ["Alice", "Bob", "Cathy", "Dave"], lambda *args: done.append(args))
+    sim.run()
+    assert len(done) == 1 and done[0][2] == max(ends)
+
+def test_campaign_is_reproducible_and_reaches_the_target():
+    runs = []
+    for _ in range(2):
+        orchestrator = run_attempt_campaign(Simulator(seed=3), 3, 2000, seed=3)
+        runs.append((orchestrator.loop.now(), [dict(node.stats) for node in orchestrator.nodes.values()]))
+    assert runs[0] == runs[1]
+    stats = runs[0][1]
+    assert sum(s["attempts"] for s in stats) >= 2000
+    assert sum(s["stored"] for s in stats) > 0
+    assert len(orchestrator.loop) == 0 # every link stopped once the target was reached
@@ -0,0 +1,47 @@
+import os
+import pytest
+from des_kernel import Simulator
+from node_orchestration import NodeOrchestrator
+from quantum_memory import STORED
+from entanglement_distillation import DistillationScheduler, dejmps, distilled_fidelity, werner
+
+def test_dejmps_of_werner_pairs():
+    for f1, f2 in [(0.8, 0.8), (0.7, 0.9), (0.95, 0.6)]:
+        coefficients, p_success = dejmps(werner(f1), werner(f2))
+        # closed form for two Werner inputs (Deutsch et al. 1996)
+        e1, e2 = (1 - f1) / 3, (1 - f2) / 3
+        n = f1 * f2 + f1 * e2 + e1 * f2 + 5 * e1 * e2
+        assert p_success == pytest.approx(n)
+        assert coefficients[0] == pytest.approx((f1 * f2 + e1 * e2) / n)
+        assert sum(coefficients) == pytest.approx(1.0)
+    assert distilled_fidelity(0.8, 0.8)[0] > 0.8
+    assert dejmps((1, 0, 0, 0), (1, 0, 0, 0)) == ((1, 0, 0, 0), 1)
+
+def test_round_leaves_a_reused_register_alone():
+    sim = Simulator(seed=1)
+    orchestrator = NodeOrchestrator(sim, seed=1, pauli_frame=True)
+    orchestrator.add_node("A", 4)
+    orchestrator.add_node("B", 4)
+    scheduler = DistillationScheduler(orchestrator, 0.9)
+    link = scheduler.add_link("A", "B", os.urandom(32))
+    for _ in range(2):
+        ends = {}
+        for node_id, peer in (("A", "B"), ("B", "A")):
+            memory = orchestrator.memory[node_id]
+            ends[node_id] = memory.allocate((peer, None))
+            memory.store(ends[node_id], peer, 0, 0.0, fidelity=0.8)
+        orchestrator.pairs.herald(("A", ends["A"]), ("B", ends["B"]), 0)
+        scheduler.stored("A", "B", ends["A"], ends["B"])
+    keep = link.rounds[0].keep
+    # A's half of the kept pair expires before the parities arrive and its register takes a new pair
+    register = keep.registers[0]
+    orchestrator.drop("A", register)
+    memory = orchestrator.memory["A"]
+    memory.allocate(("C", None), register)
+    memory.store(register, "C", 0, 1e-6, fidelity=0.85)
+    sim.run()
+    assert scheduler.stats["lost"] == 1 and scheduler.stats["succeeded"] == 0
+    assert memory.state[register] == STORED and memory.content[register]["peer"] == "C"
+    assert float(memory.record["fidelity"][register]) == pytest.approx(0.85)
+    assert orchestrator.memory["B"].content[keep.registers[1]] is None # B's half is dropped as well
+    assert scheduler.count("A", "B") == 0
@@ -0,0 +1,30 @@
+import pytest
+
+oqs = pytest.importorskip("oqs")
+from ephemeral_kem import EphemeralKEM, wipe
+
+KEM_NAME = "ML-KEM-768"
+
+def test_wipe_zeroes_in_place():
+    buf = bytearray(b"secret")
+    wipe(buf)
+    assert buf == bytearray(6)
+    wipe(None) # nothing to wipe
+
+def test_context_is_freed_right_after_decapsulation():
+    kem = EphemeralKEM(KEM_NAME)
+    pk = kem.generate_keypair()
+    pk_copy = kem.pk
+    with oqs.KeyEncapsulation(KEM_NAME) as peer:
+        ct, ss_enc = peer.encap_secret(pk)
+    ss_dec = kem.decap_secret(ct)
+    assert isinstance(ss_dec, bytearray) and bytes(ss_dec) == ss_enc
+    assert kem.kem is None and kem.pk is None
+    assert pk_copy == bytearray(len(pk)) # the transcript public key is zeroed
+
+def test_context_is_freed_when_the_handshake_fails():
+    with pytest.raises(RuntimeError):
+        with EphemeralKEM(KEM_NAME) as kem:
+            kem.generate_keypair()
+            raise RuntimeError("peer did not answer")
+    assert kem.kem is None and kem.pk is None
@@ -0,0 +1,37 @@
+from epr_index import EntanglementIndex
+from quantum_memory import MemoryPool
+
+def test_best_follows_updates():
+    index = EntanglementIndex()
+    index.add("b", 0, 0.0, 0.9)
+    index.add("b", 1, 1e-3, 0.9)
+    assert index.best("b") == 1 and index.oldest("b") == 0
+    index.update(0, 0.97, 2e-3) # pair 0 was distilled
+    assert index.best("b") == 0 and index.oldest("b") == 0
+    index.remove(0)
+    assert index.best("b") == 1 and index.count("b") == 1
+
+def test_memory_index_uses_the_node_t2_and_set_pair():
+    pool = MemoryPool(4)
+    pool.add("b")
+    memory = pool.add("a", t2=0.02)
+    for register, now in [(0, 0.0), (1, 1e-3)]:
+        memory.allocate(("b", None), register)
+        memory.store(register, "b", 0, now)
+    assert abs(memory.index.fidelity(1, 0.01) - pool.fidelity("a", 1, 0.01)) < 1e-6 # record holds float32
+    memory.set_pair(0, 0, 0.98, 2e-3)
+    assert memory.index.best("b") == 0
+    assert abs(memory.index.fidelity(0, 0.01) - pool.fidelity("a", 0, 0.01)) < 1e-6
+
+def test_update_moves_a_pair_to_its_new_peer_by_age():
+    index = EntanglementIndex()
+    index.add("r", 0, 0.0)
+    index.add("b", 1, 1e-3)
+    index.add("b", 2, 3e-3)
+    index.update(0, 0.8, 4e-3, peer="b") # swapped: the far end is b now, stored at 0.0
+    assert index.count("r") == 0 and index.count("b") == 3
+    assert index.oldest("r") is None and index.best("r") is None
+    assert index.oldest("b") == 0 and index.freshest("b") == 2
+    assert index.older_than(2e-3) == [0, 1]
+    index.remove(0)
+    assert index.count("b") == 2 and index.oldest("b") == 1
@@ -0,0 +1,77 @@
+import time
+from des_kernel import Simulator
+from epr_replenishment import LinkReplenisher, ReplenishmentDaemon
+from node_orchestration import LinkRequest, NodeOrchestrator, NUM_REGISTERS
+
+def test_failed_generation_is_retried_without_a_loop():
+    outcomes = [False, False] # the first two generations fail, the rest succeed
+
+    def generate(replenisher):
+        if outcomes and not outcomes.pop(0):
+            replenisher.failed()
+        else:
+            replenisher.stored(object())
+
+    replenisher = LinkReplenisher(("a", "b"), generate, low=2, high=4, base_backoff=1e-3, max_backoff=1e-2).start()
+    deadline = time.monotonic() + 2.0
+    while replenisher.level < 4 and time.monotonic() < deadline:
+        time.sleep(1e-3)
+    assert replenisher.level == 4
+    assert replenisher.stats["failed"] == 2
+    assert replenisher.backoff == replenisher.base_backoff # reset by the first success
+
+class RecordingOrchestrator:
+    # the NodeOrchestrator calls of ReplenishmentDaemon, the test reports the link outcomes itself
+    def __init__(self):
+        self.loop = Simulator(seed=1)
+        self.requests = {}
+        self.cancelled = []
+        self.dropped = []
+
+    def next_slot(self):
+        return 0
+
+    def handle_message(self, node_id, message, on_done=None):
+        request = LinkRequest(node_id, *message[1:], on_done=on_done)
+        self.requests[node_id] = request
+        return request
+
+    def cancel(self, request):
+        self.cancelled.append(request.node_id)
+        return True
+
+    def drop(self, node_id, register):
+        self.dropped.append((node_id, register))
+
+def start_attempt():
+    orchestrator = RecordingOrchestrator()
+    replenisher = ReplenishmentDaemon(orchestrator, low=1, high=1).add_link("a", "b")
+    return orchestrator, replenisher, orchestrator.requests
+
+def finish(request, register, success):
+    request.register = register
+    request.on_done(request, success)
+
+def test_end_stored_before_the_other_failed_is_freed():
+    orchestrator, replenisher, requests = start_attempt()
+    finish(requests["a"], 2, True)
+    finish(requests["b"], 0, False) # the failure comes from the peer end
+    assert orchestrator.dropped == [("a", 2)] and orchestrator.cancelled == []
+    assert replenisher.stats["failed"] == 1 and replenisher.in_flight == 0 and replenisher.retry is not None
+
+def test_first_failure_cancels_the_other_end_once():
+    orchestrator, replenisher, requests = start_attempt()
+    finish(requests["b"], 0, False)
+    assert orchestrator.cancelled == ["a"] and orchestrator.dropped == []
+    assert replenisher.stats["failed"] == 1 and replenisher.in_flight == 0
+
+def test_failing_peer_end_on_the_orchestrator():
+    orchestrator = NodeOrchestrator(Simulator(seed=1), seed=1)
+    orchestrator.add_node("a")
+    orchestrator.add_node("b", num_registers=1)
+    orchestrator.memory["b"].allocate(("c", None)) # b has no register for the link
+    replenisher = ReplenishmentDaemon(orchestrator, low=1, high=1).add_link("a", "b")
+    orchestrator.loop.run(until=0.05)
+    assert replenisher.stats["failed"] == orchestrator.nodes["b"].stats["failed"] > 1 # every attempt, retried
+    assert orchestrator.memory["a"].num_free() >= NUM_REGISTERS - 1 # at most the register of the current attempt
+    assert orchestrator.nodes["a"].stats["attempts"] == 0 # cancelled before its first slot
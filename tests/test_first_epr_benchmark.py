@@ -0,0 +1,87 @@
+import numpy as np
+import epr_pipeline
+from des_kernel import Simulator, CalibrationTable
+from epr_pipeline import AuthGate, simulate_first_epr
+from node_orchestration import NodeOrchestrator, NUM_REGISTERS
+from first_epr_benchmark import benchmark, run_trials
+
+ROUTE = ["Alice", "Bob", "Cathy"]
+
+def test_links_unlock_when_both_endpoints_are_authenticated():
+    unlocked, complete = [], []
+    gate = AuthGate(ROUTE + ["Dave"], unlocked.append, lambda: complete.append(True))
+    gate.authenticate("Cathy")
+    assert unlocked == [] # Bob is missing on both sides
+    gate.authenticate("Bob")
+    assert unlocked == [0, 1] and not complete
+    gate.authenticate("Dave")
+    assert unlocked == [0, 1, 2] and complete == [True] and gate.path_authenticated.is_set()
+
+def run(mode, calibration=CalibrationTable("pqc"), num_pairs=3, seed=1):
+    sim = Simulator(seed=seed)
+    report = simulate_first_epr(sim, calibration, ROUTE, mode, num_pairs=num_pairs)
+    sim.run()
+    return report
+
+def test_request_delivers_every_pair_in_order():
+    report = run("pipelined")
+    assert report["authenticated"] and len(report["pair_times"]) == 3
+    assert report["pair_times"] == sorted(report["pair_times"])
+    assert report["first_epr"] == report["pair_times"][0] > report["path_authenticated"]
+
+def test_pipelined_links_start_before_the_path_is_authenticated():
+    gated = run("gated", num_pairs=1)
+    pipelined = run("pipelined", num_pairs=1)
+    assert gated["first_link"] > gated["path_authenticated"]
+    # the Alice - Bob link starts as soon as Bob is authenticated, same handshake draws in both modes
+    assert pipelined["path_authenticated"] == gated["path_authenticated"]
+    assert pipelined["first_epr"] <= gated["first_epr"]
+
+def test_no_authentication_is_the_baseline():
+    first_epr, pairs_per_sec = run_trials("none", ROUTE, 5, num_pairs=2)
+    assert not np.isnan(first_epr).any() and (pairs_per_sec > 0).all()
+    # trial t uses seed t: the same trials again give the same times
+    assert np.array_equal(first_epr, run_trials("none", ROUTE, 5, num_pairs=2)[0])
+    results = benchmark({"3 nodes": ROUTE}, 5, num_pairs=2, schemes=("none", "pqc"))
+    assert results[("3 nodes", "none")]["overhead"]["mean"] == 0.0
+    assert results[("3 nodes", "pqc")]["overhead"]["mean"] > 0.0
+
+class FlakyLinkModel:
+    # Bob - Cathy runs out of attempts on its next `failures` runs (fast forward: the request after a failed one
+    # gets the success that ends the run), every other link succeeds right away
+    def __init__(self, failures):
+        self.failures = failures
+
+    def next_run(self, link):
+        if link == ("Bob", "Cathy") and self.failures:
+            self.failures -= 1
+            return (10 ** 9, 0)
+        return (0, 0)
+
+def run_flaky(monkeypatch, failures, max_retries, num_pairs=2):
+    orchestrators = []
+
+    class RecordedOrchestrator(NodeOrchestrator):
+        def __init__(self, *args, **kwargs):
+            super().__init__(*args, **kwargs)
+            orchestrators.append(self)
+
+    monkeypatch.setattr(epr_pipeline, "NodeOrchestrator", RecordedOrchestrator)
+    sim = Simulator(seed=1)
+    finished = []
+    report = simulate_first_epr(sim, None, ROUTE, attempt_model=FlakyLinkModel(failures), num_pairs=num_pairs,
+                                on_done=finished.append, max_retries=max_retries)
+    sim.run()
+    return report, finished, orchestrators[0]
+
+def test_failed_link_restarts_the_round(monkeypatch):
+    report, finished, _ = run_flaky(monkeypatch, failures=1, max_retries=2)
+    assert finished == [report] and not report["failed"]
+    assert report["link_failures"] == 1 and len(report["pair_times"]) == 2
+
+def test_request_fails_after_max_retries_and_frees_its_registers(monkeypatch):
+    report, finished, orchestrator = run_flaky(monkeypatch, failures=10, max_retries=2, num_pairs=5)
+    assert finished == [report] and report["failed"]
+    assert report["link_failures"] == 3 and len(report["pair_times"]) == 2
+    # the Alice - Bob links stored in every round were dropped, nothing is left allocated or stored
+    assert all(orchestrator.memory[node_id].num_free() == NUM_REGISTERS for node_id in ROUTE)
@@ -0,0 +1,49 @@
+import numpy as np
+import pytest
+from des_kernel import Simulator
+from instruction_codec import OPCODES, OPERAND_BITS, InstructionBatch, encode, decode, instruction_code, pack_codes
+from node_orchestration import NodeOrchestrator
+
+def test_round_trip():
+    rng = np.random.default_rng(1)
+    opcodes = rng.integers(0, len(OPCODES), 1001)
+    operands = rng.integers(0, 8, 1001)
+    opcodes_out, operands_out = decode(encode(opcodes, operands, slot=42))
+    assert (opcodes_out == opcodes).all() and (operands_out == operands).all()
+
+def test_bytes_round_trip():
+    codes = [instruction_code("CNOT", 1), instruction_code("MEASURE", 2), instruction_code("X", 3)]
+    batch = InstructionBatch.from_bytes(pack_codes(codes, slot=7).to_bytes())
+    assert batch.slot == 7 and batch.count == 3
+    opcodes, operands = decode(batch)
+    assert list(opcodes) == [OPCODES["CNOT"], OPCODES["MEASURE"], OPCODES["X"]] and list(operands) == [1, 2, 3]
+
+def test_empty_batch():
+    opcodes, operands = decode(pack_codes([]))
+    assert len(opcodes) == 0 and len(operands) == 0
+
+def test_operand_too_wide():
+    with pytest.raises(ValueError):
+        encode([OPCODES["X"]], [8])
+
+def test_single_instruction_operand_is_checked():
+    assert instruction_code("X", 7) == (OPCODES["X"] << OPERAND_BITS) | 7
+    for operand in [1 << OPERAND_BITS, -1]:
+        with pytest.raises(ValueError):
+            instruction_code("X", operand)
+
+def test_orchestrator_rejects_an_operand_the_codec_can_not_carry():
+    orchestrator = NodeOrchestrator(Simulator(seed=1), seed=1)
+    node = orchestrator.add_node("a")
+    with pytest.raises(ValueError):
+        orchestrator.send_instruction(node, "MEASURE", 1 << OPERAND_BITS)
+    assert node.instructions == [] and len(orchestrator.loop) == 0 # no flush scheduled
+
+def test_operand_field_covers_every_register_of_a_wide_node():
+    orchestrator = NodeOrchestrator(Simulator(seed=1), seed=1)
+    node = orchestrator.add_node("r", num_registers=16)
+    orchestrator.send_instruction(node, "MEASURE", 15)
+    opcodes, operands = decode(pack_codes(node.instructions, 0, node.operand_bits))
+    assert list(opcodes) == [OPCODES["MEASURE"]] and list(operands) == [15]
+    orchestrator.loop.run()
+    assert orchestrator.decoder.summary() == {"MEASURE": 1}
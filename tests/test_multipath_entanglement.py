@@ -0,0 +1,61 @@
+import pytest
+
+pytest.importorskip("qunetsim")
+from session_table import SessionTable
+from multipath_entanglement import authenticate_paths, disjoint_routes, path_capacity, split_request
+
+class Host:
+    # the QuNetSim host calls the module makes, over a fixed topology
+    def __init__(self, host_id, pairs):
+        self.host_id = host_id
+        self.pairs = pairs # peer -> number of stored EPR pairs
+
+    def get_connections(self):
+        return [{"type": "quantum", "connection": peer} for peer in self.pairs]
+
+    def get_epr_pairs(self, host_id):
+        return [None] * self.pairs[host_id]
+
+class Network:
+    def __init__(self, links):
+        # links: (u, v, stored pairs)
+        self.hosts = {}
+        for u, v, pairs in links:
+            self.hosts.setdefault(u, Host(u, {})).pairs[v] = pairs
+            self.hosts.setdefault(v, Host(v, {})).pairs[u] = pairs
+        self.ARP = dict.fromkeys(self.hosts)
+
+    def get_host(self, host_id):
+        return self.hosts[host_id]
+
+# A - B - Z over one repeater, A - C - D - Z over two
+NETWORK = Network([("A", "B", 1), ("B", "Z", 4), ("A", "C", 3), ("C", "D", 6), ("D", "Z", 3)])
+
+def test_routes_are_node_disjoint_and_shortest_first():
+    routes = disjoint_routes(NETWORK, "A", "Z")
+    assert routes == [["A", "B", "Z"], ["A", "C", "D", "Z"]]
+    assert disjoint_routes(NETWORK, "A", "Z", max_paths=1) == [["A", "B", "Z"]]
+
+def test_bottleneck_capacity():
+    assert path_capacity(NETWORK, ["A", "B", "Z"]) == 1
+    assert path_capacity(NETWORK, ["A", "C", "D", "Z"]) == 3
+
+def test_split_in_proportion_to_capacity():
+    assert split_request(8, [1, 3]) == [2, 6]
+    assert split_request(5, [1, 1]) in ([3, 2], [2, 3])
+    assert split_request(4, [0, 0]) == [2, 2] # no path holds pairs: equal shares
+    assert sum(split_request(7, [2, 3, 5])) == 7
+    assert split_request(3, []) == []
+
+def test_only_nodes_without_a_session_are_authenticated():
+    sessions = SessionTable()
+    sessions.put("A", "B", b"k" * 32)
+    started = []
+
+    def handshake(initiator, node_id):
+        started.append(node_id)
+        sessions.put(initiator.host_id, node_id, b"k" * 32)
+
+    routes = [["A", "B", "Z"], ["A", "C", "Z"]]
+    assert authenticate_paths(NETWORK.get_host("A"), routes, handshake, sessions)
+    assert sorted(started) == ["C", "Z"]
@@ -0,0 +1,57 @@
+import pytest
+from des_kernel import Simulator
+from node_orchestration import NodeOrchestrator, run_chain
+
+def endpoint_counts(orchestrator):
+    stored = sum(n.stats["stored"] for n in orchestrator.nodes.values())
+    failed = sum(n.stats["failed"] for n in orchestrator.nodes.values())
+    return stored, failed
+
+def test_chain_of_100_nodes_on_the_wall_clock():
+    # the loop lags behind the wall clock at this size, both endpoints of every link must still meet in their slots
+    orchestrator = run_chain(100)
+    assert endpoint_counts(orchestrator) == (198, 0)
+
+def test_chain_of_500_nodes_in_virtual_time():
+    orchestrator = run_chain(500, loop=Simulator(seed=1))
+    assert endpoint_counts(orchestrator) == (998, 0)
+
+@pytest.mark.parametrize("pauli_frame", [False, True])
+def test_swap_updates_the_far_ends(pauli_frame):
+    orchestrator = NodeOrchestrator(Simulator(seed=1), seed=1, pauli_frame=pauli_frame)
+    for node_id in ["a", "b", "c"]:
+        orchestrator.add_node(node_id)
+    ends = {}
+    for left, right, bell_state in [("a", "b", 1), ("b", "c", 2)]:
+        for node_id, peer in [(left, right), (right, left)]:
+            memory = orchestrator.memory[node_id]
+            ends[(node_id, peer)] = memory.allocate((peer, None))
+            memory.store(ends[(node_id, peer)], peer, bell_state if pauli_frame else 0, 0.0, fidelity=0.9)
+        orchestrator.pairs.herald((left, ends[(left, right)]), (right, ends[(right, left)]),
+                                  bell_state if pauli_frame else 0)
+    orchestrator.swap("b", ends[("b", "a")], ends[("b", "c")], 1, 0)
+    p = ((4 * 0.9 - 1) / 3) ** 2
+    for node_id, peer in [("a", "b"), ("c", "b")]:
+        assert abs(orchestrator.fidelity(node_id, ends[(node_id, peer)]) - (1 + 3 * p) / 4) < 1e-6
+        frame = int(orchestrator.memory[node_id].record["frame"][ends[(node_id, peer)]])
+        assert frame == (1 ^ 2 ^ 1 if pauli_frame else 0)
+
+def test_swap_files_the_far_ends_under_their_new_peer():
+    orchestrator = NodeOrchestrator(Simulator(seed=1), seed=1)
+    for node_id in ["A", "R", "B"]:
+        orchestrator.add_node(node_id)
+    ends = {}
+    for left, right in [("A", "R"), ("R", "B")]:
+        for node_id, peer in [(left, right), (right, left)]:
+            memory = orchestrator.memory[node_id]
+            ends[(node_id, peer)] = memory.allocate((peer, None))
+            memory.store(ends[(node_id, peer)], peer, 0, 0.0)
+        orchestrator.pairs.herald((left, ends[(left, right)]), (right, ends[(right, left)]), 0)
+    orchestrator.swap("R", ends[("R", "A")], ends[("R", "B")], 0, 0)
+    a, b = orchestrator.memory["A"], orchestrator.memory["B"]
+    assert a.index.count("B") == 1 and a.index.count("R") == 0
+    assert b.index.count("A") == 1 and b.index.count("R") == 0
+    register = ends[("A", "R")]
+    assert a.index.best("B") == a.index.oldest("B") == register and a.index.best("R") is None
+    assert a.content[register]["peer"] == "B"
+    assert a.record["peer"][register] == orchestrator.memory.index["B"]
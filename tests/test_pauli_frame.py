@@ -0,0 +1,34 @@
+from pauli_frame import PauliFrameTracker
+
+A, R1, R0, B = ("a", 0), ("r", 1), ("r", 0), ("b", 0)
+
+def test_pair_is_tracked_once_both_ends_heralded():
+    tracker = PauliFrameTracker()
+    assert tracker.herald_end(("a-r", 7), A, 1) is None
+    pair = tracker.herald_end(("a-r", 7), R0, 1)
+    assert pair.ends == (A, R0) and tracker.frame(A) == tracker.frame(R0) == 1
+    assert tracker.stats["immediate_gates"] == 1 # X
+
+def test_swap_composes_the_frames():
+    tracker = PauliFrameTracker()
+    tracker.herald(A, R0, 1) # PSI_PLUS
+    tracker.herald(R1, B, 3) # PSI_MINUS
+    pair = tracker.swap(R0, R1, 1, 1) # outcome 3
+    assert pair.ends == (A, B) and pair.frame == 1 ^ 3 ^ 3
+    assert tracker.frame(R0) is None and tracker.frame(R1) is None
+    assert tracker.swap(R0, R1, 0, 0) is None # measured already
+    assert tracker.stats["swaps"] == 1 and tracker.stats["immediate_gates"] == 1 + 2 + 2
+
+def test_only_the_second_end_applies_the_correction():
+    tracker = PauliFrameTracker()
+    tracker.herald(A, B, 2)
+    assert tracker.consume(A) == "I"
+    assert tracker.consume(B) == "Z"
+    assert tracker.consume(B) is None
+    assert tracker.stats["pairs_consumed"] == 1 and tracker.stats["frame_gates"] == 1
+
+def test_discard_forgets_both_ends():
+    tracker = PauliFrameTracker()
+    tracker.herald(A, B, 0)
+    tracker.discard(A)
+    assert tracker.pairs == {} and tracker.consume(B) is None
@@ -0,0 +1,54 @@
+from quantum_memory import NuclearMemory, MemoryPool, ALLOCATED, FREE, RESERVED, STORED
+
+def test_allocate_takes_the_lowest_free_register():
+    memory = NuclearMemory(4)
+    assert [memory.allocate(("b", i)) for i in range(4)] == [0, 1, 2, 3]
+    assert memory.allocate(("b", 4)) is None and memory.num_free() == 0
+    memory.release(2)
+    assert memory.free_registers() == [2] and memory.state[2] == FREE
+    assert memory.allocate(("b", 5), register=1) is None # taken
+    assert memory.allocate(("b", 5)) == 2 and memory.state[2] == ALLOCATED
+
+def test_reserved_registers_only_go_to_their_reservation():
+    memory = NuclearMemory(4)
+    assert memory.reserve("path", 3) == [0, 1, 2]
+    assert memory.reserve("other", 2) == [] # all or nothing, nothing is taken
+    assert memory.free_registers() == [3] and memory.state[1] == RESERVED
+    assert memory.allocate(("b", 0)) == 3
+    assert memory.allocate(("b", 1)) is None
+    assert memory.allocate(("b", 1), reservation="path") == 0
+    assert memory.cancel_reservation("path") # registers 1 and 2 go back
+    assert memory.free_registers() == [1, 2] and not memory.reservations
+
+def test_expire_releases_old_links_and_reservations():
+    memory = NuclearMemory(4)
+    for register, stored_at in [(0, 0.0), (1, 5.0)]:
+        memory.allocate(("b", register))
+        memory.store(register, "b", 0, stored_at)
+    memory.reserve("path", 1, expires_at=3.0)
+    assert memory.expire(now=4.0, cutoff=2.0) == [0]
+    assert [r for r, _ in memory.stored()] == [1] and memory.index.count("b") == 1
+    assert not memory.reservations and memory.num_free() == 3
+
+def test_failed_path_reservation_is_rolled_back():
+    pool = MemoryPool(2)
+    for node_id in ["a", "r", "b"]:
+        pool.add(node_id)
+    pool["r"].allocate(("a", 0)) # the repeater has one register left, it needs two
+    assert pool.reserve_path(["a", "r", "b"], "path") == {}
+    assert pool["a"].num_free() == 2 and not pool["a"].reservations
+    pool["r"].release(0)
+    assert pool.reserve_path(["a", "r", "b"], "path") == {"a": [0], "r": [0, 1], "b": [0]}
+    pool.release_path(["a", "r", "b"], "path")
+    assert pool.utilization() == 0.0
+
+def test_pool_rows_follow_the_memories_when_it_grows():
+    pool = MemoryPool(2, capacity=1)
+    a = pool.add("a")
+    a.allocate(("b", 0))
+    pool.add("b", num_registers=3) # more rows and a wider row
+    a.store(0, "b", 1, 0.0) # into the new array
+    assert pool.occupancy()["STORED"].tolist() == [1, 0]
+    assert pool.occupancy()["FREE"].tolist() == [1, 3]
+    assert a.record["peer"][0] == pool.index["b"] and a.state[0] == STORED
+    assert pool.expired(now=10.0, cutoff=5.0) == [("a", 0)]
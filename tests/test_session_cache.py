@@ -0,0 +1,80 @@
+import os
+from session_cache import SessionCache, SEQ_RESERVE, cache_key_from_secret
+from session_table import SessionTable
+
+KEY = cache_key_from_secret(b"long-term secret")
+
+def restart(path, now):
+    table = SessionTable()
+    cache = SessionCache(path, KEY)
+    restored = cache.load_into(table, now=now)
+    return table, cache, restored
+
+def test_round_trip(tmp_path):
+    path = str(tmp_path / "cache.bin")
+    table = SessionTable()
+    cache = SessionCache(path, KEY)
+    record = table.put("Alice", "Bob", os.urandom(32), hs_latency=1.5, now=100.0)
+    cache.append("Alice", "Bob", record)
+    cache.append("Alice", "Cathy", table.put("Alice", "Cathy", os.urandom(32), now=100.0))
+    cache.remove("Alice", "Cathy")
+    cache.close()
+
+    restored_table, cache, restored = restart(path, 200.0)
+    assert restored == 1
+    copy = restored_table.lookup("Alice", "Bob", now=200.0)
+    assert (copy.session_id, copy.enc_key, copy.mac_key) == (record.session_id, record.enc_key, record.mac_key)
+    assert copy.expires_at == record.expires_at and copy.hs_latency == 1.5
+    assert restored_table.lookup("Alice", "Cathy", now=200.0) is None
+    cache.close()
+
+def test_expired_sessions_are_not_restored(tmp_path):
+    path = str(tmp_path / "cache.bin")
+    table = SessionTable(ttl=10.0)
+    cache = SessionCache(path, KEY)
+    cache.append("Alice", "Bob", table.put("Alice", "Bob", os.urandom(32), now=0.0))
+    cache.close()
+    restored_table, cache, restored = restart(path, 20.0)
+    assert restored == 0 and restored_table.lookup("Alice", "Bob", now=20.0) is None
+    cache.close()
+
+def test_counters_do_not_roll_back_after_restart(tmp_path):
+    path = str(tmp_path / "cache.bin")
+    table = SessionTable()
+    cache = SessionCache(path, KEY)
+    record = table.put("Alice", "Bob", os.urandom(32), now=0.0)
+    cache.append("Alice", "Bob", record)
+    used = [record.next_send() for _ in range(3 * SEQ_RESERVE + 5)]
+    assert record.accept(7) and record.accept(9)
+    written = cache.records_in_file
+    record.next_send() # inside the reserved block, no new journal record
+    assert cache.records_in_file == written
+    cache.close()
+
+    restored_table, cache, _ = restart(path, 1.0)
+    copy = restored_table.lookup("Alice", "Bob", now=1.0)
+    assert copy.next_send() > max(used) + 1 # never reuses a sequence number
+    assert copy.recv_seq == 9
+    assert not copy.accept(9) # replay of an already accepted batch
+    assert copy.accept(10)
+    cache.close()
+
+    restored_table, cache, _ = restart(path, 1.0)
+    assert restored_table.lookup("Alice", "Bob", now=1.0).recv_seq == 10
+    cache.close()
+
+def test_compaction_keeps_counters(tmp_path):
+    path = str(tmp_path / "cache.bin")
+    table = SessionTable()
+    cache = SessionCache(path, KEY)
+    record = table.put("Alice", "Bob", os.urandom(32), now=0.0)
+    cache.append("Alice", "Bob", record)
+    for seq in range(1, 20):
+        record.accept(seq)
+    last_sent = max(record.next_send() for _ in range(2 * SEQ_RESERVE))
+    assert cache.compact(now=1.0) == 1
+    cache.close()
+    restored_table, cache, _ = restart(path, 1.0)
+    copy = restored_table.lookup("Alice", "Bob", now=1.0)
+    assert copy.recv_seq == 19 and copy.send_seq >= last_sent
+    cache.close()
@@ -0,0 +1,27 @@
+import os
+from session_table import SessionTable
+
+def test_lookup_returns_live_session_only():
+    table = SessionTable(ttl=10.0)
+    record = table.put("Alice", "Bob", os.urandom(32), now=0.0)
+    assert table.lookup("Alice", "Bob", now=5.0) is record
+    assert table.lookup("Bob", "Alice", now=5.0) is None
+    assert table.lookup("Alice", "Bob", now=10.0) is None # expired at expires_at
+    assert len(table) == 0 # and dropped by the lookup
+
+def test_evict_expired_skips_renewed_sessions():
+    table = SessionTable(ttl=10.0)
+    table.put("Alice", "Bob", os.urandom(32), now=0.0)
+    table.put("Alice", "Cathy", os.urandom(32), now=0.0)
+    renewed = table.put("Alice", "Bob", os.urandom(32), now=8.0) # stale heap entry at 10 stays behind
+    table.put("Dave", "Eva", os.urandom(32), now=5.0)
+    assert table.evict_expired(now=12.0) == 1 # only Alice - Cathy
+    assert table.lookup("Alice", "Bob", now=12.0) is renewed
+    assert set(table.peers("Alice", now=12.0)) == {"Bob"}
+    assert table.evict_expired(now=20.0) == 2
+    assert len(table) == 0
+
+def test_replay_window():
+    record = SessionTable().put("Alice", "Bob", os.urandom(32), now=0.0)
+    assert [record.next_send() for _ in range(3)] == [1, 2, 3]
+    assert record.accept(5) and not record.accept(5) and not record.accept(4) and record.accept(6)
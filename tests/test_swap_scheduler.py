@@ -0,0 +1,62 @@
+import pytest
+from des_kernel import Simulator, CLASSICAL_DELAY
+from node_orchestration import NodeOrchestrator, NUM_REGISTERS
+from swap_scheduler import SwapCoordinator, SWAP_TIME, swap_on_orchestrator, swap_tree, time_to_end_to_end
+
+def test_swap_tree():
+    assert swap_tree(4, "sequential") == [(1, (0, 1), (1, 2)), (2, (0, 2), (2, 3)), (3, (0, 3), (3, 4))]
+    assert swap_tree(4, "nested") == [(1, (0, 1), (1, 2)), (3, (2, 3), (3, 4)), (2, (0, 2), (2, 4))]
+    assert swap_tree(1) == []
+    with pytest.raises(ValueError):
+        swap_tree(4, "random")
+
+def test_nested_swaps_of_one_level_run_in_parallel():
+    # one swap, then the outcome travels one hop to the farther end node
+    for policy in ["sequential", "nested"]:
+        assert time_to_end_to_end(2, policy, [0.0, 0.0]) == pytest.approx(SWAP_TIME + CLASSICAL_DELAY)
+    sequential = time_to_end_to_end(8, "sequential", [0.0] * 8)
+    nested = time_to_end_to_end(8, "nested", [0.0] * 8)
+    assert nested < sequential
+    assert nested == pytest.approx(3 * SWAP_TIME + 3 * CLASSICAL_DELAY + 4 * CLASSICAL_DELAY) # 3 levels, 1 + 2 hops, 4 to the ends
+
+def test_swap_waits_for_the_last_link():
+    late = time_to_end_to_end(2, "nested", [0.0, 1.0])
+    assert late == pytest.approx(1.0 + SWAP_TIME + CLASSICAL_DELAY)
+
+def test_failed_coordinator_reports_once_and_ignores_later_links():
+    sim = Simulator(seed=1)
+    done = []
+    coordinator = SwapCoordinator(sim, ["a", "r", "b"], on_done=lambda c, end: done.append(end))
+    coordinator.link_ready(0)
+    coordinator.fail()
+    coordinator.fail()
+    coordinator.link_ready(1)
+    sim.run()
+    assert done == [None] and coordinator.outcomes == [] and coordinator.end is None
+
+class BrokenLinkModel:
+    # the first link succeeds on every attempt, the second never does
+    def next_run(self, link):
+        return (0, 0) if link in (("node0", "node1"), ("node1", "node0")) else (10 ** 9, 0)
+
+def test_swapping_on_the_orchestrator():
+    orchestrator = NodeOrchestrator(Simulator(seed=1), seed=1)
+    route = ["node" + str(i) for i in range(5)]
+    for node_id in route:
+        orchestrator.add_node(node_id)
+    coordinator = swap_on_orchestrator(orchestrator, route, "nested")
+    orchestrator.loop.run()
+    assert coordinator.end is not None and len(coordinator.outcomes) == 3
+    # only the end-to-end pair is left, the repeaters freed their registers
+    assert orchestrator.memory.occupancy()["STORED"].tolist() == [1, 0, 0, 0, 1]
+
+def test_failed_link_drops_the_stored_links():
+    orchestrator = NodeOrchestrator(Simulator(seed=1), seed=1, attempt_model=BrokenLinkModel())
+    route = ["node0", "node1", "node2"]
+    for node_id in route:
+        orchestrator.add_node(node_id)
+    done = []
+    swap_on_orchestrator(orchestrator, route, on_done=lambda c, end: done.append(end))
+    orchestrator.loop.run()
+    assert done == [None]
+    assert all(orchestrator.memory[node_id].num_free() == NUM_REGISTERS for node_id in route)
@@ -0,0 +1,81 @@
+import os
+from des_kernel import Simulator
+from node_orchestration import NodeOrchestrator, NUM_REGISTERS
+from session_table import SessionTable
+from tdma_scheduler import TDMAScheduler, encode_slot_table, decode_slot_table, apply_slot_table, push_slot_tables
+
+MAC_KEY = os.urandom(32)
+
+def make_session():
+    # the node's side of its session with the controller, keyed with MAC_KEY
+    session = SessionTable().put("controller", "node0", os.urandom(32))
+    session.mac_key = MAC_KEY
+    return session
+
+def make_orchestrator():
+    orchestrator = NodeOrchestrator(Simulator(seed=1), seed=1)
+    orchestrator.add_node("node0")
+    orchestrator.add_node("node1")
+    return orchestrator
+
+def test_slot_table_round_trip():
+    entries = [(0, "node1"), (3, "node2"), (5, "node1")]
+    blob = encode_slot_table(8, 7, 3, entries, MAC_KEY)
+    assert decode_slot_table(blob, MAC_KEY) == (8, 7, 3, entries)
+
+def test_tampered_or_foreign_table_is_rejected():
+    blob = bytearray(encode_slot_table(8, 1, 1, [(0, "node1")], MAC_KEY))
+    blob[4] ^= 1 # epoch
+    assert decode_slot_table(bytes(blob), MAC_KEY) is None
+    assert decode_slot_table(encode_slot_table(8, 1, 1, [(0, "node1")], os.urandom(32)), MAC_KEY) is None
+
+def test_schedule_has_no_double_booked_electron():
+    scheduler = TDMAScheduler(8)
+    links = [("a", "b", 1), ("b", "c", 1), ("a", "c", 1), ("c", "d", 2)]
+    scheduler.schedule(links)
+    for node in scheduler.calendars:
+        slots = [slot for slot, _ in scheduler.slot_table(node)]
+        assert len(slots) == len(set(slots))
+
+def test_pushed_tables_carry_the_session_sequence_number():
+    scheduler = TDMAScheduler(4)
+    scheduler.add_link("node0", "node1")
+    sessions = SessionTable()
+    for node in ["node0", "node1"]:
+        sessions.put("controller", node, os.urandom(32))
+    for seq in [1, 2]:
+        tables = push_slot_tables(scheduler, sessions, "controller")
+        record = sessions.lookup("controller", "node0")
+        assert decode_slot_table(tables["node0"], record.mac_key)[2] == seq == record.send_seq
+
+def test_older_epoch_is_not_applied():
+    orchestrator = make_orchestrator()
+    session = make_session()
+    new = encode_slot_table(4, 2, 1, [(0, "node1")], MAC_KEY)
+    old = encode_slot_table(4, 1, 2, [(1, "node1")], MAC_KEY)
+    assert len(apply_slot_table(orchestrator, "node0", new, session)) == 1
+    assert apply_slot_table(orchestrator, "node0", old, session) == [] # replayed older table
+    assert apply_slot_table(orchestrator, "node0", new, session) == [] # same table again
+    assert orchestrator.nodes["node0"].slot_epoch == 2
+
+def test_replayed_sequence_number_is_rejected():
+    orchestrator = make_orchestrator()
+    session = make_session()
+    assert len(apply_slot_table(orchestrator, "node0", encode_slot_table(4, 1, 5, [(0, "node1")], MAC_KEY), session)) == 1
+    # newer epoch, but a sequence number the node accepted before (e.g. after a controller restart)
+    assert apply_slot_table(orchestrator, "node0", encode_slot_table(4, 2, 5, [(1, "node1")], MAC_KEY), session) == []
+    assert orchestrator.nodes["node0"].slot_epoch == 1 and session.recv_seq == 5
+
+def test_newer_epoch_cancels_the_old_links():
+    orchestrator = make_orchestrator()
+    session = make_session()
+    first = apply_slot_table(orchestrator, "node0", encode_slot_table(4, 1, 1, [(0, "node1"), (2, "node1")], MAC_KEY), session)
+    orchestrator.loop.run(until=orchestrator.slot_time(6)) # registers allocated, attempts running (node1 never attempts)
+    node = orchestrator.nodes["node0"]
+    assert node.memory.num_free() == NUM_REGISTERS - 2
+    second = apply_slot_table(orchestrator, "node0", encode_slot_table(4, 2, 2, [(1, "node1")], MAC_KEY), session)
+    assert all(r.cancelled for r in first) and not second[0].cancelled
+    attempts = node.stats["attempts"]
+    orchestrator.loop.run(until=orchestrator.slot_time(40))
+    assert node.stats["attempts"] - attempts <= 10 # only the new link, once per frame
+    assert node.memory.num_free() == NUM_REGISTERS - 1 and node.slot_requests == second
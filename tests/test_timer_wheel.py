@@ -0,0 +1,51 @@
+from des_kernel import Simulator
+from timer_wheel import TimerWheel, TICK, SLOTS
+
+class Clock:
+    def __init__(self):
+        self.now = 0.0
+
+    def __call__(self):
+        return self.now
+
+def make_wheel():
+    clock = Clock()
+    return TimerWheel(clock=clock), clock
+
+def test_timers_fire_at_their_tick_in_one_batch():
+    wheel, clock = make_wheel()
+    fired = []
+    for payload in range(3):
+        wheel.arm(5 * TICK, fired.append, payload)
+    wheel.arm(10 * TICK, fired.append, "late")
+    assert wheel.advance(4 * TICK) == 0 and fired == []
+    assert wheel.advance(5 * TICK) == 3
+    assert sorted(fired[0]) == [0, 1, 2] # one callback with every payload expiring in this advance
+    assert wheel.advance(10 * TICK) == 1 and fired[1] == ["late"]
+    assert len(wheel) == 0
+
+def test_cancel():
+    wheel, clock = make_wheel()
+    fired = []
+    timer = wheel.arm(3 * TICK, fired.append, "x")
+    assert wheel.cancel(timer) and not wheel.cancel(timer)
+    assert wheel.advance(10 * TICK) == 0 and fired == []
+
+def test_deadlines_on_higher_levels_cascade_down():
+    wheel, clock = make_wheel()
+    fired = []
+    deadlines = [SLOTS + 3, 3 * SLOTS * SLOTS + 17, SLOTS ** 3 * 2 + 5]
+    for ticks in deadlines:
+        wheel.arm(ticks * TICK, lambda payloads: fired.extend(payloads), ticks)
+    for ticks in deadlines:
+        assert wheel.advance((ticks - 1) * TICK) == 0
+        assert wheel.advance(ticks * TICK) == 1
+    assert fired == deadlines
+
+def test_attached_wheel_runs_on_virtual_time():
+    sim = Simulator(seed=1)
+    wheel = TimerWheel().attach(sim)
+    fired = []
+    wheel.arm(1.0, lambda payloads: fired.append((sim.now(), payloads)), "cutoff")
+    sim.run()
+    assert len(fired) == 1 and fired[0][1] == ["cutoff"] and abs(fired[0][0] - 1.0) <= TICK